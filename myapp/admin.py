@@ -1,6 +1,7 @@
 from django.contrib import admin
-from .models import CheckValve, Piping, Compressor, Receiver, SightGlass, SuctionAccumulator, OilSeparator, OilReceiver, OilSeparatorReceiver
+from .models import CheckValve, DutyPoint, Piping, Compressor, CompressorPolynomial, CompressorPressureLimit, Project, Receiver, SizingJob, SightGlass, SuctionAccumulator, OilSeparator, OilReceiver, OilSeparatorReceiver
 from django import forms
+from django.db import models
 
 
 class CompressorForm(forms.ModelForm):
@@ -13,12 +14,29 @@ class CompressorForm(forms.ModelForm):
             'refrigerants': forms.Textarea(attrs={'rows': 2}),
         }
 
+class CompressorPressureLimitInline(admin.TabularInline):
+    model = CompressorPressureLimit
+    fields = ('refrigerant', 'max_T_evap', 'max_T_cond')
+    readonly_fields = fields  # Derived from the pressure limits on save
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+class CompressorPolynomialInline(admin.StackedInline):
+    model = CompressorPolynomial
+    fields = (('refrigerant', 'frequency', 'superheat', 'subcooling'), 'capacity', 'power', 'mass_flow', 'current')
+    formfield_overrides = {models.JSONField: {'widget': forms.Textarea(attrs={'rows': 1, 'cols': 120})}}
+    extra = 0
+
 @admin.register(Compressor)
 class CompressorAdmin(admin.ModelAdmin):
     form = CompressorForm
     list_display = ('name', 'displacement_50Hz', 'displacement_60Hz', 'max_pressure_hp', 'max_pressure_lp')
     search_fields = ('name', 'refrigerants')
     list_filter = ('refrigerants',)  # Allows filtering by refrigerants if needed
+    inlines = [CompressorPolynomialInline, CompressorPressureLimitInline]
 
 @admin.register(Piping)
 class PipingAdmin(admin.ModelAdmin):
@@ -72,3 +90,30 @@ class OilReceiverAdmin(admin.ModelAdmin):
     search_fields = ('oil_receiver_model', 'manufacturer')
     list_filter = ('manufacturer',)
     ordering = ('oil_receiver_model',)
+
+class DutyPointInline(admin.TabularInline):
+    model = DutyPoint
+    fields = ('name', 'refrigerant', 'compressor', 'suction_pipe', 'discharge_pipe', 'needs_evaluation', 'evaluated', 'selection_changed')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+    show_change_link = True
+
+@admin.register(Project)
+class ProjectAdmin(admin.ModelAdmin):
+    list_display = ('name', 'created', 'updated')
+    search_fields = ('name',)
+    inlines = [DutyPointInline]
+
+@admin.register(DutyPoint)
+class DutyPointAdmin(admin.ModelAdmin):
+    list_display = ('project', 'name', 'refrigerant', 'compressor', 'suction_pipe', 'discharge_pipe', 'needs_evaluation', 'evaluated', 'selection_changed')
+    list_filter = ('needs_evaluation', 'refrigerant')
+    search_fields = ('project__name', 'name')
+    readonly_fields = ('results', 'previous_results', 'compressor', 'suction_pipe', 'discharge_pipe', 'suction_conn', 'discharge_conn', 'evaluated', 'selection_changed')
+
+@admin.register(SizingJob)
+class SizingJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'status', 'done_items', 'total_items', 'done_chunks', 'total_chunks', 'created', 'finished', 'expires')
+    list_filter = ('kind', 'status')
+    readonly_fields = ('kind', 'status', 'owner', 'params', 'total_chunks', 'done_chunks', 'total_items', 'done_items', 'error', 'created', 'started', 'finished', 'expires')
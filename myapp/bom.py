@@ -0,0 +1,98 @@
+"""Bill of materials rows for sized duties, written row by row to CSV or XLSX exports."""
+import csv
+
+from .lines import LINE_TYPES
+from .sizing import PIPE_LENGTH, get_pipe_table, get_sizing, size_check_valves
+
+BOM_COLUMNS = ['duty', 'refrigerant', 'q_capacity', 'tevap', 'tcond', 'component_type', 'id', 'description',
+               'quantity', 'unit', 'capacity_kw', 'velocity_m_s', 'pressure_drop_bar', 'kv']
+
+
+def bom_row(duty_label, duty, component_type, component_id='', description='', quantity='', unit='',
+            capacity='', velocity='', pressure_drop='', kv=''):
+    if duty is None:
+        duty_columns = ['', '', '', '']
+    else:
+        duty_columns = [duty['refrigerant'], duty['q_capacity'], duty['T_evap'], duty['T_cond']]
+    return [duty_label, *duty_columns, component_type, component_id, description, quantity, unit, capacity,
+            velocity, pressure_drop, kv]
+
+
+def _find(rows, component_id):
+    return next((row for row in rows if row['id'] == component_id), None)
+
+
+def duty_rows(number, duty, selected):
+    """Rows for the compressor, pipes and check valves of one duty.
+
+    Compressor and pipe ids in selected replace the computed best parts.
+    """
+    try:
+        sizing = get_sizing(duty)
+    except Exception as e:
+        yield bom_row(number, duty, 'error', description=f'Sizing failed: {e}')
+        return
+
+    compressor = sizing['compressor']
+    if selected.get('compressor') is not None:
+        compressor = _find(sizing['compressors'], selected['compressor']) or compressor
+    if compressor is None:
+        yield bom_row(number, duty, 'error', description='No suitable compressor found')
+        return
+    yield bom_row(number, duty, 'compressor', compressor['id'], compressor['name'],
+                  duty['compressors'] * duty['circuits'], 'pcs', capacity=compressor['q_compressor'])
+
+    for pipe_type in LINE_TYPES:
+        pipe = sizing[f'{pipe_type}_pipe']
+        if selected.get(f'{pipe_type}_pipe') is not None:
+            pipe = _find(get_pipe_table(duty, pipe_type), selected[f'{pipe_type}_pipe']) or pipe
+        if pipe is not None:
+            yield bom_row(number, duty, f'{pipe_type}_pipe', pipe['id'], pipe['name'],
+                          duty.get('pipe_length', PIPE_LENGTH) * duty['circuits'],
+                          'm', velocity=pipe['velocity'], pressure_drop=pipe['pressure_drop'])
+
+    if sizing['operating_state'] is None:
+        return
+    for line_type, check_valve in size_check_valves(sizing['operating_state']).items():
+        valve = check_valve['valve']
+        if valve is not None:
+            yield bom_row(number, duty, 'check_valve', valve['id'],
+                          f"{valve['name']} ({valve['model']}) - {valve['manufacturer']} - {line_type} line",
+                          check_valve['parallel_count'] * duty['circuits'], 'pcs', kv=valve['kv'])
+
+
+def bom_rows(duties, selected=None):
+    """Rows of every duty in order; duties are only sized as the rows are consumed."""
+    for number, duty in enumerate(duties, start=1):
+        yield from duty_rows(number, duty, selected or {})
+
+
+def component_row(component_type, component):
+    """Row for a catalog component selected on the part_list page."""
+    return bom_row('selected', None, component_type, component.pk, str(component), 1, 'pcs')
+
+
+class Echo:
+    """File-like object returning what is written, so csv.writer output can be streamed."""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(BOM_COLUMNS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def write_xlsx(rows, file):
+    """Write the rows to file with a write-only workbook, which keeps rows on disk instead of in memory."""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Bill of materials')
+    sheet.append(BOM_COLUMNS)
+    for row in rows:
+        sheet.append(row)
+    workbook.save(file)
@@ -0,0 +1,37 @@
+"""Catalog version stamp used to key every cache derived from catalog contents.
+
+The version lives in the database (CatalogVersion) rather than the cache, which culls entries
+and can't update one atomically across workers.
+"""
+import time
+
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+
+
+def catalog_version():
+    """Return the current catalog version, creating one if the database has none."""
+    from .models import CatalogVersion
+
+    version, _ = CatalogVersion.objects.get_or_create(pk=1, defaults={'version': time.time_ns()})
+    return version.version
+
+
+def bump_catalog_version():
+    """Invalidate every cached result derived from the catalog."""
+    from .models import CatalogVersion
+
+    # Always moves forward, even when another worker's clock is ahead
+    if not CatalogVersion.objects.filter(pk=1).update(version=Greatest(Value(time.time_ns()), F('version') + 1)):
+        catalog_version()
+
+
+def rebuild_catalog_caches():
+    """Refresh everything derived from the catalog.
+
+    Bulk operations skip model signals, so importers call this once when they finish.
+    """
+    from .models import CompressorPressureLimit
+
+    CompressorPressureLimit.refresh()
+    bump_catalog_version()
@@ -0,0 +1,269 @@
+"""Single-flight computation of cached sizing results and admission control of sizing work.
+
+Identical requests that miss the cache at the same time share one computation: threads of a
+process wait for the thread computing it, and other processes wait for the result to appear in
+the cache while a lock shows that it is being computed.
+
+Computations started by web requests first take one of SIZING_MAX_CONCURRENT slots. When every
+slot is taken, at most SIZING_QUEUE_LENGTH requests wait for one and any further request gets a
+fast 503 with Retry-After, so workers stay free for cached pages, the input page and the admin.
+
+Slots and locks are exclusive locks on files in SIZING_LOCK_DIR, not cache keys: the file based
+cache's add() isn't atomic across processes and its culling can evict live keys. The operating
+system releases the locks of a killed worker, so it can't leak them.
+"""
+import contextvars
+import hashlib
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import add_never_cache_headers
+
+from .timing import count, span
+
+FLIGHT_LOCK_TIMEOUT = 60  # s another process's computation is waited for before computing anyway
+FLIGHT_LOCK_STRIPES = 256  # Lock files the single-flight keys are hashed onto
+POLL_INTERVAL = 0.05  # s between cache checks while waiting
+
+_flights = {}  # key -> _Flight being computed by a thread of this process
+_flights_lock = threading.Lock()
+_stripes = threading.local()  # Flight lock stripes held by the thread's computations
+_admission = ContextVar('sizing_admission', default=False)
+_held = ContextVar('sizing_admission_slot', default=None)  # _Lock of the slot held by the running computation
+
+
+class Overloaded(Exception):
+    """Raised when a sizing computation isn't admitted; AdmissionMiddleware answers 503."""
+
+    def __init__(self, retry_after):
+        super().__init__('Too many sizing requests')
+        self.retry_after = retry_after  # s
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _Lock:
+    """An exclusive lock on a file of SIZING_LOCK_DIR, held until released or the process exits."""
+
+    def __init__(self, name):
+        self.name = name
+        self.fd = None
+
+    def acquire(self):
+        """Take the lock if it's free, without waiting; whether it was taken."""
+        directory = getattr(settings, 'SIZING_LOCK_DIR', os.path.join(settings.BASE_DIR, 'locks'))
+        os.makedirs(directory, exist_ok=True)
+        fd = os.open(os.path.join(directory, self.name), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        except OSError:
+            os.close(fd)
+            return False
+        self.fd = fd
+        return True
+
+    def release(self):
+        if self.fd is None:
+            return
+        if fcntl is None:
+            msvcrt.locking(self.fd, msvcrt.LK_UNLCK, 1)
+        os.close(self.fd)  # Closing the file releases a flock
+        self.fd = None
+
+
+def _lease_slot(prefix, slots):
+    """Take the first free one of the numbered slot locks; the lock, or None when all are taken."""
+    for index in range(slots):
+        lock = _Lock(f'{prefix}-{index}.lock')
+        if lock.acquire():
+            return lock
+    return None
+
+
+def _acquire():
+    """Lease a computation slot, waiting in the queue when all are taken; raises Overloaded."""
+    max_concurrent = getattr(settings, 'SIZING_MAX_CONCURRENT', 4)
+    queue_length = getattr(settings, 'SIZING_QUEUE_LENGTH', 4)
+    queue_timeout = getattr(settings, 'SIZING_QUEUE_TIMEOUT', 5)
+
+    slot = _lease_slot('admission-running', max_concurrent)
+    if slot is None:
+        place = _lease_slot('admission-queued', queue_length)
+        if place is None:
+            count('admission_rejected')
+            raise Overloaded(math.ceil(queue_timeout))
+        try:
+            with span('admission_wait'):
+                deadline = time.monotonic() + queue_timeout
+                while slot is None and time.monotonic() < deadline:
+                    time.sleep(POLL_INTERVAL)
+                    slot = _lease_slot('admission-running', max_concurrent)
+        finally:
+            place.release()
+        if slot is None:
+            count('admission_rejected')
+            raise Overloaded(math.ceil(queue_timeout))
+    return slot
+
+
+@contextmanager
+def admitted():
+    """Hold a computation slot for the block when running in a web request; raises Overloaded.
+
+    Blocks nested in one holding a slot share it.
+    """
+    if not _admission.get() or _held.get() is not None:
+        yield  # Workers and commands are bounded by their own process count
+        return
+
+    slot = _acquire()
+    token = _held.set(slot)
+    try:
+        yield
+    finally:
+        _held.reset(token)
+        slot.release()
+
+
+def _stream(rows, slot, context):
+    iterator = iter(rows)
+    try:
+        while True:
+            try:
+                row = context.run(next, iterator)
+            except StopIteration:
+                return
+            yield row
+    finally:
+        if slot is not None:
+            slot.release()
+
+
+def admitted_stream(rows):
+    """A generator of the rows, computed under one slot taken now; raises Overloaded.
+
+    A streamed response that has started can't become a 503 any more, so the slot is taken while
+    the view runs and held until the rows are consumed or the generator is closed.
+    """
+    slot = None
+    context = contextvars.copy_context()
+    if _admission.get() and _held.get() is None:
+        slot = _acquire()
+        context.run(_held.set, slot)
+    return _stream(rows, slot, context)
+
+
+def _stripe(key):
+    return int(hashlib.md5(key.encode()).hexdigest(), 16) % FLIGHT_LOCK_STRIPES
+
+
+def _compute_once(key, compute, timeout, admit):
+    """Compute and cache the value unless another process is already doing it."""
+    stripe = _stripe(key)
+    held = _stripes.__dict__.setdefault('held', set())
+    # A computation of this thread may hold the stripe already, e.g. a fluid resolved while sizing
+    lock = None if stripe in held else _Lock(f'flight-{stripe}.lock')
+    deadline = time.monotonic() + FLIGHT_LOCK_TIMEOUT
+    locked = lock is None or lock.acquire()
+    if not locked:
+        count('coalesced')
+        with span('coalesced_wait'):
+            while not locked and time.monotonic() < deadline:
+                time.sleep(POLL_INTERVAL)
+                result = cache.get(key)
+                if result is not None:
+                    return result
+                locked = lock.acquire()
+    if lock is not None:
+        held.add(stripe)
+    try:
+        # The other process may have finished between our cache miss and taking the lock
+        result = cache.get(key)
+        if result is None:
+            with admitted() if admit else nullcontext():
+                result = compute()
+            cache.set(key, result, timeout)
+        return result
+    finally:
+        if lock is not None:
+            held.discard(stripe)
+            lock.release()
+
+
+def single_flight(key, compute, timeout, admit=True):
+    """The cached value of key, calling compute() on a miss, at most once at a time per key.
+
+    The computation holds an admission slot unless admit is False.
+    """
+    result = cache.get(key)
+    if result is not None:
+        return result
+
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+
+    if not leader:
+        count('coalesced')
+        with span('coalesced_wait'):
+            flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    try:
+        flight.result = _compute_once(key, compute, timeout, admit)
+        return flight.result
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with _flights_lock:
+            del _flights[key]
+        flight.done.set()
+
+
+class AdmissionMiddleware:
+    """Subject sizing computations of web requests to admission control and answer 503 when overloaded."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _admission.set(True)
+        try:
+            return self.get_response(request)
+        finally:
+            _admission.reset(token)
+
+    def process_exception(self, request, exception):
+        if not isinstance(exception, Overloaded):
+            return None
+        response = HttpResponse('The server is busy sizing other duty points, please retry shortly.',
+                                content_type='text/plain', status=503)
+        response['Retry-After'] = exception.retry_after
+        add_never_cache_headers(response)
+        return response
@@ -0,0 +1,73 @@
+"""One duty sized for several refrigerants side by side.
+
+Each refrigerant is a separate cached sizing (sizing.get_sizing), so comparing the same duty
+again or opening one of its part_list pages reuses them. The sizings run in a bounded thread
+pool; every task runs in a copy of the request's context, so each one is traced and timed, and
+all of them share the one admission slot the comparison holds.
+"""
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connections
+
+from .coalesce import Overloaded, admitted
+from .fluids import check_supported
+from .sizing import get_sizing
+
+COMPARISON_REFRIGERANTS = ['R134a', 'R513A', 'R1234yf', 'R290', 'R744']  # Compared when none are chosen
+COMPARISON_MAX_REFRIGERANTS = 12
+COMPARISON_WORKERS = 4  # Sizings at once, under the request's single admission slot
+
+
+def _pipe_summary(pipe):
+    return pipe and {key: pipe[key] for key in ('id', 'name', 'outer_diameter', 'velocity', 'pressure_drop')}
+
+
+def compare_one(duty, refrigerant):
+    """The comparison row of one refrigerant; a failed sizing is reported in the row."""
+    row = {'refrigerant': refrigerant, 'label': None, 'compressor': None, 'suction_pipe': None,
+           'discharge_pipe': None, 'message': ''}
+    try:
+        fluid = check_supported(refrigerant)
+        row['label'] = fluid.label
+        sizing = get_sizing({**duty, 'refrigerant': refrigerant})
+    except Overloaded:
+        raise
+    except Exception as e:
+        row['message'] = f'Sizing failed: {e}'
+        return row
+
+    compressor = sizing['compressor']
+    if compressor is None:
+        row['message'] = 'No suitable compressor found'
+        return row
+    row['compressor'] = {key: compressor.get(key) for key in
+                         ('id', 'name', 'q_compressor', 'mass_flow_rate', 'T_discharge', 'power', 'cop',
+                          'coupled_q_compressor', 'undersized')}
+    row['suction_pipe'] = _pipe_summary(sizing['suction_pipe'])
+    row['discharge_pipe'] = _pipe_summary(sizing['discharge_pipe'])
+    return row
+
+
+def _run(context, duty, refrigerant):
+    try:
+        return context.run(compare_one, duty, refrigerant)
+    finally:
+        connections.close_all()  # The pool thread's own connections, the request's are closed by Django
+
+
+def compare(duty, refrigerants=None):
+    """Comparison rows of the duty for each refrigerant, in the given order."""
+    refrigerants = list(dict.fromkeys(refrigerants or COMPARISON_REFRIGERANTS))
+    if len(refrigerants) > COMPARISON_MAX_REFRIGERANTS:
+        raise ValueError(f'at most {COMPARISON_MAX_REFRIGERANTS} refrigerants can be compared')
+    with admitted(), ThreadPoolExecutor(max_workers=min(COMPARISON_WORKERS, len(refrigerants))) as pool:
+        # A context can only be entered by one thread at a time, so each task gets its own copy
+        futures = [pool.submit(_run, contextvars.copy_context(), duty, refrigerant)
+                   for refrigerant in refrigerants]
+        try:
+            return [future.result() for future in futures]
+        except BaseException:
+            for future in futures:
+                future.cancel()  # Don't start sizings whose rows won't be returned
+            raise
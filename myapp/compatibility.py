@@ -0,0 +1,195 @@
+"""Declarative compatibility rules that filter ancillary components by the operating state.
+
+Each rule compares one model field with one value from compatibility_inputs().
+Rules become SQL predicates where the database supports the lookup; the rest are
+evaluated in one NumPy pass over the rows the SQL filter let through.
+"""
+import operator
+
+import numpy as np
+from django.db import connection
+from django.db.models import Q
+
+from .models import Piping, refrigerants
+from .lines import standard_pipe_sizes
+
+
+class Rule:
+    """Component is compatible when ``getattr(component, field) <op> inputs[value]``."""
+
+    SQL_LOOKUPS = {'gte': 'gte', 'lte': 'lte', 'eq': 'exact', 'in': 'in'}
+    NUMPY_OPERATORS = {'gte': operator.ge, 'lte': operator.le, 'eq': operator.eq}
+
+    def __init__(self, field, op, value):
+        self.field = field
+        self.op = op
+        self.value = value
+
+    def applies(self, inputs):
+        """Rules whose input is unknown for this duty are skipped rather than failed."""
+        return inputs.get(self.value) not in (None, [])
+
+    def can_push_down(self):
+        if self.op == 'contains':
+            # JSON list containment is only available on some backends (not SQLite)
+            return connection.features.supports_json_field_contains
+        return True
+
+    def as_q(self, inputs):
+        if self.op == 'contains':
+            # The JSON list has to contain any one of the input values
+            q = Q()
+            for value in inputs[self.value]:
+                q |= Q(**{f'{self.field}__contains': value})
+            return q
+        return Q(**{f'{self.field}__{self.SQL_LOOKUPS[self.op]}': inputs[self.value]})
+
+    def evaluate(self, values, inputs):
+        """Boolean mask of the rule over a list of field values."""
+        value = inputs[self.value]
+        if self.op == 'contains':
+            value = set(value)
+            return np.fromiter((not value.isdisjoint(items or []) for items in values), dtype=bool, count=len(values))
+        if self.op == 'in':
+            return np.isin(np.asarray(values), value)
+        array = np.asarray(values, dtype=float if self.op != 'eq' else object)
+        return self.NUMPY_OPERATORS[self.op](array, value)
+
+    def __repr__(self):
+        return f'Rule({self.field!r}, {self.op!r}, {self.value!r})'
+
+
+# Compatibility rules and ranking (smallest adequate part first) per component type.
+# Pressures are in bar, temperatures in °C, volume flows in m³/h and connections in mm.
+COMPATIBILITY_RULES = {
+    'check_valve': {
+        'rules': [
+            Rule('checkvalve_pressure', 'gte', 'discharge_pressure'),
+            Rule('checkvalve_mintemperature', 'lte', 'T_discharge'),
+            Rule('checkvalve_maxtemperature', 'gte', 'T_discharge'),
+        ],
+        'rank_by': ['checkvalve_kv'],
+    },
+    'oil_separator': {
+        'rules': [
+            Rule('accumulator_pressure_max', 'gte', 'discharge_pressure'),
+            Rule('accumulator_temp_min', 'lte', 'T_discharge'),
+            Rule('accumulator_temp_max', 'gte', 'T_discharge'),
+            Rule('accumulator_discharge', 'gte', 'discharge_volume_flow'),
+            Rule('oil_separator_conn', 'in', 'discharge_connection_sizes'),
+            Rule('accumulator_refrigerants', 'contains', 'refrigerant_names'),
+        ],
+        'rank_by': ['accumulator_discharge'],
+    },
+    'oil_separator_receiver': {
+        'rules': [
+            Rule('oil_separator_receiver_pressure_max', 'gte', 'discharge_pressure'),
+            Rule('oil_separator_receiver_temp_min', 'lte', 'T_discharge'),
+            Rule('oil_separator_receiver_temp_max', 'gte', 'T_discharge'),
+            Rule('oil_separator_receiver_discharge', 'gte', 'discharge_volume_flow'),
+            Rule('oil_separator_receiver_conn', 'in', 'discharge_connection_sizes'),
+            Rule('oil_separator_receiver_refrigerants', 'contains', 'refrigerant_names'),
+        ],
+        'rank_by': ['oil_separator_receiver_discharge'],
+    },
+    'oil_receiver': {
+        'rules': [
+            Rule('oil_receiver_pressure_max', 'gte', 'discharge_pressure'),
+            Rule('oil_receiver_temp_min', 'lte', 'T_cond'),
+            Rule('oil_receiver_temp_max', 'gte', 'T_cond'),
+            Rule('oil_receiver_refrigerants', 'contains', 'refrigerant_names'),
+        ],
+        'rank_by': ['oil_receiver_volume'],
+    },
+    'receiver': {
+        'rules': [
+            Rule('receiver_maxpressure', 'gte', 'discharge_pressure'),
+            Rule('receiver_refrigerant', 'in', 'refrigerant_names'),
+        ],
+        'rank_by': ['receiver_volume'],
+    },
+    'suction_accumulator': {
+        'rules': [
+            Rule('accumulator_pressuremin', 'lte', 'suction_pressure'),
+            Rule('accumulator_pressuremax', 'gte', 'suction_pressure'),
+            Rule('accumulator_tempmin', 'lte', 'T_evap'),
+            Rule('accumulator_tempmax', 'gte', 'T_suction'),
+            Rule('accumulator_conn', 'in', 'suction_connection_sizes'),
+            Rule('accumulator_refrigerants', 'contains', 'refrigerant_names'),
+        ],
+        'rank_by': ['accumulator_conn'],
+    },
+    'sight_glass': {
+        'rules': [
+            Rule('sightglass_pressure', 'gte', 'discharge_pressure'),
+            Rule('sightglass_refrigerants', 'contains', 'refrigerant_names'),
+        ],
+        'rank_by': ['sightglass_conn'],
+    },
+}
+
+
+# The family name catalogs rate components for, per family of the refrigerants table. Blends, inorganics
+# and the other refrigerants share nothing a component could be rated for, so they only match by name.
+CATALOG_FAMILIES = {'HCFCs': 'HCFC', 'HFCs': 'HFC', 'HFOs': 'HFO', 'HCs': 'HC', 'CO2': 'CO2'}
+
+
+def refrigerant_names(refrigerant):
+    """The refrigerant and its family (e.g. 'HFC'), since catalogs list either."""
+    for family, members in refrigerants.items():
+        if refrigerant in members and family in CATALOG_FAMILIES:
+            return [refrigerant, CATALOG_FAMILIES[family]]
+    return [refrigerant]
+
+
+def compatibility_inputs(duty, state):
+    """Flatten the duty and its computed operating state into the values rules refer to."""
+    inputs = {
+        'refrigerant_names': refrigerant_names(duty['refrigerant']),
+        'T_evap': duty['T_evap'],
+        'T_cond': duty['T_cond'],
+        'T_suction': duty['T_evap'] + duty['superheat'],
+    }
+    if state is None:
+        return inputs
+
+    suction, discharge = state['suction'], state['discharge']
+    inputs.update({
+        'T_discharge': state['T_discharge'],
+        'suction_pressure': suction['pressure'] / 100000,  # bar
+        'discharge_pressure': discharge['pressure'] / 100000,  # bar
+        'discharge_volume_flow': state['mass_flow_rate'] / discharge['density'] * 3600,  # m³/h
+        'suction_connection_sizes': Piping.get_allowed_sizes(suction['connection'], standard_pipe_sizes),
+        'discharge_connection_sizes': Piping.get_allowed_sizes(discharge['connection'], standard_pipe_sizes),
+    })
+    return inputs
+
+
+def compatible_components(queryset, component_type, inputs):
+    """Filter and rank a catalog queryset by the rules of its component type.
+
+    Returns the filtered queryset when every applicable rule runs in SQL, and a
+    list in rank order otherwise.
+    """
+    spec = COMPATIBILITY_RULES.get(component_type)
+    if spec is None:
+        return queryset
+
+    rules = [rule for rule in spec['rules'] if rule.applies(inputs)]
+    sql_filter = Q()
+    python_rules = []
+    for rule in rules:
+        if rule.can_push_down():
+            sql_filter &= rule.as_q(inputs)
+        else:
+            python_rules.append(rule)
+
+    queryset = queryset.filter(sql_filter).order_by(*spec['rank_by'], 'pk')
+    if not python_rules:
+        return queryset
+
+    components = list(queryset)
+    mask = np.ones(len(components), dtype=bool)
+    for rule in python_rules:
+        mask &= rule.evaluate([getattr(component, rule.field) for component in components], inputs)
+    return [component for component, compatible in zip(components, mask) if compatible]
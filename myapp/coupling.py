@@ -0,0 +1,157 @@
+"""Suction line pressure drop coupled with the capacity of the selected compressor.
+
+The pressure drop of the suction line lowers the pressure at the compressor inlet and with it
+the saturation temperature the compressor effectively runs at. Its suction density, mass flow
+and capacity drop, and so does the pressure drop of the line. solve() iterates
+
+    mass flow -> line pressure drop -> effective saturation temperature -> mass flow
+
+to a fixed point for every suction pipe at once. The refrigerant properties come from a table
+over the saturation temperatures the drop can reach, built with a few PropsSI calls per duty,
+so iterations are array interpolations only. Each solve starts from the converged drops of a
+neighbouring duty of the same compressor when the cache has one.
+
+Selection (sizing.select_coupled) moves on from a compressor whose coupled capacity with its
+suction pipe falls short of the duty to the next closest ones.
+"""
+import numpy as np
+from django.core.cache import cache
+
+from .catalog import catalog_version
+from .fluids import PropsSI
+from .indexes import polynomial_index
+from .lines import flow, pipe_index
+from .timing import count, span
+from .trace import record
+from .transcritical import high_side_enthalpy, high_side_pressure
+
+COUPLING_MAX_DROP = 10  # K of saturation temperature the property tables cover
+COUPLING_TABLE_STEP = 0.5  # K
+COUPLING_TOLERANCE = 0.001  # K, change of the saturation temperature drop at convergence
+COUPLING_MAX_ITERATIONS = 50
+COUPLING_RELAXATION = 0.6  # Share of each update applied, the drop oscillates towards its fixed point
+COUPLING_CACHE_TIMEOUT = 60 * 60  # s
+WARM_START_BIN = 2  # K, duties whose evaporating and condensing temperatures share a bin are neighbours
+COUPLING_SHORTFALL = 0.05  # Share of the required capacity a compressor may lose to its suction line
+COUPLING_RESELECTIONS = 3  # Further compressors tried when the suction line leaves one short of the duty
+
+
+def property_table(duty):
+    """Saturation pressure (Pa), suction density (kg/m³) and enthalpy (kJ/kg) below the duty's T_evap.
+
+    The states are those of Compressor.calculate_cycle_state at each saturation temperature.
+    """
+    refrigerant = duty['refrigerant']
+    key = (f"coupling_table:{refrigerant}:{duty['T_evap']}:{duty['superheat']}:{duty['T_cond']}:"
+           f"{duty['subcooling']}")
+    table = cache.get(key)
+    if table is None:
+        temperatures = duty['T_evap'] - np.arange(COUPLING_MAX_DROP, -COUPLING_TABLE_STEP / 2, -COUPLING_TABLE_STEP)
+        pressure, density, enthalpy = np.empty((3, len(temperatures)))
+        for i, T in enumerate(temperatures):
+            T_superheat = T + duty['superheat'] + 273.15
+            pressure[i] = PropsSI('P', 'T', T + 273.15, 'Q', 1, refrigerant)
+            density[i] = PropsSI('D', 'T', T_superheat, 'P', pressure[i], refrigerant)
+            enthalpy[i] = PropsSI('H', 'T', T_superheat, 'Q', 1, refrigerant) / 1000
+        h_cond = high_side_enthalpy(refrigerant, duty['T_cond'], duty['subcooling'], high_side_pressure(
+            refrigerant, duty['T_cond'], duty['T_evap'], duty['superheat']))
+        table = {'temperature': temperatures, 'pressure': pressure, 'density': density,
+                 'cooling_effect': enthalpy - h_cond}
+        cache.set(key, table, COUPLING_CACHE_TIMEOUT)
+    return table
+
+
+def compressor_curve(duty, compressor, table):
+    """Mass flow (kg/s) and capacity (kW) of the compressor at each saturation temperature of the table."""
+    if compressor.get('power') is not None:
+        # Rated by AHRI 540 polynomials, evaluate them at every temperature
+        mass_flow_rate, capacity = np.empty((2, len(table['temperature'])))
+        for i, T in enumerate(table['temperature']):
+            performance = polynomial_index().evaluate(duty['refrigerant'], duty['frequency'], T, duty['T_cond'],
+                                                      duty['superheat'], duty['subcooling'])
+            row = np.flatnonzero(performance['ids'] == compressor['id'])[0]
+            mass_flow_rate[i] = performance['mass_flow_rate'][row]
+            capacity[i] = performance['capacity'][row]
+        return mass_flow_rate, capacity
+
+    # A fixed displacement moves mass in proportion to the suction density
+    scale = table['density'] / table['density'][-1]
+    mass_flow_rate = compressor['mass_flow_rate'] * scale
+    capacity = compressor['q_compressor'] * scale * table['cooling_effect'] / table['cooling_effect'][-1]
+    return mass_flow_rate, capacity
+
+
+def _warm_start_key(duty, compressor):
+    return (f"coupling:{catalog_version()}:{duty['refrigerant']}:{compressor['id']}:{duty['frequency']}:"
+            f"{duty['T_evap'] // WARM_START_BIN}:{duty['T_cond'] // WARM_START_BIN}")
+
+
+def solve(duty, compressor, state, pipe_length):
+    """Effective saturation temperature, mass flow and capacity with each suction pipe, or None.
+
+    Values are lists over the suction pipes of lines.pipe_index(); 'diagnostics' summarizes
+    the iteration.
+    """
+    index = pipe_index()
+    pipes = index.slices['suction']
+    line = state.get('suction')
+    if line is None or pipes.stop == pipes.start:
+        return None
+
+    with span('coupling'):
+        table = property_table(duty)
+        temperatures, pressures = table['temperature'], table['pressure']
+        mass_curve, capacity_curve = compressor_curve(duty, compressor, table)
+        diameter = index.inner_diameter[pipes]
+
+        key = _warm_start_key(duty, compressor)
+        previous = cache.get(key)
+        warm_start = previous is not None and len(previous['drop']) == len(diameter)
+        if warm_start:
+            # The drop of a neighbouring duty, scaled to this pipe length
+            drop = np.minimum(np.array(previous['drop']) * pipe_length / previous['pipe_length'], COUPLING_MAX_DROP)
+        else:
+            drop = np.zeros(len(diameter))
+
+        active = np.ones(len(diameter), dtype=bool)
+        residual = np.zeros(len(diameter))
+        iterations = np.zeros(len(diameter), dtype=int)
+        for iteration in range(1, COUPLING_MAX_ITERATIONS + 1):
+            mass_flow_rate = np.interp(duty['T_evap'] - drop[active], temperatures, mass_curve)
+            pressure_drop = flow(mass_flow_rate, line['density'], line['viscosity'], diameter[active],
+                                 pipe_length)['pressure_drop']
+            # Below the table the drop is clamped at COUPLING_MAX_DROP
+            inlet = np.interp(pressures[-1] - pressure_drop * 100000, pressures, temperatures)
+            step = (duty['T_evap'] - inlet) - drop[active]
+            drop[active] += COUPLING_RELAXATION * step
+            residual[active] = np.abs(step)
+            iterations[active] = iteration
+            active[active] = np.abs(step) >= COUPLING_TOLERANCE
+            if not active.any():
+                break
+
+        choked = drop >= COUPLING_MAX_DROP - COUPLING_TOLERANCE  # The compressor can't be fed through the pipe
+        converged = ~active & ~choked
+        T_evap = duty['T_evap'] - drop
+        diagnostics = {
+            'candidates': len(diameter),
+            'converged': int(converged.sum()),
+            'choked': int(choked.sum()),
+            'iterations': int(iterations.max()),
+            'mean_iterations': float(iterations.mean()),
+            'max_residual': float(residual[~choked].max()) if (~choked).any() else 0.0,  # K
+            'warm_start': warm_start,
+        }
+        count('coupling_iterations', int(iterations.sum()))
+        record('coupled_suction', compressor=compressor['id'], **diagnostics)
+
+        if diagnostics['converged']:
+            cache.set(key, {'pipe_length': pipe_length, 'drop': drop.tolist()}, COUPLING_CACHE_TIMEOUT)
+
+    return {
+        'T_evap': T_evap.tolist(),  # °C
+        'mass_flow_rate': np.interp(T_evap, temperatures, mass_curve).tolist(),  # kg/s
+        'q_compressor': np.interp(T_evap, temperatures, capacity_curve).tolist(),  # kW
+        'converged': converged.tolist(),
+        'diagnostics': diagnostics,
+    }
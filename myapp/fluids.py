@@ -0,0 +1,276 @@
+"""Registry resolving refrigerant names to validated CoolProp fluid identifiers.
+
+Catalog names don't always match CoolProp: some need another identifier
+(R1234ze is R1234ze(E)), some blends only exist as predefined mixtures
+(R407A.mix) and some are missing entirely. Each name is resolved by probing
+the property calls the sizing engine makes. Predefined mixtures whose binary
+interaction parameters CoolProp lacks (R448A) get them estimated by the
+linear mixing rule. The outcome is stored in the database (FluidResolution)
+until CoolProp or the probe changes and shared between processes through the
+cache. Probing a blend can take seconds, so nothing is probed at startup;
+`manage.py probe_fluids` resolves every catalog refrigerant ahead of time,
+else the first input form does.
+"""
+import functools
+import hashlib
+import json
+import math
+import re
+import time
+
+import CoolProp
+from django.core.cache import cache
+
+from . import timing
+from .coalesce import single_flight
+
+# Evaporating and condensing temperatures (°C) a fluid has to handle to be offered
+PROBE_EVAPORATING = [-20, -5, 5]
+PROBE_CONDENSING = [40]
+PROBE_TIMEOUT = 24 * 60 * 60  # s a resolved fluid is shared through the cache
+PROBE_VERSION = 3  # Bump when probe() changes, so registries resolved by older code aren't used
+TRANSCRITICAL_APPROACH = 1  # K below the critical temperature from which the high side is a gas cooler
+PROBE_GAS_COOLER_PRESSURE = 1.3  # × critical pressure probed for transcritical condensing temperatures
+MIXING_RULE = 'linear'  # CoolProp's estimate of binary interaction parameters it has no data for
+MAX_ESTIMATED_PAIRS = 6  # Binary pairs of a mixture estimated at most before giving up on it
+RESOLUTION_FIELDS = ('identifier', 'cost', 'probe_ms', 'reason', 'binary_pairs')
+
+# CoolProp names of catalog refrigerants that differ from the catalog name
+ALIASES = {
+    'R1234ze': ['R1234ze(E)'],
+    'R1233zd': ['R1233zd(E)'],
+    'R1336mzz': ['R1336mzz(E)', 'R1336mzz(Z)'],
+}
+
+_registry = {}  # name -> Fluid resolved by this process
+_mixed = set()  # Binary pairs estimated in this process
+_missing_pair = re.compile(r'Could not match the binary pair \[([^,\]]+),([^\]]+)\]')
+
+
+class Fluid:
+    """A refrigerant name with the CoolProp identifier the engine uses for it."""
+
+    def __init__(self, name, family, label, identifier=None, cost=None, probe_ms=None, reason='', binary_pairs=()):
+        self.name = name
+        self.family = family
+        self.label = label
+        self.identifier = identifier  # e.g. 'HEOS::R407C.mix', None when unsupported
+        self.cost = cost  # 'pure' (pure and pseudo-pure fluids) or 'mixture' (an order of magnitude slower)
+        self.probe_ms = probe_ms
+        self.reason = reason  # Why the fluid is unsupported
+        self.binary_pairs = [list(pair) for pair in binary_pairs]  # CAS pairs estimated with MIXING_RULE
+
+    @property
+    def supported(self):
+        return self.identifier is not None
+
+    def __repr__(self):
+        return f'Fluid({self.name!r}, {self.identifier or self.reason!r})'
+
+
+@functools.cache
+def _load_binary_pairs():
+    # CoolProp loads its interaction parameters on their first lookup, unless a pair was added before
+    CoolProp.CoolProp.get_mixture_binary_pair_data('354-33-6', '75-10-5', 'F')  # R125 and R32
+
+
+def mix(binary_pairs):
+    """Estimate the interaction parameters of binary pairs with MIXING_RULE, once per process."""
+    _load_binary_pairs()
+    for pair in map(tuple, binary_pairs):
+        if pair in _mixed:
+            continue
+        try:
+            CoolProp.CoolProp.apply_simple_mixing_rule(*pair, MIXING_RULE)
+        except RuntimeError:
+            pass  # Already in CoolProp's interaction map
+        _mixed.add(pair)
+
+
+def probe(identifier):
+    """Evaluate the states sizing needs, raising when CoolProp can't."""
+    for T_evap in PROBE_EVAPORATING:
+        T = T_evap + 273.15
+        pressure = CoolProp.CoolProp.PropsSI('P', 'T', T, 'Q', 1, identifier)
+        # Superheated suction, out of the glide of zeotropic blends
+        CoolProp.CoolProp.PropsSI('D', 'T', T + 5, 'P', pressure, identifier)
+        CoolProp.CoolProp.PropsSI('H', 'T', T + 5, 'Q', 1, identifier)
+        CoolProp.CoolProp.PropsSI('Cpmass', 'T', T + 5, 'Q', 1, identifier)
+        # Suction line pressure drop state (sizing.operating_state)
+        CoolProp.CoolProp.PropsSI('viscosity', 'T', T + 5, 'P', pressure * 1.01, identifier)
+    try:
+        T_crit = CoolProp.CoolProp.PropsSI('Tcrit', identifier)
+    except ValueError:
+        T_crit = math.inf  # Mixtures with several critical points are only sized subcritical
+    for T_cond in PROBE_CONDENSING:
+        T = T_cond + 273.15
+        if T >= T_crit - TRANSCRITICAL_APPROACH:
+            # Gas cooler outlet and isentropic discharge states of the transcritical cycle (myapp.transcritical)
+            pressure = PROBE_GAS_COOLER_PRESSURE * CoolProp.CoolProp.PropsSI('Pcrit', identifier)
+            CoolProp.CoolProp.PropsSI('H', 'P', pressure, 'T', T, identifier)
+            entropy = CoolProp.CoolProp.PropsSI('S', 'T', PROBE_EVAPORATING[-1] + 5 + 273.15, 'Q', 1, identifier)
+            CoolProp.CoolProp.PropsSI('H', 'P', pressure, 'S', entropy, identifier)
+        else:
+            pressure = CoolProp.CoolProp.PropsSI('P', 'T', T, 'Q', 0, identifier)
+            CoolProp.CoolProp.PropsSI('D', 'T', T, 'Q', 0, identifier)
+        CoolProp.CoolProp.PropsSI('viscosity', 'T', T + 30, 'P', pressure, identifier)
+
+
+def known_pure(name):
+    try:
+        CoolProp.CoolProp.get_fluid_param_string(name, 'CAS')
+        return True
+    except (RuntimeError, ValueError):
+        return False
+
+
+def candidates(name):
+    """CoolProp identifiers CoolProp knows for a name, cheapest backend first."""
+    result = [(f'HEOS::{alias}', 'pure') for alias in ALIASES.get(name, [name]) if known_pure(alias)]
+    mixtures = CoolProp.CoolProp.get_global_param_string('predefined_mixtures').split(',')
+    if f'{name}.mix' in mixtures:
+        result.append((f'HEOS::{name}.mix', 'mixture'))
+    return result
+
+
+def probe_mixture(identifier):
+    """probe() a predefined mixture, estimating binary pairs CoolProp lacks; the estimated pairs it needs.
+
+    The pairs are all those of its components estimated in this process, some may have been for another mixture.
+    """
+    for estimated in range(MAX_ESTIMATED_PAIRS + 1):
+        try:
+            probe(identifier)
+            break
+        except ValueError as e:
+            missing = _missing_pair.search(str(e))
+            if missing is None or estimated == MAX_ESTIMATED_PAIRS:
+                raise
+            mix([missing.groups()])
+    backend, name = identifier.split('::')
+    components = {CoolProp.CoolProp.get_fluid_param_string(component, 'CAS')
+                  for component in CoolProp.AbstractState(backend, name).fluid_names()}
+    return [list(pair) for pair in sorted(_mixed) if set(pair) <= components]
+
+
+def resolve(name, family, label):
+    """The fastest candidate that passes the probe, or an unsupported Fluid with the reason."""
+    reason = 'not known to CoolProp'
+    best = None
+    for identifier, cost in candidates(name):
+        start = time.perf_counter()
+        try:
+            binary_pairs = probe_mixture(identifier) if cost == 'mixture' else probe(identifier)
+        except Exception as e:
+            reason = f"{identifier.split('::')[1]} fails at sizing conditions: {str(e).split(' : ')[0]}"
+            continue
+        probe_ms = (time.perf_counter() - start) * 1000
+        if best is None or probe_ms < best.probe_ms:
+            best = Fluid(name, family, label, identifier, cost, round(probe_ms, 2), binary_pairs=binary_pairs or ())
+        if cost == 'pure':
+            break  # Mixtures are never faster than a working pure or pseudo-pure fluid
+    return best or Fluid(name, family, label, reason=reason)
+
+
+@functools.cache
+def catalog():
+    """(family, label) of every catalog refrigerant by name."""
+    from .models import refrigerants
+
+    return {name: (family.rstrip('s'), label) for family, members in refrigerants.items()
+            for name, label in members.items()}
+
+
+def _version(name):
+    digest = hashlib.sha1(json.dumps([PROBE_EVAPORATING, PROBE_CONDENSING, ALIASES.get(name), PROBE_VERSION])
+                          .encode()).hexdigest()
+    return f'{CoolProp.__version__}:{digest}'
+
+
+def _key(name):
+    return f'fluids:{_version(name)}:{name}'
+
+
+def _fluid(name, fields):
+    family, label = catalog()[name]
+    mix(fields['binary_pairs'])
+    _registry[name] = Fluid(name, family, label, **{**fields, 'identifier': fields['identifier'] or None,
+                                                    'cost': fields['cost'] or None})
+    return _registry[name]
+
+
+def _resolution(name):
+    """The stored resolution of a name, probing and storing it when there's none."""
+    from .models import FluidResolution
+
+    fields = FluidResolution.objects.filter(name=name, version=_version(name)).values(*RESOLUTION_FIELDS).first()
+    if fields is None:
+        fluid = resolve(name, *catalog()[name])
+        fields = {key: getattr(fluid, key) for key in RESOLUTION_FIELDS}
+        FluidResolution.objects.update_or_create(name=name, version=_version(name), defaults={
+            **fields, 'identifier': fluid.identifier or '', 'cost': fluid.cost or ''})
+    return fields
+
+
+def get(name):
+    """The Fluid of a catalog refrigerant, probed on first use; None for other names.
+
+    One process probes a name at a time, the others wait for its result in the cache.
+    """
+    fluid = _registry.get(name)
+    if fluid is None and name in catalog():
+        # Probing isn't sizing work, it doesn't take an admission slot of the request
+        fluid = _fluid(name, single_flight(_key(name), lambda: _resolution(name), PROBE_TIMEOUT, admit=False))
+    return fluid
+
+
+def registry():
+    """All catalog fluids by name, probing the ones never resolved with this CoolProp version."""
+    from .models import FluidResolution
+
+    # One query for the stored resolutions rather than one per name
+    stored = FluidResolution.objects.filter(name__in=[name for name in catalog() if name not in _registry])
+    for fields in stored.values('name', 'version', *RESOLUTION_FIELDS):
+        name, version = fields.pop('name'), fields.pop('version')
+        if version == _version(name):
+            _fluid(name, fields)
+    return {name: get(name) for name in catalog()}
+
+
+def forget():
+    """Drop every resolved fluid, so the next use probes it again."""
+    from .models import FluidResolution
+
+    cache.delete_many([_key(name) for name in catalog()])
+    FluidResolution.objects.filter(name__in=list(catalog())).delete()
+    _registry.clear()
+
+
+def check_supported(name):
+    """Raise ValueError unless the refrigerant can be sized."""
+    fluid = get(name)
+    if fluid is None:
+        raise ValueError(f'unknown refrigerant {name}')
+    if not fluid.supported:
+        raise ValueError(f'refrigerant {name} is not supported ({fluid.reason})')
+    return fluid
+
+
+def supported_by_family():
+    """[(family, [Fluid, ...]), ...] of the fluids that pass the probe, for the input form."""
+    families = {}
+    for fluid in registry().values():
+        if fluid.supported:
+            families.setdefault(fluid.family, []).append(fluid)
+    return list(families.items())
+
+
+def identifier(name):
+    """The CoolProp identifier of a refrigerant name; other fluid strings pass through unchanged."""
+    fluid = get(name)
+    return fluid.identifier if fluid is not None and fluid.supported else name
+
+
+def PropsSI(*args):
+    """timing.PropsSI taking registry names as the fluid (always the last argument)."""
+    return timing.PropsSI(*args[:-1], identifier(args[-1]))
@@ -0,0 +1,217 @@
+"""Sizing as a graph of memoized nodes, kept per user.
+
+Each node depends on some duty inputs and on upstream nodes. A node is only
+recomputed when one of its inputs changed or an upstream node produced a
+different value, so editing e.g. the pipe length reuses the saturation states,
+the cycle and the compressor selection of the previous request.
+"""
+import hashlib
+import json
+import re
+import uuid
+
+from django.core.cache import cache
+from django.utils.cache import patch_cache_control
+
+from .catalog import catalog_version
+from .lines import LINE_TYPES, line_table
+from .sizing import (PIPE_LENGTH, RESULT_VERSION, SIZING_CACHE_TIMEOUT, best_compressor, compressor_capacities,
+                     couple_suction, cycle_state, operating_state, pressure_rated_compressors, saturation_pressure,
+                     select_coupled)
+from .transcritical import high_side_pressure
+from .timing import count, span
+from .trace import record
+
+GRAPH_COOKIE = 'sizing_graph'
+GRAPH_ID = re.compile(r'[0-9a-f]{32}')
+
+
+def fingerprint(value):
+    return hashlib.sha1(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class Node:
+    def __init__(self, inputs, upstream, compute, catalog=False):
+        self.inputs = inputs  # Duty keys the node reads
+        self.upstream = upstream  # Nodes the node reads
+        self.compute = compute  # compute(duty, upstream values) -> value
+        self.catalog = catalog  # Recompute when the catalog changes
+
+
+def _pipe_length(duty):
+    return duty.get('pipe_length', PIPE_LENGTH)
+
+
+def _coupling(duty, upstream):
+    return couple_suction(duty, upstream['compressor'], upstream['lines'])
+
+
+def _selection(duty, upstream):
+    if upstream['lines'] is None:
+        return None
+    return select_coupled(duty, upstream['cycle'], set(upstream['rated']), upstream['compressor'], upstream['lines'],
+                          upstream['coupling'])
+
+
+def _pipe_table(pipe_type):
+    def compute(duty, upstream):
+        selection = upstream['selection']
+        if selection is None:
+            return []
+        coupling = selection['coupling'] if pipe_type == 'suction' else None
+        return line_table(selection['operating_state'], pipe_type, _pipe_length(duty), coupling)
+    return compute
+
+
+def _saturation(temperature, quality):
+    def compute(duty, upstream):
+        try:
+            return saturation_pressure(duty['refrigerant'], duty[temperature], quality)
+        except Exception as e:
+            record('saturation_pressure_error', temperature=duty[temperature], error=str(e))
+            return None  # cycle_state recomputes it and reports the failure
+    return compute
+
+
+def _high_side(duty, upstream):
+    try:
+        return high_side_pressure(duty['refrigerant'], duty['T_cond'], duty['T_evap'], duty['superheat'])
+    except Exception as e:
+        record('high_side_pressure_error', T_cond=duty['T_cond'], error=str(e))
+        return None  # cycle_state recomputes it and reports the failure
+
+
+def _cycle(duty, upstream):
+    try:
+        return cycle_state(duty, upstream['evaporating'], upstream['condensing'])
+    except Exception as e:
+        record('cycle_state_error', error=str(e))
+        return None
+
+
+def _rated(duty, upstream):
+    return sorted(pressure_rated_compressors(duty))
+
+
+def _capacities(duty, upstream):
+    if upstream['cycle'] is None:
+        return []
+    return compressor_capacities(duty, upstream['cycle'], set(upstream['rated']))
+
+
+def _compressor(duty, upstream):
+    if upstream['cycle'] is None:
+        return None
+    return best_compressor(duty, upstream['cycle'], set(upstream['rated']))
+
+
+def _lines(duty, upstream):
+    if upstream['compressor'] is None:
+        return None
+    return operating_state(duty, upstream['compressor'], upstream['evaporating'], upstream['condensing'])
+
+
+NODES = {
+    'evaporating': Node(['refrigerant', 'T_evap'], [], _saturation('T_evap', 1)),
+    # The bubble point, or the optimal gas cooler pressure of a transcritical duty (myapp.transcritical)
+    'condensing': Node(['refrigerant', 'T_cond', 'T_evap', 'superheat'], [], _high_side),
+    'cycle': Node(['refrigerant', 'T_evap', 'T_cond', 'subcooling', 'superheat'], ['evaporating', 'condensing'],
+                  _cycle),
+    # Transcritical duties also compare the gas cooler pressure, which depends on the superheat
+    'rated': Node(['refrigerant', 'T_evap', 'T_cond', 'superheat'], [], _rated, catalog=True),
+    'capacities': Node(['refrigerant', 'frequency'], ['cycle', 'rated'], _capacities, catalog=True),
+    'compressor': Node(['refrigerant', 'T_evap', 'T_cond', 'q_capacity', 'circuits', 'frequency'], ['cycle', 'rated'],
+                       _compressor, catalog=True),
+    'lines': Node(['refrigerant', 'T_evap', 'T_cond', 'subcooling', 'superheat', 'frequency'],
+                  ['compressor', 'evaporating', 'condensing'], _lines),
+    # The suction pipes' fixed points of pressure drop and compressor capacity (myapp.coupling)
+    'coupling': Node(['refrigerant', 'T_evap', 'T_cond', 'subcooling', 'superheat', 'frequency', 'pipe_length',
+                      'coupled'], ['compressor', 'lines'], _coupling, catalog=True),
+    # Every line type is sized in one batched evaluation of the pipe catalog (myapp.lines), for the
+    # nominal compressor or the next closest ones when its suction line leaves it short (sizing.select_coupled)
+    'selection': Node(['refrigerant', 'T_evap', 'T_cond', 'subcooling', 'superheat', 'q_capacity', 'circuits',
+                       'frequency', 'pipe_length', 'coupled'], ['cycle', 'rated', 'compressor', 'lines', 'coupling'],
+                      _selection, catalog=True),
+    **{f'{line_type}_pipe_table': Node(['pipe_length'], ['selection'], _pipe_table(line_type), catalog=True)
+       for line_type in LINE_TYPES},
+}
+
+SIZING_NODES = ['capacities', 'compressor', 'selection']
+
+
+class SizingGraph:
+    """Memoized node values of one user's last evaluations."""
+
+    def __init__(self):
+        self.memo = {}  # node name -> (key, value fingerprint, value)
+        self.recomputed = []  # Nodes recomputed by the last evaluate()
+
+    def evaluate(self, duty, names):
+        """Values of the named nodes for the duty, recomputing only nodes whose key changed."""
+        version = catalog_version()
+        fingerprints = {}
+        self.recomputed = []
+
+        def resolve(name):
+            if name in fingerprints:
+                return
+            node = NODES[name]
+            for upstream in node.upstream:
+                resolve(upstream)
+            key = fingerprint([[duty.get(field) for field in node.inputs],
+                               [fingerprints[upstream] for upstream in node.upstream],
+                               version if node.catalog else None, RESULT_VERSION])
+            memo = self.memo.get(name)
+            if memo is None or memo[0] != key:
+                with span(name):
+                    value = node.compute(duty, {upstream: self.memo[upstream][2] for upstream in node.upstream})
+                self.memo[name] = (key, fingerprint(value), value)
+                self.recomputed.append(name)
+            fingerprints[name] = self.memo[name][1]
+
+        for name in names:
+            resolve(name)
+        count('graph_recomputed', len(self.recomputed))
+        return {name: self.memo[name][2] for name in names}
+
+    def sizing(self, duty):
+        """The same result as sizing.size_duty."""
+        values = self.evaluate(duty, SIZING_NODES)
+        selection = values['selection']
+        if selection is None:
+            return {'compressors': values['capacities'], 'compressor': values['compressor'], 'operating_state': None,
+                    'coupling': None, 'passed_over': [], **{f'{line_type}_pipe': None for line_type in LINE_TYPES}}
+        return {
+            'compressors': values['capacities'],
+            'compressor': selection['compressor'],
+            'operating_state': selection['operating_state'],
+            'coupling': selection['coupling'] and selection['coupling']['diagnostics'],
+            'passed_over': selection['passed_over'],
+            **{f'{line_type}_pipe': pipe for line_type, pipe in selection['pipes'].items()},
+        }
+
+    def pipe_table(self, duty, pipe_type):
+        return self.evaluate(duty, [f'{pipe_type}_pipe_table'])[f'{pipe_type}_pipe_table']
+
+
+def request_graph(request):
+    """The SizingGraph of the request's graph cookie and its id; a new id when the cookie is missing.
+
+    The id lives in its own cookie rather than the session, so sizing responses don't vary on the session.
+    """
+    graph_id = request.COOKIES.get(GRAPH_COOKIE, '')
+    if not GRAPH_ID.fullmatch(graph_id):
+        graph_id = uuid.uuid4().hex
+    graph = cache.get(f'graph:{graph_id}') or SizingGraph()
+    graph.recomputed = []  # Nothing recomputed yet in this request
+    return graph_id, graph
+
+
+def save_request_graph(request, response, graph_id, graph):
+    """Keep the graph for the user's next edit and set the graph cookie if it is new."""
+    if graph.recomputed:
+        cache.set(f'graph:{graph_id}', graph, SIZING_CACHE_TIMEOUT)
+    if request.COOKIES.get(GRAPH_COOKIE) != graph_id:
+        response.set_cookie(GRAPH_COOKIE, graph_id, max_age=SIZING_CACHE_TIMEOUT, httponly=True, samesite='Lax')
+        # Shared caches must not hand this user's cookie to others
+        patch_cache_control(response, private=True)
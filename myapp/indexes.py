@@ -0,0 +1,191 @@
+"""In-process sorted indexes over catalog tables, rebuilt when the catalog version changes.
+
+Each worker process builds an index on first use and keeps it until a catalog
+save, delete or import bumps the version, so lookups never touch the database.
+"""
+import bisect
+import functools
+import threading
+from collections import defaultdict
+
+import numpy as np
+
+from .catalog import catalog_version
+from .models import CheckValve, Compressor, CompressorPolynomial
+
+_indexes = {}
+_lock = threading.Lock()
+
+
+def catalog_index(name, build):
+    """The index built by build(), rebuilt once per catalog version."""
+    version = catalog_version()
+    entry = _indexes.get(name)
+    if entry is None or entry[0] != version:
+        with _lock:
+            entry = _indexes.get(name)
+            if entry is None or entry[0] != version:
+                entry = (version, build())
+                _indexes[name] = entry
+    return entry[1]
+
+
+class CheckValveIndex:
+    """Check valves grouped by pressure rating, each pressure class sorted by Kv."""
+
+    def __init__(self, valves):
+        classes = defaultdict(list)
+        for valve in valves:
+            classes[valve.checkvalve_pressure].append(valve)
+
+        self.pressures = sorted(classes)
+        self.classes = {}
+        for pressure, members in classes.items():
+            members.sort(key=lambda valve: (valve.checkvalve_kv, valve.pk))
+            self.classes[pressure] = ([valve.checkvalve_kv for valve in members], members)
+
+    def smallest_adequate(self, kv, pressure, temperature):
+        """The valve with the smallest Kv >= kv rated for the pressure (bar) and temperature (°C)."""
+        best = None
+        for rating in self.pressures[bisect.bisect_left(self.pressures, pressure):]:
+            kvs, valves = self.classes[rating]
+            for valve in valves[bisect.bisect_left(kvs, kv):]:
+                if best is not None and valve.checkvalve_kv >= best.checkvalve_kv:
+                    break  # Nothing smaller left in this pressure class
+                if valve.checkvalve_mintemperature <= temperature <= valve.checkvalve_maxtemperature:
+                    best = valve
+                    break
+        return best
+
+
+def check_valve_index():
+    return catalog_index('check_valves', lambda: CheckValveIndex(CheckValve.objects.all()))
+
+
+class CompressorIndex:
+    """Compressors sorted by displacement, for bisecting to the swept volume a duty needs."""
+
+    MAX_FREQUENCIES = 64  # Sort orders kept per index
+
+    def __init__(self, compressors):
+        self.compressors = list(compressors)
+        self.by_id = {compressor.id: compressor for compressor in self.compressors}
+        self.displacement_50Hz = np.array([compressor.displacement_50Hz for compressor in self.compressors], dtype=float)
+        self.displacement_60Hz = np.array([compressor.displacement_60Hz for compressor in self.compressors], dtype=float)
+        self._by_frequency = {}
+
+    def displacements(self, frequency):
+        """Displacements (m³/h) at the frequency in catalog order, their ascending order and the sorted values."""
+        entry = self._by_frequency.get(frequency)
+        if entry is None:
+            # Compressor.calculate_displacement for every compressor at once
+            displacement = self.displacement_50Hz + (frequency - 50) * (self.displacement_60Hz - self.displacement_50Hz) / (60 - 50)
+            order = np.argsort(displacement, kind='stable')
+            entry = (displacement, order, displacement[order])
+            if len(self._by_frequency) >= self.MAX_FREQUENCIES:
+                self._by_frequency.clear()
+            self._by_frequency[frequency] = entry
+        return entry
+
+    def nearest(self, displacement, frequency):
+        """Yield compressors in order of increasing distance from the displacement (m³/h)."""
+        _, order, sorted_displacement = self.displacements(frequency)
+        above = int(np.searchsorted(sorted_displacement, displacement))
+        below = above - 1
+        while below >= 0 or above < len(order):
+            if above >= len(order) or (below >= 0 and displacement - sorted_displacement[below]
+                                       <= sorted_displacement[above] - displacement):
+                yield self.compressors[order[below]]
+                below -= 1
+            else:
+                yield self.compressors[order[above]]
+                above += 1
+
+
+def compressor_index():
+    return catalog_index('compressors', lambda: CompressorIndex(Compressor.objects.order_by('pk')))
+
+
+@functools.lru_cache(maxsize=4096)
+def rating_correction(refrigerant, T_evap, T_cond, superheat, subcooling, rated_superheat, rated_subcooling):
+    """Factors of mass flow and capacity from the coefficients' rating superheat and subcooling to a duty's.
+
+    The rated mass flow scales with the suction density, and the capacity is that mass flow times
+    the evaporator enthalpy difference at the duty's states (the cycle states of the displacement
+    estimate). The power is scaled with the mass flow.
+    """
+    if (superheat, subcooling) == (rated_superheat, rated_subcooling):
+        return 1.0, 1.0
+    duty = Compressor.calculate_cycle_state(refrigerant, T_evap, T_cond, subcooling, superheat)
+    rated = Compressor.calculate_cycle_state(refrigerant, T_evap, T_cond, rated_subcooling, rated_superheat)
+    mass_flow = duty['density_suction'] / rated['density_suction']
+    return mass_flow, mass_flow * (duty['h_evap'] - duty['h_cond']) / (rated['h_evap'] - rated['h_cond'])
+
+
+class PolynomialIndex:
+    """AHRI 540 coefficients stacked per refrigerant and frequency, evaluated for the whole catalog at once."""
+
+    def __init__(self, polynomials):
+        groups = defaultdict(list)
+        for polynomial in polynomials:
+            groups[(polynomial.refrigerant, float(polynomial.frequency))].append(polynomial)
+
+        # (refrigerant, frequency) -> (compressor ids, {property: coefficient matrix with a row per compressor},
+        # rating superheat and subcooling (K) with a row per compressor)
+        self.groups = {}
+        for key, members in groups.items():
+            self.groups[key] = (
+                np.array([polynomial.compressor_id for polynomial in members]),
+                {name: np.array([getattr(polynomial, name) for polynomial in members], dtype=float)
+                 for name in ('capacity', 'power', 'mass_flow')},
+                np.array([(polynomial.superheat, polynomial.subcooling) for polynomial in members], dtype=float),
+            )
+
+    def evaluate(self, refrigerant, frequency, T_evap, T_cond, superheat=None, subcooling=None):
+        """Compressor ids with their capacity (kW), power (kW), COP and mass flow (kg/s), or None without coefficients.
+
+        With the duty's superheat and subcooling (K) the catalog values are corrected from each
+        compressor's rating conditions to them (rating_correction).
+        """
+        entry = self.groups.get((refrigerant, float(frequency)))
+        if entry is None:
+            return None
+        ids, coefficients, ratings = entry
+        terms = CompressorPolynomial.terms(T_evap, T_cond)
+        capacity = coefficients['capacity'] @ terms / 1000
+        power = coefficients['power'] @ terms / 1000
+        mass_flow_rate = coefficients['mass_flow'] @ terms / 3600
+        if superheat is not None:
+            mass_factor, capacity_factor = np.ones((2, len(ids)))
+            for rating in np.unique(ratings, axis=0):
+                rows = (ratings == rating).all(axis=1)
+                mass_factor[rows], capacity_factor[rows] = rating_correction(
+                    refrigerant, T_evap, T_cond, superheat, subcooling, *map(float, rating))
+            capacity = capacity * capacity_factor
+            power = power * mass_factor
+            mass_flow_rate = mass_flow_rate * mass_factor
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cop = np.where(power > 0, capacity / power, np.nan)
+        return {
+            'ids': ids,
+            'capacity': capacity,
+            'power': power,
+            'cop': cop,
+            'mass_flow_rate': mass_flow_rate,
+        }
+
+    def nearest(self, refrigerant, compressor_id, frequency):
+        """(frequency, {property: coefficients}, (superheat, subcooling)) of the compressor rated closest to it."""
+        best = None
+        for (group_refrigerant, group_frequency), (ids, coefficients, ratings) in self.groups.items():
+            rows = np.flatnonzero(ids == compressor_id)
+            if group_refrigerant != refrigerant or not len(rows):
+                continue
+            if best is None or abs(group_frequency - frequency) < abs(best[0] - frequency):
+                best = (group_frequency, {name: matrix[rows[0]] for name, matrix in coefficients.items()},
+                        tuple(map(float, ratings[rows[0]])))
+        return best
+
+
+def polynomial_index():
+    return catalog_index('polynomials', lambda: PolynomialIndex(CompressorPolynomial.objects.all()))
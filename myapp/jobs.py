@@ -0,0 +1,250 @@
+"""Background sizing jobs stored in the database and processed by run_sizing_workers.
+
+A job's items are split into chunks. Workers claim a chunk with a conditional
+UPDATE, so several worker processes can share one SQLite database without a
+broker. A claim is a lease: a chunk whose worker died is claimed again once the
+lease expires, and a chunk that keeps failing fails its job.
+
+Jobs submitted over HTTP belong to the submitting session and are charged to the
+client's hourly item budget.
+"""
+import itertools
+import math
+import secrets
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Min, Q, Sum, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import DutyPoint, SizingJob, SizingJobChunk
+from .projects import catalog_compressors, evaluate, reevaluate_chunk
+from .sizing import parse_duty
+
+JOB_CHUNK_SIZE = 100  # Items per chunk
+JOB_MAX_ITEMS = 100000
+CHUNK_LEASE = 10 * 60  # s a worker may hold a chunk before another worker retries it
+MAX_ATTEMPTS = 3  # Tries per chunk before its job fails
+JOB_RETENTION_DAYS = 7  # Days finished jobs and their results are kept
+CLAIM_CANDIDATES = 20  # Chunks a worker tries to claim per poll before giving up
+
+UNFINISHED = ['queued', 'running']
+
+
+def size_items(items):
+    """Results of evaluating each parsed duty, in item order."""
+    compressors = catalog_compressors()
+    return [evaluate(duty, compressors) for duty in items]
+
+
+def reevaluate_items(items):
+    """Re-evaluate the duty points with the item ids that are still flagged."""
+    chunk = list(DutyPoint.objects.filter(id__in=items, needs_evaluation=True).order_by('id'))
+    return {'evaluated': len(chunk), 'changed': reevaluate_chunk(chunk) if chunk else 0}
+
+
+# Work function per job kind: items of one chunk -> JSON results
+JOB_KINDS = {
+    'batch': size_items,
+    'sweep': size_items,
+    'reevaluate': reevaluate_items,
+}
+
+
+def sweep_duties(grid):
+    """Parsed duties of every combination of the grid's axes.
+
+    grid is {"base": {part_list parameters}, "axes": {"tevap": [-10, -5], "tcond": [35, 40, 45], ...}}.
+    """
+    base = grid.get('base') or {}
+    axes = grid.get('axes') or {}
+    if not isinstance(base, dict) or not isinstance(axes, dict):
+        raise ValueError('base and axes must be objects')
+    for name, values in axes.items():
+        if not isinstance(values, list) or not values:
+            raise ValueError(f'axis {name} must be a non-empty list')
+
+    total = 1
+    for values in axes.values():
+        total *= len(values)
+    if total > JOB_MAX_ITEMS:
+        raise ValueError(f'the sweep has {total} duties, at most {JOB_MAX_ITEMS} are allowed')
+
+    names = list(axes)
+    return [parse_duty({**base, **dict(zip(names, combination))})
+            for combination in itertools.product(*axes.values())]
+
+
+def session_owner(session):
+    """The token owning the jobs a session submits, created on first use."""
+    if 'job_owner' not in session:
+        session['job_owner'] = secrets.token_hex(16)
+    return session['job_owner']
+
+
+class RateLimited(Exception):
+    """Raised when a client spent its item budget; submit_job answers 429."""
+
+    def __init__(self, retry_after):
+        super().__init__('Too many jobs submitted')
+        self.retry_after = retry_after  # s
+
+
+def _charge(client):
+    """Raise RateLimited when the client's jobs of the last window, the new one included, exceed its budget.
+
+    The jobs are the record of what the client spent, so the count holds across worker processes.
+    Every job costs at least a chunk, so floods of small jobs are limited too.
+    """
+    budget = getattr(settings, 'JOB_RATE_ITEMS', 2 * JOB_MAX_ITEMS)
+    window = getattr(settings, 'JOB_RATE_WINDOW', 60 * 60)
+    since = timezone.now() - timedelta(seconds=window)
+    spent = SizingJob.objects.filter(client=client, created__gt=since).aggregate(
+        items=Sum(Greatest('total_items', Value(JOB_CHUNK_SIZE))), oldest=Min('created'))
+    if spent['items'] > budget:
+        # When the oldest job leaves the window
+        raise RateLimited(max(1, math.ceil((spent['oldest'] - since).total_seconds())))
+
+
+def enqueue(kind, items, params=None, chunk_size=JOB_CHUNK_SIZE, owner='', client=''):
+    """Create a queued job with its items split into chunks.
+
+    Jobs submitted over HTTP are charged to the client address; raises RateLimited, creating nothing,
+    when it spent its budget.
+    """
+    if kind not in JOB_KINDS:
+        raise ValueError(f'unknown job kind {kind}')
+    if not items:
+        raise ValueError('the job has no items')
+    if len(items) > JOB_MAX_ITEMS:
+        raise ValueError(f'at most {JOB_MAX_ITEMS} items can be queued at once')
+
+    with transaction.atomic():
+        job = SizingJob.objects.create(kind=kind, owner=owner, client=client, params=params or {},
+                                       total_items=len(items), total_chunks=(len(items) + chunk_size - 1) // chunk_size)
+        if client:
+            _charge(client)  # Rolls the job back when over budget
+        SizingJobChunk.objects.bulk_create([
+            SizingJobChunk(job=job, index=index, items=items[start:start + chunk_size])
+            for index, start in enumerate(range(0, len(items), chunk_size))
+        ])
+    return job
+
+
+def _finish(job_ids, status, error=''):
+    """Mark unfinished jobs finished and start their retention period."""
+    now = timezone.now()
+    SizingJob.objects.filter(id__in=job_ids, status__in=UNFINISHED).update(
+        status=status, error=error, finished=now, expires=now + timedelta(days=JOB_RETENTION_DAYS))
+    SizingJobChunk.objects.filter(job_id__in=job_ids, status='queued').update(status='cancelled')
+
+
+def _fail_chunk(chunk, error):
+    SizingJobChunk.objects.filter(id=chunk.id).update(status='failed', error=error)
+    _finish([chunk.job_id], 'failed', f'Chunk {chunk.index} failed after {chunk.attempts} attempts: {error}')
+
+
+def claim_chunk(worker):
+    """Lease the oldest queued chunk, or one whose lease expired; None when there is no work."""
+    now = timezone.now()
+    candidates = (SizingJobChunk.objects
+                  .filter(job__status__in=UNFINISHED)
+                  .filter(Q(status='queued') | Q(status='running', claimed__lt=now - timedelta(seconds=CHUNK_LEASE)))
+                  .order_by('id')
+                  .values_list('id', 'status', 'claimed')[:CLAIM_CANDIDATES])
+    for chunk_id, status, claimed in candidates:
+        # Only one worker's UPDATE matches the state it read
+        if not SizingJobChunk.objects.filter(id=chunk_id, status=status, claimed=claimed).update(
+                status='running', worker=worker, claimed=now, attempts=F('attempts') + 1):
+            continue
+        chunk = SizingJobChunk.objects.select_related('job').get(id=chunk_id)
+        if chunk.attempts > MAX_ATTEMPTS:
+            # Its previous workers died or hung
+            _fail_chunk(chunk, chunk.error or 'worker lease expired')
+            continue
+        SizingJob.objects.filter(id=chunk.job_id, status='queued').update(status='running', started=now)
+        return chunk
+    return None
+
+
+def run_chunk(chunk):
+    """Process a claimed chunk and record its results; returns the chunk's final status."""
+    try:
+        results = JOB_KINDS[chunk.job.kind](chunk.items)
+    except Exception as e:
+        error = f'{e}\n{traceback.format_exc()}'  # run_sizing_workers reports the chunk's status
+        if chunk.attempts < MAX_ATTEMPTS:
+            SizingJobChunk.objects.filter(id=chunk.id, claimed=chunk.claimed).update(
+                status='queued', claimed=None, error=error)
+            return 'queued'
+        _fail_chunk(chunk, error)
+        return 'failed'
+
+    # The lease may have expired and been taken over; the newer claim then owns the chunk
+    with transaction.atomic():
+        if not SizingJobChunk.objects.filter(id=chunk.id, status='running', claimed=chunk.claimed).update(
+                status='done', results=results, error=''):
+            return 'lost'
+        SizingJob.objects.filter(id=chunk.job_id).update(done_chunks=F('done_chunks') + 1,
+                                                         done_items=F('done_items') + len(chunk.items))
+    if SizingJob.objects.filter(id=chunk.job_id, done_chunks=F('total_chunks')).exists():
+        _finish([chunk.job_id], 'done')
+    return 'done'
+
+
+def cancel_job(job):
+    """Cancel an unfinished job; chunks already running still finish but the job stays cancelled."""
+    if job.status not in UNFINISHED:
+        return False
+    _finish([job.id], 'cancelled')
+    return True
+
+
+def retry_job(job):
+    """Queue the failed and cancelled chunks of a finished job again."""
+    if job.status not in ('failed', 'cancelled'):
+        return False
+    with transaction.atomic():
+        SizingJobChunk.objects.filter(job=job, status__in=['failed', 'cancelled']).update(
+            status='queued', attempts=0, claimed=None, error='')
+        SizingJob.objects.filter(id=job.id).update(status='running' if job.started else 'queued', error='',
+                                                    finished=None, expires=None)
+    return True
+
+
+def purge_expired():
+    """Delete finished jobs past their retention period, with their chunks and results."""
+    deleted, _ = SizingJob.objects.filter(expires__lt=timezone.now()).delete()
+    return deleted
+
+
+def job_status(job):
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'params': job.params,
+        'chunks': {'done': job.done_chunks, 'total': job.total_chunks},
+        'items': {'done': job.done_items, 'total': job.total_items},
+        'progress': round(job.done_items / job.total_items * 100, 1) if job.total_items else 0,  # %
+        'error': job.error,
+        'created': job.created,
+        'started': job.started,
+        'finished': job.finished,
+        'expires': job.expires,
+    }
+
+
+def job_results(job):
+    """Results of a finished job: one entry per item, or re-evaluation totals."""
+    chunks = job.chunks.filter(status='done').order_by('index').values_list('items', 'results')
+    if job.kind == 'reevaluate':
+        totals = {'evaluated': 0, 'changed': 0}
+        for _, results in chunks:
+            totals['evaluated'] += results['evaluated']
+            totals['changed'] += results['changed']
+        return totals
+    return [{'inputs': item, **result} for items, results in chunks for item, result in zip(items, results)]
@@ -0,0 +1,271 @@
+"""Sizing of the suction, discharge, liquid, condensing and oil lines in one batched computation.
+
+sizing.operating_state() evaluates the fluid state of each line once: superheated vapour on
+the suction and discharge lines, saturated liquid on the liquid line, a homogeneous
+two-phase condensate on the condensing line and lubricating oil on the oil line.
+evaluate_pipes() then computes velocity, Reynolds number, friction factor and pressure drop
+of every catalog pipe of every line type as NumPy arrays, so the size of the pipe catalog
+costs no PropsSI calls.
+
+Variable-speed compressors also run at part load: part_load() evaluates the riser lines
+of every pipe over the whole frequency range as one (pipes × frequencies) array, flagging
+pipes too large to carry oil up a riser at low speed or too small for the pressure drop
+limit at high speed.
+"""
+import math
+
+import numpy as np
+
+from .fluids import PropsSI
+from .indexes import catalog_index, compressor_index
+from .models import Piping
+from .timing import count, span
+from .trace import enabled as tracing, record
+
+LINE_TYPES = ['suction', 'discharge', 'liquid', 'condensing', 'oil']
+
+standard_pipe_sizes = [12, 16, 18, 22, 28, 35, 42, 54, 64, 76]  # etc.
+
+TARGET_VELOCITY = {
+    'suction': 20,  # m/s
+    'discharge': 15,  # m/s
+    'liquid': 1,  # m/s
+    'condensing': 0.5,  # m/s, low enough for vapour to vent back to the condenser
+    'oil': 0.5,  # m/s
+}
+
+ROUGHNESS = 0.0015  # mm, drawn copper
+LAMINAR_REYNOLDS = 2300
+
+CONDENSATE_QUALITY = 0.05  # Vapour mass fraction of the condensate draining from the condenser
+OIL_CIRCULATION = 0.02  # Oil mass flow returned by the oil separator, as a fraction of the refrigerant mass flow
+OIL_VISCOSITY = {40: 68, 100: 8.6}  # cSt at °C, ISO VG 68 polyolester oil
+OIL_DENSITY_15 = 977  # kg/m³ at 15 °C
+OIL_EXPANSION = 0.00065  # 1/K, volumetric thermal expansion of the oil
+
+FREQUENCY_RANGE = (25, 70)  # Hz, speed range checked at part load
+FREQUENCY_STEP = 5  # Hz
+RISER_LINES = ['suction', 'discharge']
+MIN_RISER_VELOCITY = {'suction': 5.1, 'discharge': 2.5}  # m/s (1000 and 500 fpm) that carry oil up a riser
+MAX_SATURATION_DROP = 1  # K of saturation temperature a suction or discharge line may lose to pressure drop
+
+
+def saturated_liquid(refrigerant, temperature):
+    """Density (kg/m³) and viscosity (Pa·s) of the saturated liquid at a temperature (°C)."""
+    T = temperature + 273.15
+    return PropsSI('D', 'T', T, 'Q', 0, refrigerant), PropsSI('viscosity', 'T', T, 'Q', 0, refrigerant)
+
+
+def supercritical(refrigerant, temperature, pressure):
+    """Density (kg/m³) and viscosity (Pa·s) at a temperature (°C) and pressure (Pa), e.g. in a gas cooler."""
+    T = temperature + 273.15
+    return PropsSI('D', 'T', T, 'P', pressure, refrigerant), PropsSI('viscosity', 'T', T, 'P', pressure, refrigerant)
+
+
+def condensate(refrigerant, temperature, quality=CONDENSATE_QUALITY):
+    """Homogeneous density and McAdams viscosity of a two-phase flow at a temperature (°C) and quality."""
+    T = temperature + 273.15
+    density_liquid, viscosity_liquid = saturated_liquid(refrigerant, temperature)
+    density_vapour = PropsSI('D', 'T', T, 'Q', 1, refrigerant)
+    viscosity_vapour = PropsSI('viscosity', 'T', T, 'Q', 1, refrigerant)
+    density = 1 / (quality / density_vapour + (1 - quality) / density_liquid)
+    viscosity = 1 / (quality / viscosity_vapour + (1 - quality) / viscosity_liquid)
+    return density, viscosity
+
+
+def oil_properties(temperature):
+    """Density (kg/m³) and dynamic viscosity (Pa·s) of the oil at a temperature (°C).
+
+    The kinematic viscosity follows Walther's equation (ASTM D341) through the two rated points.
+    """
+    (T1, nu1), (T2, nu2) = [(T + 273.15, nu) for T, nu in sorted(OIL_VISCOSITY.items())]
+    w1, w2 = math.log10(math.log10(nu1 + 0.7)), math.log10(math.log10(nu2 + 0.7))
+    slope = (w2 - w1) / (math.log10(T2) - math.log10(T1))
+    w = w1 + slope * (math.log10(temperature + 273.15) - math.log10(T1))
+    nu = 10 ** 10 ** w - 0.7  # cSt
+    density = OIL_DENSITY_15 * (1 - OIL_EXPANSION * (temperature - 15))
+    return density, nu * 1e-6 * density
+
+
+class PipeIndex:
+    """Pipes of every line type as arrays, grouped by line type and sorted by outer diameter."""
+
+    def __init__(self, pipes):
+        self.pipes = sorted((pipe for pipe in pipes if pipe.pipe_type in LINE_TYPES),
+                            key=lambda pipe: (LINE_TYPES.index(pipe.pipe_type), pipe.outer_diameter, pipe.pk))
+        self.line = np.array([LINE_TYPES.index(pipe.pipe_type) for pipe in self.pipes], dtype=int)
+        self.inner_diameter = np.array([pipe.inner_diameter for pipe in self.pipes], dtype=float) / 1000  # m
+        self.outer_diameter = np.array([pipe.outer_diameter for pipe in self.pipes], dtype=float)
+        bounds = np.searchsorted(self.line, np.arange(len(LINE_TYPES) + 1))
+        self.slices = {line_type: slice(bounds[i], bounds[i + 1]) for i, line_type in enumerate(LINE_TYPES)}
+
+
+def pipe_index():
+    return catalog_index('pipes', lambda: PipeIndex(Piping.objects.all()))
+
+
+def flow(mass_flow_rate, density, viscosity, diameter, pipe_length):
+    """Velocity (m/s), Reynolds number, friction factor and pressure drop (bar); arguments broadcast as arrays.
+
+    Each element of the result counts as one of Server-Timing's pressure_drop_calls.
+    """
+    with span('pressure_drop'), np.errstate(divide='ignore', invalid='ignore'):
+        velocity = mass_flow_rate / (density * math.pi * (diameter / 2) ** 2)
+        reynolds = density * velocity * diameter / viscosity
+        # Swamee-Jain explicit approximation of Colebrook-White, Hagen-Poiseuille when laminar
+        turbulent = 0.25 / np.log10((ROUGHNESS / 1000) / (3.7 * diameter) + 5.74 / reynolds ** 0.9) ** 2
+        friction = np.where(reynolds < LAMINAR_REYNOLDS, 64 / reynolds, turbulent)
+        pressure_drop = friction * (pipe_length / diameter) * density * velocity ** 2 / 2 / 100000
+    count('pressure_drop_calls', int(np.size(pressure_drop)))
+    return {'velocity': velocity, 'reynolds': reynolds, 'friction': friction, 'pressure_drop': pressure_drop}
+
+
+def _line_arrays(state):
+    """Mass flow, density and viscosity per line type, NaN for lines the state doesn't have."""
+    mass_flow_rate, density, viscosity = np.full((3, len(LINE_TYPES)), np.nan)
+    for i, line_type in enumerate(LINE_TYPES):
+        line = state.get(line_type)
+        if line is not None:
+            mass_flow_rate[i] = line.get('mass_flow_rate', state['mass_flow_rate'])
+            density[i] = line['density']
+            viscosity[i] = line['viscosity']
+    return mass_flow_rate, density, viscosity
+
+
+def evaluate_pipes(state, pipe_length, coupling=None):
+    """Velocity (m/s), Reynolds number, friction factor and pressure drop (bar) of every indexed pipe.
+
+    With a coupling.solve() result each suction pipe carries the mass flow the compressor delivers through it.
+    """
+    index = pipe_index()
+    mass_flow_rate, density, viscosity = _line_arrays(state)
+    mass_flow_rate = mass_flow_rate[index.line]
+    if coupling is not None:
+        mass_flow_rate[index.slices['suction']] = coupling['mass_flow_rate']
+    return index, flow(mass_flow_rate, density[index.line], viscosity[index.line], index.inner_diameter, pipe_length)
+
+
+def part_load(state, pipe_length):
+    """Riser verdicts over FREQUENCY_RANGE by pipe index, for the suction and discharge pipes.
+
+    The mass flow scales with the compressor's displacement at each frequency; the line states
+    are those of the duty. Empty when the state doesn't name a catalog compressor.
+    """
+    compressor = compressor_index().by_id.get(state.get('compressor'))
+    if compressor is None or 'frequency' not in state:
+        return {}
+    frequencies = np.arange(FREQUENCY_RANGE[0], FREQUENCY_RANGE[1] + FREQUENCY_STEP / 2, FREQUENCY_STEP)
+    scale = compressor.calculate_displacement(frequencies) / compressor.calculate_displacement(state['frequency'])
+
+    index = pipe_index()
+    mass_flow_rate, density, viscosity = _line_arrays(state)
+    verdicts = {}
+    for line_type in RISER_LINES:
+        line = state.get(line_type)
+        pipes = np.arange(index.slices[line_type].start, index.slices[line_type].stop)
+        if line is None or not len(pipes) or 'max_pressure_drop' not in line:
+            continue
+        i = LINE_TYPES.index(line_type)
+        # Rows are pipes, columns frequencies
+        results = flow(mass_flow_rate[i] * scale[np.newaxis, :], density[i], viscosity[i],
+                       index.inner_diameter[pipes, np.newaxis], pipe_length)
+        carries_oil = results['velocity'] >= MIN_RISER_VELOCITY[line_type]
+        within_limit = results['pressure_drop'] <= line['max_pressure_drop']
+        min_velocity = results['velocity'].min(axis=1)
+        max_pressure_drop = results['pressure_drop'].max(axis=1)
+        for row, pipe in enumerate(pipes):
+            if not np.isfinite(min_velocity[row]):
+                continue
+            verdict = {
+                'frequencies': [float(frequencies[0]), float(frequencies[-1])],  # Hz
+                'min_velocity': float(min_velocity[row]),
+                'max_pressure_drop': float(max_pressure_drop[row]),
+                'oil_return': bool(carries_oil[row].all()),
+                'pressure_drop_ok': bool(within_limit[row].all()),
+                'warnings': [],
+            }
+            if not verdict['oil_return']:
+                lowest = frequencies[carries_oil[row]]
+                verdict['warnings'].append(
+                    f'Below {MIN_RISER_VELOCITY[line_type]} m/s riser velocity for oil return '
+                    + (f'under {lowest[0]:g} Hz' if len(lowest) else 'at every speed'))
+            if not verdict['pressure_drop_ok']:
+                highest = frequencies[within_limit[row]]
+                verdict['warnings'].append(
+                    f"Pressure drop above {line['max_pressure_drop']:.2f} bar "
+                    + (f'over {highest[-1]:g} Hz' if len(highest) else 'at every speed'))
+            verdicts[int(pipe)] = verdict
+    return verdicts
+
+
+def _row(index, results, i, verdicts, coupling):
+    pipe = index.pipes[i]
+    suction = index.slices['suction']
+    coupled = None
+    if coupling is not None and suction.start <= i < suction.stop:
+        coupled = {key: coupling[key][i - suction.start] for key in ('T_evap', 'q_compressor', 'converged')}
+    return {
+        'id': pipe.id,
+        'name': pipe.name,
+        'inner_diameter': pipe.inner_diameter,
+        'outer_diameter': pipe.outer_diameter,
+        'material': pipe.material,
+        'velocity': float(results['velocity'][i]),
+        'pressure_drop': float(results['pressure_drop'][i]),
+        'part_load': verdicts.get(i),
+        'coupled': coupled,
+    }
+
+
+def colebrook_white(reynolds, diameter):
+    """Colebrook-White friction factor by fixed-point iteration, to check the Swamee-Jain factor when tracing."""
+    friction = 0.02
+    for iteration in range(1, 51):
+        previous = friction
+        friction = (-2 * math.log10((ROUGHNESS / 1000) / (3.7 * diameter) + 2.51 / (reynolds * math.sqrt(friction)))) ** -2
+        if abs(friction - previous) < 1e-10:
+            break
+    count('friction_iterations', iteration)
+    return friction
+
+
+def size_lines(state, pipe_length, coupling=None):
+    """The pipe of an allowed size whose velocity is closest to the target velocity, per line type."""
+    index, results = evaluate_pipes(state, pipe_length, coupling)
+    verdicts = part_load(state, pipe_length)
+    velocity = results['velocity']
+    best = {}
+    for line_type in LINE_TYPES:
+        best[line_type] = None
+        line = state.get(line_type)
+        if line is None:
+            continue
+        candidates = np.arange(index.slices[line_type].start, index.slices[line_type].stop)
+        if line['connection'] is not None:
+            allowed_sizes = Piping.get_allowed_sizes(line['connection'], standard_pipe_sizes)
+            candidates = candidates[np.isin(index.outer_diameter[candidates], allowed_sizes)]
+        candidates = candidates[np.isfinite(velocity[candidates])]
+        if not len(candidates):
+            continue
+        i = candidates[np.argmin(np.abs(velocity[candidates] - TARGET_VELOCITY[line_type]))]
+        best[line_type] = _row(index, results, i, verdicts, coupling)
+        if tracing():
+            laminar = results['reynolds'][i] < LAMINAR_REYNOLDS
+            record('line_pipe', line=line_type, pipe=best[line_type]['id'], density=line['density'],
+                   viscosity=line['viscosity'], velocity=best[line_type]['velocity'],
+                   reynolds=float(results['reynolds'][i]), friction=float(results['friction'][i]),
+                   colebrook_white=None if laminar else colebrook_white(results['reynolds'][i],
+                                                                        index.inner_diameter[i]),
+                   pressure_drop=best[line_type]['pressure_drop'])
+    return best
+
+
+def line_table(state, line_type, pipe_length, coupling=None):
+    """Velocity, pressure drop and part-load verdict of every pipe of one line type, by outer diameter."""
+    if state.get(line_type) is None:
+        return []
+    index, results = evaluate_pipes(state, pipe_length, coupling)
+    verdicts = part_load(state, pipe_length) if line_type in RISER_LINES else {}
+    pipes = index.slices[line_type]
+    return [_row(index, results, i, verdicts, coupling) for i in range(pipes.start, pipes.stop)
+            if np.isfinite(results['velocity'][i]) and np.isfinite(results['pressure_drop'][i])]
@@ -0,0 +1,277 @@
+import csv
+import json
+import time
+from pathlib import Path
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models, transaction
+from shapely.geometry import LinearRing
+
+from myapp.catalog import rebuild_catalog_caches
+from myapp.models import (CheckValve, Compressor, ExpansionValve, OilReceiver, OilSeparator, OilSeparatorReceiver,
+                          Piping, Receiver, SightGlass, SolenoidValve, SuctionAccumulator, refrigerants)
+from myapp.profiling import maybe_profile
+from myapp.projects import mark_all
+
+# Catalog models that can be imported, with the fields identifying an existing row
+IMPORT_MODELS = {
+    'compressor': (Compressor, ['name']),
+    'piping': (Piping, ['name', 'pipe_type']),
+    'receiver': (Receiver, ['receiver_name', 'manufacturer']),
+    'check_valve': (CheckValve, ['checkvalve_model', 'manufacturer']),
+    'sight_glass': (SightGlass, ['sightglass_model', 'manufacturer']),
+    'suction_accumulator': (SuctionAccumulator, ['accumulator_model', 'manufacturer']),
+    'oil_separator': (OilSeparator, ['oil_separator_model', 'manufacturer']),
+    'oil_separator_receiver': (OilSeparatorReceiver, ['oil_separator_receiver_model', 'manufacturer']),
+    'oil_receiver': (OilReceiver, ['oil_receiver_model', 'manufacturer']),
+    'expansion_valve': (ExpansionValve, ['name']),
+    'solenoid_valve': (SolenoidValve, ['name']),
+}
+
+REFRIGERANT_FIELDS = {'refrigerants', 'receiver_refrigerant', 'sightglass_refrigerants', 'accumulator_refrigerants',
+                      'oil_separator_receiver_refrigerants', 'oil_receiver_refrigerants'}
+
+# Refrigerant names and the family names (HFC, HCFC, ...) existing catalog rows use
+KNOWN_REFRIGERANTS = {name for members in refrigerants.values() for name in members} | \
+                     {family.rstrip('s') for family in refrigerants}
+
+JSON_READ_SIZE = 64 * 1024
+
+
+def read_csv(path):
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        yield from csv.DictReader(f)
+
+
+def read_jsonl(path):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def read_json(path):
+    """Yield the objects of a top-level JSON array without loading the whole file."""
+    decoder = json.JSONDecoder()
+    with open(path, encoding='utf-8') as f:
+        buffer = f.read(JSON_READ_SIZE).lstrip()
+        if not buffer.startswith('['):
+            raise CommandError('JSON catalog files must contain an array of objects')
+        buffer = buffer[1:]
+        eof = False
+        while True:
+            buffer = buffer.lstrip().lstrip(',').lstrip()
+            if buffer.startswith(']'):
+                return
+            try:
+                obj, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise CommandError('Truncated or invalid JSON catalog file')
+                chunk = f.read(JSON_READ_SIZE)
+                eof = not chunk
+                buffer += chunk
+                continue
+            yield obj
+            buffer = buffer[end:]
+
+
+def read_xlsx(path):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise CommandError('Importing XLSX files requires openpyxl (pip install openpyxl)')
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(cell).strip() if cell is not None else '' for cell in next(rows, [])]
+        for values in rows:
+            if any(value is not None for value in values):
+                yield dict(zip(header, values))
+    finally:
+        workbook.close()
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+    'jsonl': read_jsonl,
+    'xlsx': read_xlsx,
+}
+
+
+def envelope_errors(points, name):
+    """Check that a list of {"T_evap", "T_cond"} points forms a closed, simple polygon."""
+    try:
+        coords = [(float(point['T_evap']), float(point['T_cond'])) for point in points]
+    except (TypeError, KeyError, ValueError):
+        return [f'{name} must be a list of {{"T_evap": ..., "T_cond": ...}} points']
+
+    if len(coords) > 1 and coords[0] == coords[-1]:
+        coords = coords[:-1]  # Explicitly closed; the polygon closes itself anyway
+    if len(set(coords)) < 3:
+        return [f'{name} needs at least three distinct points to enclose an area']
+
+    ring = LinearRing(coords)
+    if not ring.is_simple:
+        return [f'{name} is self-intersecting']
+    if ring.convex_hull.area == 0:
+        return [f'{name} does not enclose an area']
+    return []
+
+
+def refrigerant_errors(value, name):
+    names = [value] if isinstance(value, str) else value
+    if not isinstance(names, list):
+        return [f'{name} must be a list of refrigerants']
+    unknown = [refrigerant for refrigerant in names if refrigerant not in KNOWN_REFRIGERANTS]
+    return [f'{name} has unknown refrigerants: {", ".join(map(str, unknown))}'] if unknown else []
+
+
+class Command(BaseCommand):
+    help = 'Import catalog rows (compressors, pipes, valves, ...) from a CSV, JSON, JSON Lines or XLSX file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import')
+        parser.add_argument('--model', required=True, choices=sorted(IMPORT_MODELS),
+                            help='Catalog model the rows belong to')
+        parser.add_argument('--format', choices=sorted(READERS),
+                            help='File format, by default taken from the file extension')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Rows written per transaction (default: 500)')
+        parser.add_argument('--dry-run', action='store_true', help='Validate the file without writing anything')
+        parser.add_argument('--profile', action='store_true', help='Store a cProfile profile of the import')
+
+    def handle(self, *args, **options):
+        params = {key: options[key] for key in ('path', 'model', 'format', 'batch_size', 'dry_run')}
+        with maybe_profile(options['profile'], 'import_catalog', params) as info:
+            self.import_file(**options)
+        if info['id']:
+            self.stdout.write(f"Stored profile {info['id']}")
+
+    def import_file(self, **options):
+        path = Path(options['path'])
+        if not path.exists():
+            raise CommandError(f'{path} does not exist')
+        file_format = options['format'] or path.suffix.lstrip('.').lower()
+        if file_format not in READERS:
+            raise CommandError(f'Unsupported file format: {file_format}')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        model, key_fields = IMPORT_MODELS[options['model']]
+        self.fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+        self.model = model
+        self.key_fields = key_fields
+        self.dry_run = options['dry_run']
+        self.created = self.updated = self.rejected = 0
+
+        start = time.perf_counter()
+        batch = []
+        row_number = 0
+        try:
+            for row_number, row in enumerate(READERS[file_format](path), start=1):
+                values, errors = self.clean_row(row)
+                if errors:
+                    self.rejected += 1
+                    self.stderr.write(f'Row {row_number}: ' + '; '.join(errors))
+                    continue
+                batch.append(values)
+                if len(batch) >= options['batch_size']:
+                    self.write_batch(batch)
+                    batch = []
+        except (csv.Error, json.JSONDecodeError, UnicodeDecodeError) as e:
+            if not self.dry_run and (self.created or self.updated):
+                rebuild_catalog_caches()
+                mark_all(model)
+            raise CommandError(f'Could not parse row {row_number + 1} of {path}: {e} '
+                               f'({self.created + self.updated} rows were already imported)')
+        if batch:
+            self.write_batch(batch)
+
+        if not self.dry_run and (self.created or self.updated):
+            rebuild_catalog_caches()
+            flagged = mark_all(model)
+            if flagged:
+                self.stdout.write(f'Flagged {flagged} saved duty points for re-evaluation')
+
+        elapsed = time.perf_counter() - start
+        total = self.created + self.updated + self.rejected
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Validated" if self.dry_run else "Imported"} {total} rows into {model.__name__}: '
+            f'{self.created} {"to create" if self.dry_run else "created"}, '
+            f'{self.updated} {"to update" if self.dry_run else "updated"}, {self.rejected} rejected '
+            f'in {elapsed:.2f} s ({total / elapsed if elapsed else 0:.0f} rows/s)'))
+
+    def clean_row(self, row):
+        """Convert one raw row to model field values, collecting every validation error."""
+        values = {}
+        errors = []
+        for field in self.fields:
+            raw = row.get(field.name)
+            if raw in (None, ''):
+                if field.has_default():
+                    values[field.name] = field.get_default()
+                else:
+                    errors.append(f'{field.name} is required')
+                continue
+            try:
+                if isinstance(field, models.JSONField):
+                    # CSV and XLSX cells hold JSON as text; an empty list is a valid value
+                    values[field.name] = json.loads(raw) if isinstance(raw, str) else raw
+                else:
+                    values[field.name] = field.clean(raw, None)
+            except json.JSONDecodeError as e:
+                errors.append(f'{field.name}: invalid JSON ({e})')
+            except ValidationError as e:
+                errors.append(f'{field.name}: {"; ".join(e.messages)}')
+
+        if errors:
+            return values, errors
+
+        for name in REFRIGERANT_FIELDS.intersection(values):
+            errors += refrigerant_errors(values[name], name)
+        if self.model is Compressor:
+            errors += envelope_errors(values['working_field_points'], 'working_field_points')
+            constraints = values['additional_constraints']
+            if not isinstance(constraints, list):
+                errors.append('additional_constraints must be a list')
+            else:
+                for index, constraint in enumerate(constraints):
+                    if not isinstance(constraint, dict) or 'message' not in constraint:
+                        errors.append(f'additional_constraints[{index}] needs field_points and a message')
+                        continue
+                    errors += envelope_errors(constraint.get('field_points'), f'additional_constraints[{index}]')
+        return values, errors
+
+    def write_batch(self, batch):
+        """Upsert one batch of cleaned rows in a single transaction."""
+        rows = {}
+        for values in batch:
+            rows[tuple(values[name] for name in self.key_fields)] = values  # Last duplicate wins
+
+        with transaction.atomic():
+            # One query finds the existing rows of the whole batch
+            lookup = {f'{name}__in': {key[i] for key in rows} for i, name in enumerate(self.key_fields)}
+            existing = {tuple(getattr(obj, name) for name in self.key_fields): obj
+                        for obj in self.model.objects.filter(**lookup)}
+
+            to_create = []
+            to_update = []
+            for key, values in rows.items():
+                obj = existing.get(key)
+                if obj is None:
+                    to_create.append(self.model(**values))
+                    continue
+                for name, value in values.items():
+                    setattr(obj, name, value)
+                to_update.append(obj)
+
+            if not self.dry_run:
+                self.model.objects.bulk_create(to_create)
+                self.model.objects.bulk_update(to_update, [field.name for field in self.fields
+                                                           if field.name not in self.key_fields])
+        self.created += len(to_create)
+        self.updated += len(to_update)
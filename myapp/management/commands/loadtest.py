@@ -0,0 +1,303 @@
+import itertools
+import json
+import os
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+from pathlib import Path
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, Request, build_opener, urlopen
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+# Duty mix replayed by default; --mix reads the same keys from a JSON file.
+# Values are drawn from the ranges once per distinct duty, so repeated duties
+# exercise the sizing cache the way returning users do.
+DEFAULT_MIX = {
+    'distinct_duties': 50,
+    'refrigerants': {'R134a': 0.4, 'R507A': 0.2, 'R407C': 0.15, 'R410A': 0.15, 'R22': 0.1},
+    'q_capacity': [10, 200],  # kW
+    'tevap': [-30, 10],  # °C
+    'tcond': [30, 55],  # °C
+    'subcooling': [0, 5],  # K
+    'superheat': [3, 10],  # K
+    'circuits': [1, 2],
+    'frequency': [50],  # Hz, picked from the list
+    'select_ratio': 0.3,  # Share of page views followed by select_components clicks
+}
+
+# Selectable component types and the catalog rows the load test clicks on
+CLICK_QUERIES = {
+    'compressor': 'SELECT id FROM myapp_compressor',
+    'receiver': 'SELECT id FROM myapp_receiver',
+    'check_valve': 'SELECT id FROM myapp_checkvalve',
+    'sight_glass': 'SELECT id FROM myapp_sightglass',
+    'suction_pipe': "SELECT id FROM myapp_piping WHERE pipe_type = 'suction'",
+    'discharge_pipe': "SELECT id FROM myapp_piping WHERE pipe_type = 'discharge'",
+}
+
+READY_TIMEOUT = 30  # s to wait for gunicorn to accept requests
+REQUEST_TIMEOUT = 120  # s
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def make_duties(mix, rng):
+    """Draw the distinct duty points of the mix."""
+    refrigerants = list(mix['refrigerants'])
+    weights = list(mix['refrigerants'].values())
+    duties = []
+    for _ in range(mix['distinct_duties']):
+        tevap = round(rng.uniform(*mix['tevap']))
+        duties.append({
+            'q_capacity': round(rng.uniform(*mix['q_capacity']), 1),
+            'tevap': tevap,
+            'tcond': max(round(rng.uniform(*mix['tcond'])), tevap + 20),
+            'subcooling': round(rng.uniform(*mix['subcooling'])),
+            'superheat': round(rng.uniform(*mix['superheat'])),
+            'circuits': rng.randint(*mix['circuits']),
+            'compressors': 1,
+            'refrigerant': rng.choices(refrigerants, weights)[0],
+            'frequency': rng.choice(mix['frequency']),
+        })
+    return duties
+
+
+def percentiles(latencies):
+    if not latencies:
+        return {'p50': None, 'p95': None, 'p99': None, 'mean': None, 'max': None}
+    values = np.asarray(latencies) * 1000  # ms
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {'p50': round(p50, 1), 'p95': round(p95, 1), 'p99': round(p99, 1),
+            'mean': round(values.mean(), 1), 'max': round(values.max(), 1)}
+
+
+def summarize(samples, elapsed):
+    """Throughput, latency percentiles (ms) and error rate, overall and per endpoint."""
+    def stats(rows):
+        errors = sum(1 for _, _, ok in rows if not ok)
+        return {
+            'requests': len(rows),
+            'errors': errors,
+            'error_rate': round(errors / len(rows), 4) if rows else 0,
+            'throughput': round(len(rows) / elapsed, 2) if elapsed else 0,  # requests/s
+            'latency_ms': percentiles([latency for _, latency, _ in rows]),
+        }
+
+    result = stats(samples)
+    result['endpoints'] = {name: stats([row for row in samples if row[0] == name])
+                           for name in sorted({row[0] for row in samples})}
+    return result
+
+
+def compare(previous, current):
+    """Relative change of the headline numbers against a previous run."""
+    def change(old, new):
+        if old in (None, 0) or new is None:
+            return None
+        return round((new - old) / old * 100, 1)
+
+    comparison = {
+        'throughput': {'previous': previous['throughput'], 'current': current['throughput'],
+                       'change_percent': change(previous['throughput'], current['throughput'])},
+        'error_rate': {'previous': previous['error_rate'], 'current': current['error_rate']},
+    }
+    for name in ('p50', 'p95', 'p99'):
+        old, new = previous['latency_ms'][name], current['latency_ms'][name]
+        comparison[f'latency_{name}_ms'] = {'previous': old, 'current': new, 'change_percent': change(old, new)}
+    return comparison
+
+
+class Command(BaseCommand):
+    help = ('Start the app under gunicorn on a copy of the catalog and replay a mix of part_list views '
+            'and component selections, reporting throughput, latency percentiles and error rate as JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=10, help='Simulated users (default: 10)')
+        parser.add_argument('--duration', type=float, default=30, help='Seconds to run (default: 30)')
+        parser.add_argument('--requests', type=int, help='Stop after this many requests instead of --duration')
+        parser.add_argument('--workers', type=int, default=4, help='gunicorn worker processes (default: 4)')
+        parser.add_argument('--mix', help='JSON file overriding keys of the default duty mix')
+        parser.add_argument('--catalog', help='SQLite database to seed from (default: the configured database)')
+        parser.add_argument('--url', help='Load an already running server instead of starting gunicorn')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the duty mix (default: 0)')
+        parser.add_argument('--output', help='Also write the JSON report to this file')
+        parser.add_argument('--compare', help='JSON report of a previous run to compare against')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1:
+            raise CommandError('--concurrency must be at least 1')
+
+        mix = dict(DEFAULT_MIX)
+        if options['mix']:
+            try:
+                with open(options['mix']) as f:
+                    mix.update(json.load(f))
+            except (OSError, ValueError) as e:
+                raise CommandError(f'Could not read the mix file: {e}')
+        previous = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as f:
+                    previous = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f'Could not read the previous report: {e}')
+
+        rng = random.Random(options['seed'])
+        duties = make_duties(mix, rng)
+        catalog = Path(options['catalog'] or settings.DATABASES['default']['NAME'])
+        if not catalog.exists():
+            raise CommandError(f'{catalog} does not exist')
+
+        with tempfile.TemporaryDirectory(prefix='loadtest-') as workdir:
+            clicks = self.click_targets(catalog)
+            if options['url']:
+                samples, elapsed = self.run(options['url'].rstrip('/'), duties, clicks, mix, options)
+            else:
+                server, url = self.start_server(catalog, Path(workdir), options['workers'])
+                try:
+                    samples, elapsed = self.run(url, duties, clicks, mix, options)
+                finally:
+                    server.terminate()
+                    server.wait(timeout=30)
+
+        report = {
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'duration': round(elapsed, 2),
+            'concurrency': options['concurrency'],
+            'workers': None if options['url'] else options['workers'],
+            'distinct_duties': len(duties),
+            **summarize(samples, elapsed),
+        }
+        if previous:
+            report['comparison'] = compare(previous, report)
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        self.stdout.write(output)
+
+    def click_targets(self, catalog):
+        """Catalog ids per component type, read straight from the seed database."""
+        connection = sqlite3.connect(f'file:{catalog}?mode=ro', uri=True)
+        try:
+            targets = {component_type: [row[0] for row in connection.execute(query)]
+                       for component_type, query in CLICK_QUERIES.items()}
+        except sqlite3.Error as e:
+            raise CommandError(f'Could not read the catalog from {catalog}: {e}')
+        finally:
+            connection.close()
+        return {component_type: ids for component_type, ids in targets.items() if ids}
+
+    def start_server(self, catalog, workdir, workers):
+        """Copy and migrate the catalog, then start gunicorn on a free local port."""
+        database = workdir / 'db.sqlite3'
+        shutil.copyfile(catalog, database)
+        env = dict(os.environ,
+                   DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'myproject.settings'),
+                   DJANGO_SQLITE_PATH=str(database),
+                   DJANGO_CACHE_DIR=str(workdir / 'cache'))
+
+        migrate = subprocess.run([sys.executable, str(settings.BASE_DIR / 'manage.py'), 'migrate', '--noinput'],
+                                 env=env, capture_output=True, text=True)
+        if migrate.returncode:
+            raise CommandError(f'Migrating the load test database failed:\n{migrate.stderr}')
+
+        port = free_port()
+        log = open(workdir / 'gunicorn.log', 'w')
+        # The sizing code prints a lot; keep stdout out of the measurement
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', 'myproject.wsgi:application', '--bind', f'127.0.0.1:{port}',
+             '--workers', str(workers), '--timeout', str(REQUEST_TIMEOUT), '--chdir', str(settings.BASE_DIR)],
+            env=env, stdout=subprocess.DEVNULL, stderr=log)
+        log.close()  # gunicorn has its own handle
+        url = f'http://127.0.0.1:{port}'
+
+        deadline = time.monotonic() + READY_TIMEOUT
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError('gunicorn exited:\n' + (workdir / 'gunicorn.log').read_text()[-2000:])
+            try:
+                urlopen(url + reverse('input'), timeout=1).close()
+                self.stderr.write(f'gunicorn ready on {url} with {workers} workers')
+                return server, url
+            except OSError:
+                time.sleep(0.2)
+        server.terminate()
+        raise CommandError(f'gunicorn did not start within {READY_TIMEOUT} s')
+
+    def run(self, url, duties, clicks, mix, options):
+        samples = []
+        lock = threading.Lock()
+        budget = itertools.count()
+        deadline = time.monotonic() + options['duration']
+
+        def more():
+            if options['requests'] is not None:
+                return next(budget) < options['requests']
+            return time.monotonic() < deadline
+
+        def user(index):
+            rng = random.Random(options['seed'] * 1000 + index)
+            cookies = CookieJar()
+            opener = build_opener(HTTPCookieProcessor(cookies))
+            while more():
+                duty = rng.choice(duties)
+                sample = self.timed(opener, 'part_list', Request(f"{url}{reverse('part_list')}?{urlencode(duty)}"))
+                with lock:
+                    samples.append(sample)
+                if not sample[2]:
+                    continue
+                # The page fetches the user's selections, which also sets the CSRF cookie
+                sample = self.timed(opener, 'selections', Request(url + reverse('selections')), expect_success=True)
+                with lock:
+                    samples.append(sample)
+                # A user only clicks on a page that loaded
+                if not sample[2] or not clicks or rng.random() >= mix['select_ratio'] or not more():
+                    continue
+
+                # Clicks are flushed in batches by the page; one to three picks per batch
+                picks = [{'type': component_type, 'id': rng.choice(clicks[component_type])}
+                         for component_type in rng.sample(sorted(clicks), min(len(clicks), rng.randint(1, 3)))]
+                token = next((cookie.value for cookie in cookies if cookie.name == settings.CSRF_COOKIE_NAME), '')
+                request = Request(url + reverse('select_components'), data=json.dumps({'selections': picks}).encode(),
+                                  headers={'Content-Type': 'application/json', 'X-CSRFToken': token})
+                sample = self.timed(opener, 'select_components', request, expect_success=True)
+                with lock:
+                    samples.append(sample)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            for future in [executor.submit(user, index) for index in range(options['concurrency'])]:
+                future.result()
+        return samples, time.perf_counter() - start
+
+    def timed(self, opener, name, request, expect_success=False):
+        """(endpoint, latency in s, ok) of one request."""
+        start = time.perf_counter()
+        try:
+            with opener.open(request, timeout=REQUEST_TIMEOUT) as response:
+                body = response.read()
+            ok = response.status == 200
+            if ok and expect_success:
+                # Views report invalid input as {"success": false} with status 200
+                ok = json.loads(body).get('success', False)
+        except (OSError, ValueError):
+            ok = False
+        return name, time.perf_counter() - start, ok
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from myapp import fluids
+
+
+class Command(BaseCommand):
+    help = ('Resolve every catalog refrigerant to a CoolProp identifier ahead of time, '
+            'so requests and workers read the result from the cache instead of probing.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--refresh', action='store_true', help='Probe again even when the cache has a result')
+
+    def handle(self, *args, **options):
+        if options['refresh']:
+            fluids.forget()
+        start = time.perf_counter()
+        registry = fluids.registry()
+        for fluid in registry.values():
+            if fluid.supported:
+                estimated = f', {len(fluid.binary_pairs)} binary pairs estimated' if fluid.binary_pairs else ''
+                self.stdout.write(f'{fluid.name}: {fluid.identifier} ({fluid.cost}, {fluid.probe_ms} ms{estimated})')
+            else:
+                self.stdout.write(f'{fluid.name}: unsupported, {fluid.reason}')
+        supported = sum(fluid.supported for fluid in registry.values())
+        self.stdout.write(self.style.SUCCESS(
+            f'{supported} of {len(registry)} refrigerants supported, resolved in {time.perf_counter() - start:.2f} s'))
@@ -0,0 +1,60 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.jobs import enqueue
+from myapp.models import DutyPoint
+from myapp.profiling import maybe_profile
+from myapp.projects import REEVALUATION_CHUNK_SIZE, reevaluate_pending, selection_changes
+
+
+class Command(BaseCommand):
+    help = ('Re-size saved duty points flagged by catalog changes, in chunks, '
+            'and report the ones that now select different parts.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=REEVALUATION_CHUNK_SIZE,
+                            help=f'Duty points evaluated per chunk (default: {REEVALUATION_CHUNK_SIZE})')
+        parser.add_argument('--all', action='store_true', help='Flag every saved duty point first')
+        parser.add_argument('--loop', action='store_true', help='Keep polling for flagged duty points')
+        parser.add_argument('--interval', type=float, default=30, help='Seconds between polls with --loop')
+        parser.add_argument('--report', action='store_true', help='Print the selection diff report when done')
+        parser.add_argument('--profile', action='store_true', help='Store a cProfile profile of each pass')
+        parser.add_argument('--queue', action='store_true',
+                            help='Queue the flagged duty points as a job for run_sizing_workers instead')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+        if options['all']:
+            flagged = DutyPoint.objects.update(needs_evaluation=True)
+            self.stdout.write(f'Flagged {flagged} duty points')
+
+        if options['queue']:
+            ids = list(DutyPoint.objects.filter(needs_evaluation=True).order_by('id').values_list('id', flat=True))
+            if not ids:
+                self.stdout.write('No flagged duty points')
+                return
+            job = enqueue('reevaluate', ids, {'duty_points': len(ids)}, options['chunk_size'])
+            self.stdout.write(self.style.SUCCESS(f'Queued job {job.id} with {job.total_chunks} chunks'))
+            return
+
+        while True:
+            start = time.perf_counter()
+            with maybe_profile(options['profile'], 'reevaluate_duty_points', {'chunk_size': options['chunk_size']}):
+                evaluated, changed = reevaluate_pending(options['chunk_size'])
+            if evaluated:
+                self.stdout.write(self.style.SUCCESS(
+                    f'Re-evaluated {evaluated} duty points in {time.perf_counter() - start:.2f} s, '
+                    f'{changed} now select different parts'))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        if options['report']:
+            rows = selection_changes()
+            if not rows:
+                self.stdout.write('No duty point selects different parts')
+            for row in rows:
+                self.stdout.write(f"{row['project']} / {row['duty_point']}: {row['part']} "
+                                  f"{row['previous'] or '-'} -> {row['current'] or '-'} ({row['changed']:%Y-%m-%d %H:%M})")
@@ -0,0 +1,81 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.jobs import claim_chunk, purge_expired, run_chunk
+from myapp.profiling import maybe_profile
+
+PURGE_INTERVAL = 60 * 60  # s between deletions of expired jobs
+
+
+class Command(BaseCommand):
+    help = ('Process queued sizing jobs. Each worker process claims one chunk at a time, '
+            'so workers can run on the web host next to gunicorn.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help='Worker processes (default: 1)')
+        parser.add_argument('--poll', type=float, default=2, help='Seconds between polls when idle (default: 2)')
+        parser.add_argument('--burst', action='store_true', help='Exit once no chunk is left to claim')
+        parser.add_argument('--profile', action='store_true', help='Store a cProfile profile of each chunk')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1')
+        if options['workers'] == 1:
+            self.work(options)
+            return
+
+        # Separate interpreters, so no database connection or CoolProp state is shared
+        command = [sys.executable, str(settings.BASE_DIR / 'manage.py'), 'run_sizing_workers',
+                   '--poll', str(options['poll'])]
+        command += ['--burst'] * options['burst'] + ['--profile'] * options['profile']
+        workers = [subprocess.Popen(command) for _ in range(options['workers'])]
+
+        def stop(*args):
+            for worker in workers:
+                worker.send_signal(signal.SIGTERM)
+
+        signal.signal(signal.SIGTERM, stop)
+        try:
+            for worker in workers:
+                worker.wait()
+        except KeyboardInterrupt:
+            stop()
+            for worker in workers:
+                worker.wait()
+
+    def work(self, options):
+        name = f'{socket.gethostname()}:{os.getpid()}'
+        stopping = []
+        # Finish the current chunk on SIGTERM instead of leaving it to the lease timeout
+        signal.signal(signal.SIGTERM, lambda *args: stopping.append(True))
+        self.stdout.write(f'Sizing worker {name} started')
+
+        last_purge = 0
+        while not stopping:
+            if time.monotonic() - last_purge > PURGE_INTERVAL:
+                purged = purge_expired()
+                if purged:
+                    self.stdout.write(f'Deleted {purged} expired job rows')
+                last_purge = time.monotonic()
+
+            chunk = claim_chunk(name)
+            if chunk is None:
+                if options['burst']:
+                    break
+                time.sleep(options['poll'])
+                continue
+
+            start = time.perf_counter()
+            with maybe_profile(options['profile'], f'sizing_job_{chunk.job.kind}',
+                               {'job': chunk.job_id, 'chunk': chunk.index, 'items': len(chunk.items)}):
+                status = run_chunk(chunk)
+            self.stdout.write(f'Job {chunk.job_id} chunk {chunk.index}: {status} '
+                              f'({len(chunk.items)} items, {time.perf_counter() - start:.2f} s)')
+        self.stdout.write(f'Sizing worker {name} stopped')
@@ -0,0 +1,41 @@
+# Generated by Django 5.0.6 on 2026-10-19 11:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0005_oilreceiver_oilseparator_oilseparatorreceiver_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='checkvalve',
+            index=models.Index(fields=['checkvalve_pressure', 'checkvalve_kv'], name='myapp_check_checkva_270afa_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='oilreceiver',
+            index=models.Index(fields=['oil_receiver_pressure_max', 'oil_receiver_volume'], name='myapp_oilre_oil_rec_23a210_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='oilseparator',
+            index=models.Index(fields=['accumulator_pressure_max', 'accumulator_discharge'], name='myapp_oilse_accumul_54fcf3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='oilseparatorreceiver',
+            index=models.Index(fields=['oil_separator_receiver_pressure_max', 'oil_separator_receiver_discharge'], name='myapp_oilse_oil_sep_8c49ce_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='receiver',
+            index=models.Index(fields=['receiver_refrigerant', 'receiver_maxpressure'], name='myapp_recei_receive_ecf42a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sightglass',
+            index=models.Index(fields=['sightglass_pressure', 'sightglass_conn'], name='myapp_sight_sightgl_841a82_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='suctionaccumulator',
+            index=models.Index(fields=['accumulator_conn', 'accumulator_pressuremax'], name='myapp_sucti_accumul_1a4379_idx'),
+        ),
+    ]
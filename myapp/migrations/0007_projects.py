@@ -0,0 +1,46 @@
+# Generated by Django 5.0.6 on 2026-10-19 12:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0006_compatibility_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Project',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DutyPoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(blank=True, max_length=100)),
+                ('inputs', models.JSONField()),
+                ('refrigerant', models.CharField(max_length=20)),
+                ('results', models.JSONField(blank=True, null=True)),
+                ('suction_conn', models.FloatField(blank=True, null=True)),
+                ('discharge_conn', models.FloatField(blank=True, null=True)),
+                ('needs_evaluation', models.BooleanField(default=True)),
+                ('evaluated', models.DateTimeField(blank=True, null=True)),
+                ('previous_results', models.JSONField(blank=True, null=True)),
+                ('selection_changed', models.DateTimeField(blank=True, null=True)),
+                ('compressor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='myapp.compressor')),
+                ('discharge_pipe', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='myapp.piping')),
+                ('suction_pipe', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='myapp.piping')),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='duty_points', to='myapp.project')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['needs_evaluation', 'id'], name='myapp_dutyp_needs_e_b0ef04_idx'), models.Index(fields=['refrigerant'], name='myapp_dutyp_refrige_5ef7e1_idx')],
+            },
+        ),
+    ]
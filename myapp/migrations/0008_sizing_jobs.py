@@ -0,0 +1,58 @@
+# Generated by Django 5.0.6 on 2026-10-19 12:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0007_projects'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SizingJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('batch', 'Batch sizing'), ('sweep', 'Catalog sweep'), ('reevaluate', 'Duty point re-evaluation')], max_length=20)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed'), ('cancelled', 'Cancelled')], default='queued', max_length=20)),
+                ('params', models.JSONField(blank=True, default=dict)),
+                ('total_chunks', models.IntegerField(default=0)),
+                ('done_chunks', models.IntegerField(default=0)),
+                ('total_items', models.IntegerField(default=0)),
+                ('done_items', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('started', models.DateTimeField(blank=True, null=True)),
+                ('finished', models.DateTimeField(blank=True, null=True)),
+                ('expires', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'id'], name='myapp_sizin_status_20eee3_idx'), models.Index(fields=['expires'], name='myapp_sizin_expires_f5ae39_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SizingJobChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.IntegerField()),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed'), ('cancelled', 'Cancelled')], default='queued', max_length=20)),
+                ('items', models.JSONField()),
+                ('results', models.JSONField(blank=True, null=True)),
+                ('attempts', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('worker', models.CharField(blank=True, max_length=100)),
+                ('claimed', models.DateTimeField(blank=True, null=True)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='myapp.sizingjob')),
+            ],
+            options={
+                'ordering': ['job', 'index'],
+                'indexes': [models.Index(fields=['status', 'id'], name='myapp_sizin_status_367862_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='sizingjobchunk',
+            constraint=models.UniqueConstraint(fields=('job', 'index'), name='unique_chunk_index'),
+        ),
+    ]
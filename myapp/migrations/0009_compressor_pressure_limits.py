@@ -0,0 +1,60 @@
+# Generated by Django 5.0.6 on 2026-10-19 12:15
+
+import math
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def saturation_temperature(pressure, quality, refrigerant):
+    # Frozen copy of CompressorPressureLimit.saturation_temperature
+    from CoolProp.CoolProp import PropsSI
+
+    try:
+        if pressure * 100000 >= PropsSI('Pcrit', refrigerant):
+            return math.inf
+        return PropsSI('T', 'P', pressure * 100000, 'Q', quality, refrigerant) - 273.15
+    except Exception:
+        return math.inf
+
+
+def populate_pressure_limits(apps, schema_editor):
+    Compressor = apps.get_model('myapp', 'Compressor')
+    CompressorPressureLimit = apps.get_model('myapp', 'CompressorPressureLimit')
+    rows = []
+    for compressor in Compressor.objects.all():
+        refrigerants = compressor.refrigerants if isinstance(compressor.refrigerants, list) else []
+        for refrigerant in dict.fromkeys(refrigerants):
+            rows.append(CompressorPressureLimit(
+                compressor_id=compressor.pk, refrigerant=refrigerant,
+                max_T_evap=saturation_temperature(compressor.max_pressure_lp, 1, refrigerant),
+                max_T_cond=saturation_temperature(compressor.max_pressure_hp, 0, refrigerant)))
+    CompressorPressureLimit.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0008_sizing_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompressorPressureLimit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('refrigerant', models.CharField(max_length=20)),
+                ('max_T_evap', models.FloatField()),
+                ('max_T_cond', models.FloatField()),
+                ('compressor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pressure_limits', to='myapp.compressor')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['refrigerant', 'max_T_evap', 'max_T_cond'], name='myapp_compr_refrige_af5fea_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='compressorpressurelimit',
+            constraint=models.UniqueConstraint(fields=('compressor', 'refrigerant'), name='unique_compressor_refrigerant'),
+        ),
+        migrations.RunPython(populate_pressure_limits, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.0.6 on 2026-10-19 12:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0009_compressor_pressure_limits'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompressorPolynomial',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('refrigerant', models.CharField(max_length=20)),
+                ('frequency', models.FloatField(default=50)),
+                ('superheat', models.FloatField(default=10)),
+                ('subcooling', models.FloatField(default=0)),
+                ('capacity', models.JSONField(help_text='10 AHRI 540 coefficients of the cooling capacity in W')),
+                ('power', models.JSONField(help_text='10 AHRI 540 coefficients of the power input in W')),
+                ('mass_flow', models.JSONField(help_text='10 AHRI 540 coefficients of the mass flow in kg/h')),
+                ('current', models.JSONField(blank=True, help_text='10 AHRI 540 coefficients of the current in A', null=True)),
+                ('compressor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='polynomials', to='myapp.compressor')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['refrigerant', 'frequency'], name='myapp_compr_refrige_c9efce_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='compressorpolynomial',
+            constraint=models.UniqueConstraint(fields=('compressor', 'refrigerant', 'frequency'), name='unique_compressor_polynomial'),
+        ),
+    ]
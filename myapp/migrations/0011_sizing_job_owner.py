@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-19 12:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0010_compressor_polynomials'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sizingjob',
+            name='owner',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+    ]
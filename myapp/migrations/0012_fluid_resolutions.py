@@ -0,0 +1,30 @@
+# Generated by Django 5.0.6 on 2026-10-19 13:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0011_sizing_job_owner'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FluidResolution',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=20)),
+                ('version', models.CharField(max_length=64)),
+                ('identifier', models.CharField(blank=True, max_length=50)),
+                ('cost', models.CharField(blank=True, max_length=10)),
+                ('probe_ms', models.FloatField(blank=True, null=True)),
+                ('reason', models.TextField(blank=True)),
+                ('binary_pairs', models.JSONField(blank=True, default=list)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='fluidresolution',
+            constraint=models.UniqueConstraint(fields=('name', 'version'), name='unique_fluid_resolution'),
+        ),
+    ]
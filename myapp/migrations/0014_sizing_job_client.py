@@ -0,0 +1,22 @@
+# Generated by Django 5.0.6 on 2026-10-19 13:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0013_catalog_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sizingjob',
+            name='client',
+            field=models.CharField(blank=True, max_length=45),
+        ),
+        migrations.AddIndex(
+            model_name='sizingjob',
+            index=models.Index(fields=['client', 'created'], name='myapp_sizin_client_cc1927_idx'),
+        ),
+    ]
@@ -1,7 +1,11 @@
-from django.db import models
-from CoolProp.CoolProp import PropsSI
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from .fluids import PropsSI
+from .transcritical import high_side_enthalpy, high_side_pressure, is_transcritical
+from .trace import enabled as tracing, record
 import json
 import math
+import numpy as np
 from shapely.geometry import Point, Polygon
 from scipy.optimize import fsolve
 
@@ -53,17 +57,19 @@ class Compressor(models.Model):
 
     def is_within_working_field(self, T_evap, T_cond):
         """Check if the given temperatures are within the working field."""
+        # Convert copies, the stored points must stay in Celsius
         points = [(point['T_evap'], point['T_cond']) for point in
-                  self.convert_temperatures_to_kelvin(self.working_field_points.copy())]
+                  self.convert_temperatures_to_kelvin([dict(point) for point in self.working_field_points])]
         polygon = Polygon(points)
         return polygon.contains(Point(T_evap + 273.15, T_cond + 273.15))
 
     def check_additional_constraints(self, T_evap, T_cond):
         """Check if the given temperatures satisfy additional constraints."""
-        constraints = self.convert_temperatures_to_kelvin(self.additional_constraints.copy())
         warnings = []
-        for constraint in constraints:
-            field_points = [(point['T_evap'], point['T_cond']) for point in constraint["field_points"]]
+        for constraint in self.additional_constraints:
+            # The constraint polygons are stored in Celsius like the working field
+            field_points = [(point['T_evap'], point['T_cond']) for point in
+                            self.convert_temperatures_to_kelvin([dict(point) for point in constraint["field_points"]])]
             polygon = Polygon(field_points)
             if polygon.contains(Point(T_evap + 273.15, T_cond + 273.15)):
                 warnings.append(constraint["message"])
@@ -93,26 +99,24 @@ class Compressor(models.Model):
         try:
             # Displacement in m³/h
             displacement = self.calculate_displacement(frequency)
-            print(f"Displacement (m³/h): {displacement}")
 
             # Convert displacement to m³/s
             displacement_m3_s = displacement / 3600
-            print(f"Displacement (m³/s): {displacement_m3_s}")
 
             # Adjust evaporating temperature for superheat
             T_evap_superheat = T_evap + superheat
 
             # Get density in kg/m³ at evaporating temperature (vapor phase)
             density = PropsSI('D', 'T', T_evap_superheat + 273.15, 'Q', 1, refrigerant)  # Vapor phase
-            print(f"Density (kg/m³): {density}")
-
 
             # Calculate mass flow rate in kg/s
             mass_flow_rate = displacement_m3_s * density
+            record('mass_flow_rate', compressor=self.pk, displacement=displacement, density=density,
+                   mass_flow_rate=mass_flow_rate)
             return mass_flow_rate
 
         except Exception as e:
-            print(f"Error in calculate_q_compressor: {e}")
+            record('mass_flow_rate_error', compressor=self.pk, error=str(e))
             return None
 
 
@@ -125,72 +129,221 @@ class Compressor(models.Model):
             gamma = cp / cv
             return gamma
         except Exception as e:
-            print(f"Error in calculate_gamma: {e}")
+            record('gamma_error', refrigerant=refrigerant, error=str(e))
             return None
 
-    def calculate_q_compressor(self, frequency, refrigerant, T_evap, T_cond, subcooling, superheat):
-        """Calculate the cooling capacity (q_compressor) based on the given parameters."""
+    @staticmethod
+    def calculate_cycle_state(refrigerant, T_evap, T_cond, subcooling, superheat, pressure_suction=None,
+                              pressure_discharge=None):
+        """Calculate the refrigerant states of the cycle, which are the same for every compressor.
+
+        Saturation pressures (Pa) already known for T_evap and T_cond can be passed in. Above the
+        critical point T_cond is the gas cooler outlet temperature and the discharge pressure the
+        one with the best COP (myapp.transcritical).
+        """
+        # Adjust evaporating temperature for superheat
+        T_evap_superheat = T_evap + superheat
+
+        # Calculate pressures
+        if pressure_suction is None:
+            pressure_suction = PropsSI('P', 'T', T_evap + 273.15, 'Q', 1, refrigerant)
+        if pressure_discharge is None:
+            pressure_discharge = high_side_pressure(refrigerant, T_cond, T_evap, superheat)
+        transcritical = is_transcritical(refrigerant, T_cond)
+
+        # Get density in kg/m³ at evaporating temperature (vapor phase)
+        density = PropsSI('D', 'T', (T_evap_superheat + 273.15), 'P', pressure_suction, refrigerant)
+
+        # Get enthalpy values in kJ/kg
+        h_evap = PropsSI('H', 'T', T_evap_superheat + 273.15, 'Q', 1,
+                         refrigerant) / 1000  # kJ/kg, vapor phase at evaporating temperature with superheat
+        # kJ/kg, liquid phase at condensing temperature with subcooling, or leaving the gas cooler
+        h_cond = high_side_enthalpy(refrigerant, T_cond, subcooling, pressure_discharge)
+
+        if transcritical:
+            # Isentropic compression to the gas cooler pressure
+            gamma = None
+            entropy = PropsSI('S', 'T', T_evap_superheat + 273.15, 'Q', 1, refrigerant)
+            T_discharge = PropsSI('T', 'P', pressure_discharge, 'S', entropy, refrigerant) - 273.15
+        else:
+            # Calculate gamma
+            gamma = Compressor.calculate_gamma(refrigerant, T_evap_superheat)  # Approximate, don't trust it
+
+            # Estimate discharge temperature
+            T_discharge = (T_evap_superheat + 273.15) * (pressure_discharge / pressure_suction) ** ((gamma - 1) / gamma) - 273.15
+        record('cycle_state', refrigerant=refrigerant, T_evap=T_evap, T_cond=T_cond, pressure_suction=pressure_suction,
+               pressure_discharge=pressure_discharge, density_suction=density, h_evap=h_evap, h_cond=h_cond,
+               gamma=gamma, T_discharge=T_discharge)
+
+        return {
+            'pressure_suction': pressure_suction,
+            'pressure_discharge': pressure_discharge,
+            'density_suction': density,
+            'h_evap': h_evap,
+            'h_cond': h_cond,
+            'T_discharge': T_discharge,
+            'transcritical': transcritical,
+        }
+
+    def calculate_q_compressor(self, frequency, refrigerant, T_evap, T_cond, subcooling, superheat, cycle_state=None):
+        """Calculate the cooling capacity (q_compressor) based on the given parameters.
+
+        Pass cycle_state from calculate_cycle_state when evaluating many compressors for the same duty.
+        """
         try:
+            if cycle_state is None:
+                cycle_state = self.calculate_cycle_state(refrigerant, T_evap, T_cond, subcooling, superheat)
+
             # Displacement in m³/h
             displacement = self.calculate_displacement(frequency)
-            print(f"Displacement (m³/h): {displacement}")
 
             # Convert displacement to m³/s
             displacement_m3_s = displacement / 3600
-            print(f"Displacement (m³/s): {displacement_m3_s}")
-
-            # Adjust evaporating temperature for superheat
-            T_evap_superheat = T_evap + superheat
-
-            # Adjust condensing temperature for subcooling
-            T_cond_subcooling = T_cond - subcooling
-
-            # Get density in kg/m³ at evaporating temperature (vapor phase)
-            pressure_evap = PropsSI('P', 'T', (T_evap + 273.15), 'Q', 1, refrigerant)
-            density = PropsSI('D', 'T', (T_evap_superheat + 273.15), 'P', pressure_evap, refrigerant)
-            print(f"Density (kg/m³): {density}")
-
 
             # Calculate mass flow rate in kg/s
-            mass_flow_rate = displacement_m3_s * density
-            print(f"Mass flow rate (kg/s): {mass_flow_rate}")
-
-            # Get enthalpy values in kJ/kg
-            h_evap = PropsSI('H', 'T', T_evap_superheat + 273.15, 'Q', 1,
-                             refrigerant) / 1000  # kJ/kg, vapor phase at evaporating temperature with superheat
-            h_cond = PropsSI('H', 'T', T_cond_subcooling + 273.15, 'Q', 0,
-                             refrigerant) / 1000  # kJ/kg, liquid phase at condensing temperature with subcooling
-            print(f"Enthalpy at evaporation (kJ/kg): {h_evap}")
-            print(f"Enthalpy at condensation (kJ/kg): {h_cond}")
-
-            # Calculate pressures
-            pressure_suction = PropsSI('P', 'T', T_evap + 273.15, 'Q', 1, refrigerant)
-            pressure_discharge = PropsSI('P', 'T', T_cond + 273.15, 'Q', 0, refrigerant)
-            print(f"Suction pressure (Pa): {pressure_suction}")
-            print(f"Discharge pressure (Pa): {pressure_discharge}")
-
-            # Calculate gamma
-            gamma = self.calculate_gamma(refrigerant, T_evap_superheat)
-            print(f"Aproximate Gamma do not trust(γ): {gamma}")
-
-            # Estimate discharge temperature
-            T_discharge = (T_evap_superheat + 273.15) * (pressure_discharge / pressure_suction) ** ((gamma - 1) / gamma) - 273.15
-            print(f"Estimated discharge temperature (°C): {T_discharge}")
-            density_discharge = PropsSI('D', 'T', T_discharge + 273.15, 'Q', 1, refrigerant)
+            mass_flow_rate = displacement_m3_s * cycle_state['density_suction']
 
             # Calculate q_compressor in kW
-            q_compressor = mass_flow_rate * (h_evap - h_cond)  # kW
-            print(f"Cooling capacity (kW): {q_compressor}")
+            q_compressor = mass_flow_rate * (cycle_state['h_evap'] - cycle_state['h_cond'])  # kW
+            record('q_compressor', compressor=self.pk, frequency=frequency, displacement=displacement,
+                   mass_flow_rate=mass_flow_rate, q_compressor=q_compressor)
 
-            return q_compressor, T_discharge, mass_flow_rate
+            return q_compressor, cycle_state['T_discharge'], mass_flow_rate
 
         except Exception as e:
-            print(f"Error in calculate_q_compressor: {e}")
+            record('q_compressor_error', compressor=self.pk, error=str(e))
             return None
 
     def __str__(self):
         return self.name
 
+class CompressorPressureLimit(models.Model):
+    """Saturation temperatures at a compressor's pressure limits, per refrigerant it is rated for.
+
+    Derived from max_pressure_lp/hp whenever compressors are saved or imported, so selection can
+    reject compressors with an indexed range query instead of a PropsSI call per compressor.
+    """
+    compressor = models.ForeignKey(Compressor, on_delete=models.CASCADE, related_name='pressure_limits')
+    refrigerant = models.CharField(max_length=20)
+    # inf when the limit is above the critical pressure or can't be computed, so the range check always passes
+    max_T_evap = models.FloatField()  # °C, dew point at max_pressure_lp
+    max_T_cond = models.FloatField()  # °C, bubble point at max_pressure_hp
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['compressor', 'refrigerant'], name='unique_compressor_refrigerant'),
+        ]
+        indexes = [
+            models.Index(fields=['refrigerant', 'max_T_evap', 'max_T_cond']),
+        ]
+
+    @staticmethod
+    def saturation_temperature(pressure, quality, refrigerant):
+        """Saturation temperature in °C at a pressure in bar (absolute, like the other catalog ratings)."""
+        try:
+            if pressure * 100000 >= PropsSI('Pcrit', refrigerant):
+                return math.inf
+            return PropsSI('T', 'P', pressure * 100000, 'Q', quality, refrigerant) - 273.15
+        except Exception as e:
+            record('saturation_temperature_error', refrigerant=refrigerant, pressure=pressure, error=str(e))
+            return math.inf
+
+    @classmethod
+    def refresh(cls, compressors=None):
+        """Recompute the limits of the given compressors, or of every compressor."""
+        temperatures = {}  # Many compressors share pressure ratings
+
+        def temperature(pressure, quality, refrigerant):
+            key = (pressure, quality, refrigerant)
+            if key not in temperatures:
+                temperatures[key] = cls.saturation_temperature(pressure, quality, refrigerant)
+            return temperatures[key]
+
+        rows = []
+        for compressor in (Compressor.objects.all() if compressors is None else compressors):
+            refrigerants = compressor.refrigerants if isinstance(compressor.refrigerants, list) else []
+            for refrigerant in dict.fromkeys(refrigerants):
+                rows.append(cls(compressor_id=compressor.pk, refrigerant=refrigerant,
+                                max_T_evap=temperature(compressor.max_pressure_lp, 1, refrigerant),
+                                max_T_cond=temperature(compressor.max_pressure_hp, 0, refrigerant)))
+
+        with transaction.atomic():
+            existing = cls.objects.all()
+            if compressors is not None:
+                existing = existing.filter(compressor__in=[compressor.pk for compressor in compressors])
+            existing.delete()
+            cls.objects.bulk_create(rows, batch_size=500)
+        return len(rows)
+
+    def __str__(self):
+        return f"{self.compressor} ({self.refrigerant})"
+
+
+class CompressorPolynomial(models.Model):
+    """AHRI 540 performance polynomials of a compressor for one refrigerant and frequency.
+
+    Each property is X = C1 + C2·S + C3·D + C4·S² + C5·S·D + C6·D² + C7·S³ + C8·D·S² + C9·S·D² + C10·D³
+    with S the evaporating (suction dew point) and D the condensing (discharge dew point) temperature in °C,
+    as published by the manufacturer for the stated superheat and subcooling.
+    """
+    COEFFICIENTS = 10
+    PROPERTIES = ['capacity', 'power', 'mass_flow', 'current']
+
+    compressor = models.ForeignKey(Compressor, on_delete=models.CASCADE, related_name='polynomials')
+    refrigerant = models.CharField(max_length=20)
+    frequency = models.FloatField(default=50)  # Hz
+    superheat = models.FloatField(default=10)  # K, rating conditions of the coefficients
+    subcooling = models.FloatField(default=0)  # K
+    capacity = models.JSONField(help_text='10 AHRI 540 coefficients of the cooling capacity in W')
+    power = models.JSONField(help_text='10 AHRI 540 coefficients of the power input in W')
+    mass_flow = models.JSONField(help_text='10 AHRI 540 coefficients of the mass flow in kg/h')
+    current = models.JSONField(null=True, blank=True, help_text='10 AHRI 540 coefficients of the current in A')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['compressor', 'refrigerant', 'frequency'],
+                                    name='unique_compressor_polynomial'),
+        ]
+        indexes = [
+            models.Index(fields=['refrigerant', 'frequency']),
+        ]
+
+    @staticmethod
+    def terms(T_evap, T_cond):
+        """The 10 polynomial terms of evaporating and condensing temperatures (°C), a row per term for arrays."""
+        S, D = T_evap, T_cond
+        return np.array(np.broadcast_arrays(1, S, D, S * S, S * D, D * D, S ** 3, D * S * S, S * D * D, D ** 3),
+                        dtype=float)
+
+    def evaluate(self, T_evap, T_cond):
+        """Capacity (kW), power (kW), COP, mass flow (kg/s) and current (A) at a duty."""
+        terms = self.terms(T_evap, T_cond)
+        capacity = float(np.dot(self.capacity, terms)) / 1000
+        power = float(np.dot(self.power, terms)) / 1000
+        return {
+            'capacity': capacity,
+            'power': power,
+            'cop': capacity / power if power > 0 else None,
+            'mass_flow_rate': float(np.dot(self.mass_flow, terms)) / 3600,
+            'current': float(np.dot(self.current, terms)) if self.current else None,
+        }
+
+    def clean(self):
+        errors = {}
+        for name in self.PROPERTIES:
+            coefficients = getattr(self, name)
+            if coefficients in (None, '') and name == 'current':
+                continue
+            if (not isinstance(coefficients, list) or len(coefficients) != self.COEFFICIENTS
+                    or not all(isinstance(c, (int, float)) and not isinstance(c, bool) for c in coefficients)):
+                errors[name] = f'Enter a list of {self.COEFFICIENTS} numbers'
+        if errors:
+            raise ValidationError(errors)
+
+    def __str__(self):
+        return f"{self.compressor} ({self.refrigerant}, {self.frequency:g} Hz)"
+
+
 class Piping(models.Model):
     PIPE_TYPE_CHOICES = [
         ('discharge', 'Discharge Line'),
@@ -215,34 +368,16 @@ class Piping(models.Model):
         area = math.pi * (inner_diameter_m / 2) ** 2
         # Velocity in meters per second
         velocity = mass_flow_rate / (density * area)
-        print(f"mass flow rate:{mass_flow_rate}")
-        print(f"density:{density}")
-        print(f"area:{area}")
-        print(f"velocity:{velocity}")
+        record('velocity', mass_flow_rate=mass_flow_rate, inner_diameter=inner_diameter, density=density,
+               area=area, velocity=velocity)
         return velocity
 
-    @staticmethod
-    def find_best_pipe(pipe_type, mass_flow_rate, density, target_velocity, available_pipes):
-        """Find the best pipe for the given pipe type (suction/discharge) based on velocity."""
-        best_pipe = None
-        min_diff = float('inf')
-
-        for pipe in available_pipes:
-            if pipe.pipe_type != pipe_type:
-                continue
-
-            velocity = Piping.calculate_velocity(mass_flow_rate, pipe.inner_diameter, density)
-            diff = abs(velocity - target_velocity)
-
-            if diff < min_diff:
-                min_diff = diff
-                best_pipe = pipe
-
-        return best_pipe
-
     @staticmethod
     def calculate_pressure_drop(pipe_length, temperature, diameter, velocity, pressure, density, refrigerant):
-        """Calculate the pressure drop in the pipe using the Darcy-Weisbach equation."""
+        """Calculate the pressure drop in the pipe using the Darcy-Weisbach equation.
+
+        The scalar reference of lines.flow(), which sizes every pipe at once; sizing doesn't call it.
+        """
         # Convert diameter from mm to meters
         diameter_m = diameter / 1000.0
 
@@ -266,9 +401,6 @@ class Piping(models.Model):
                     2.51 / (reynolds * friction ** 0.5) + (roughness_copper / 1000) / (
                                 3.72 * diameter_m))  # Solve Right side of Eqn
                 friction = friction - 0.000001  # Change Friction Factor
-                #  print(leftF)
-                #  print(rightF)
-                #  print(friction)
                 if (rightF - leftF <= 0):  # Check if Left = Right
                     break
             return friction
@@ -276,26 +408,18 @@ class Piping(models.Model):
         def SwameeJain(diameter_m, roughness_copper, reynolds):
             return 0.25 / (math.log10((roughness_copper / 1000) / (3.7 * diameter_m) + 5.74 / (reynolds ** 0.9))) ** 2
 
-        CWFriction = CalculateF(diameter_m, roughness_copper, reynolds)
         SJFriction = SwameeJain(diameter_m, roughness_copper, reynolds)
-
-        # Print results in nice 'table'
-        print("\n---------------RESULTS----------------")
-        print("Reynolds Number\t|\t{:.0f}".format(reynolds))
-        print("Velocity \t|\t{:.2f}\t(m/s)".format(velocity))
-        print("------------FRICTION FACTOR-----------")
-        print("Colebrook-White\t|\t{:.4f}".format(CWFriction))
-        print("Swamee-Jain\t|\t{:.4f}".format(SJFriction))
+        # Hagen-Poiseuille when laminar
+        friction = 64 / reynolds if reynolds < 2300 else SJFriction
 
         # Calculate pressure drop in Pascals
-        pressure_drop = SJFriction * (pipe_length / diameter_m) * (density * velocity ** 2) / 2
+        pressure_drop = friction * (pipe_length / diameter_m) * (density * velocity ** 2) / 2
 
-        # For debugging purposes
-        print(f"Diameter (m): {diameter_m}")
-        print(f"Viscosity (Pa.s): {viscosity}")
-        print(f"Reynolds number: {reynolds}")
-        print(f"Friction factor: {SJFriction}")
-        print(f"pressure drop {pressure_drop}")
+        if tracing():
+            # The iterative Colebrook-White factor only serves to check the Swamee-Jain approximation
+            record('pressure_drop', diameter=diameter_m, velocity=velocity, viscosity=viscosity, reynolds=reynolds,
+                   colebrook_white=CalculateF(diameter_m, roughness_copper, reynolds), swamee_jain=SJFriction,
+                   pipe_length=pipe_length, pressure_drop=pressure_drop)
 
         return pressure_drop
 
@@ -305,52 +429,6 @@ class Piping(models.Model):
         # return PropsSI('D', 'T', temperature + 273.15, 'Q', 1, refrigerant)
         return PropsSI('D', 'T', (temperature + 273.15), 'P', pressure, refrigerant)
 
-    @staticmethod
-    def pipe_parameters(refrigerant, T_evap, T_discharge, mass_flow_rate, pipe_length, T_cond,superheat, subcooling, inner_diameter):
-        """Get the best pipes for the suction and discharge lines based on the given parameters."""
-        pressure_discharge = PropsSI('P', 'T', (T_cond + 273.15), 'Q', 0, refrigerant)
-        pressure_suction = PropsSI('P', 'T', (T_evap + 273.15), 'Q', 1, refrigerant) * 1.01
-
-        density_suction = Piping.get_density(T_evap + superheat + 0.5, refrigerant,pressure_suction)  # Density at suction
-        density_discharge = Piping.get_density(T_discharge, refrigerant, pressure_discharge)  # Density at discharge
-
-
-        velocity_discharge = Piping.calculate_velocity(mass_flow_rate, inner_diameter, density_discharge)
-        pressure_drop_discharge = Piping.calculate_pressure_drop(pipe_length, T_discharge,inner_diameter, velocity_discharge,pressure_discharge, density_discharge, refrigerant)
-
-        velocity_suction = Piping.calculate_velocity(mass_flow_rate, inner_diameter, density_suction)
-        pressure_drop_suction = Piping.calculate_pressure_drop(pipe_length, T_evap, inner_diameter, velocity_suction, pressure_suction, density_suction,refrigerant)
-
-        return velocity_suction, pressure_drop_suction, velocity_discharge, pressure_drop_discharge
-
-    @staticmethod
-    def get_best_pipes(refrigerant, T_evap, T_discharge, mass_flow_rate, pipe_length, available_pipes, T_cond,superheat , subcooling):
-        """Get the best pipes for the suction and discharge lines based on the given parameters."""
-        # density_suction = Piping.get_density(T_evap+10 , refrigerant)  # Density at suction
-        # density_discharge = Piping.get_density(T_discharge, refrigerant)  # Density at discharge
-        print(f"tevap {T_evap}")
-        print(f"tcond {T_cond}")
-        print(f"tdisch {T_discharge}")
-        pressure_discharge = PropsSI('P', 'T', (T_cond + 273.15), 'Q', 0, refrigerant)
-        pressure_suction = PropsSI('P', 'T', (T_evap + 273.15), 'Q', 1, refrigerant)*1.01
-        print(f"pressure suction{pressure_suction}")
-        print(f"pressure discharge{pressure_discharge}")
-
-        density_suction = Piping.get_density(T_evap +superheat+0.5, refrigerant, pressure_suction)  # Density at suction
-        density_discharge = Piping.get_density(T_discharge , refrigerant, pressure_discharge)  # Density at discharge
-
-        suction_pipe = Piping.find_best_pipe('suction', mass_flow_rate, density_suction, 20, available_pipes)
-        discharge_pipe = Piping.find_best_pipe('discharge', mass_flow_rate, density_discharge, 15, available_pipes)
-
-        velocity_discharge = Piping.calculate_velocity(mass_flow_rate, discharge_pipe.inner_diameter,density_discharge)
-        pressure_drop_discharge = Piping.calculate_pressure_drop(pipe_length, T_discharge,discharge_pipe.inner_diameter, velocity_discharge, pressure_discharge, density_discharge, refrigerant)
-
-        velocity_suction = Piping.calculate_velocity(mass_flow_rate, suction_pipe.inner_diameter,density_suction)
-        pressure_drop_suction = Piping.calculate_pressure_drop(pipe_length, T_evap,suction_pipe.inner_diameter, velocity_suction,pressure_suction, density_suction, refrigerant)
-
-        return velocity_suction, pressure_drop_suction, suction_pipe, discharge_pipe, velocity_discharge, pressure_drop_discharge
-
-
     @staticmethod
     def get_allowed_sizes(connection_size, standard_sizes):
         """
@@ -387,6 +465,9 @@ class Receiver(models.Model):
     receiver_refrigerant = models.CharField(max_length=50, help_text="Type of refrigerant the receiver is compatible with")
     receiver_orientation = models.CharField(max_length=10,choices=ORIENTATION_CHOICES,)  # Use the defined choices variabledefault='vertical',  # Default valuehelp_text="Orientation of the receiver: Vertical or Horizontal"
 
+    class Meta:
+        indexes = [models.Index(fields=['receiver_refrigerant', 'receiver_maxpressure'])]
+
     def __str__(self):
         return self.name
 
@@ -400,9 +481,18 @@ class CheckValve(models.Model):
     checkvalve_mintemperature = models.FloatField()
     checkvalve_maxtemperature = models.FloatField()
 
+    class Meta:
+        indexes = [models.Index(fields=['checkvalve_pressure', 'checkvalve_kv'])]
+
     def __str__(self):
         return f"{self.checkvalve_name} ({self.checkvalve_model})"
 
+    @staticmethod
+    def calculate_required_kv(mass_flow_rate, density, pressure_drop):
+        """Kv (m³/h at 1 bar) passing the mass flow (kg/s) of a fluid of the given density (kg/m³) at pressure_drop (bar)."""
+        volume_flow = mass_flow_rate * 3600 / density  # m³/h
+        return volume_flow * math.sqrt(density / 1000 / pressure_drop)
+
 class SightGlass(models.Model):
     sightglass_model = models.CharField(max_length=20)
     manufacturer = models.CharField(max_length=20)
@@ -410,8 +500,11 @@ class SightGlass(models.Model):
     sightglass_pressure = models.FloatField()
     sightglass_refrigerants = models.JSONField()  # List of refrigerants
 
+    class Meta:
+        indexes = [models.Index(fields=['sightglass_pressure', 'sightglass_conn'])]
+
     def __str__(self):
-        return f"{self.sightglass_model} ({self.sightglass_manufacturer})"
+        return f"{self.sightglass_model} ({self.manufacturer})"
 
 class SuctionAccumulator(models.Model):
     accumulator_model = models.CharField(max_length=20)
@@ -423,8 +516,11 @@ class SuctionAccumulator(models.Model):
     accumulator_tempmax = models.FloatField()
     accumulator_refrigerants = models.JSONField()  # List of refrigerants
 
+    class Meta:
+        indexes = [models.Index(fields=['accumulator_conn', 'accumulator_pressuremax'])]
+
     def __str__(self):
-        return f"{self.accumulator_model} ({self.accumulator_manufacturer})"
+        return f"{self.accumulator_model} ({self.manufacturer})"
 
 
 class OilSeparator(models.Model):
@@ -438,6 +534,9 @@ class OilSeparator(models.Model):
     accumulator_discharge = models.FloatField()  # m3/h
     accumulator_refrigerants = models.JSONField()  # List of refrigerants
 
+    class Meta:
+        indexes = [models.Index(fields=['accumulator_pressure_max', 'accumulator_discharge'])]
+
     def __str__(self):
         return f"{self.oil_separator_model} ({self.manufacturer})"
 
@@ -453,6 +552,9 @@ class OilSeparatorReceiver(models.Model):
     oil_separator_receiver_discharge = models.FloatField()  # m3/h
     oil_separator_receiver_refrigerants = models.JSONField()  # List of refrigerants
 
+    class Meta:
+        indexes = [models.Index(fields=['oil_separator_receiver_pressure_max', 'oil_separator_receiver_discharge'])]
+
     def __str__(self):
         return f"{self.oil_separator_receiver_model} ({self.manufacturer})"
 
@@ -467,6 +569,9 @@ class OilReceiver(models.Model):
     oil_receiver_volume = models.FloatField()
     oil_receiver_refrigerants = models.JSONField()  # List of refrigerants
 
+    class Meta:
+        indexes = [models.Index(fields=['oil_receiver_pressure_max', 'oil_receiver_volume'])]
+
     def __str__(self):
         return f"{self.oil_receiver_model} ({self.manufacturer})"
 
@@ -495,6 +600,144 @@ class SolenoidValve(models.Model):
     def __str__(self):
         return self.name
 
+
+class Project(models.Model):
+    name = models.CharField(max_length=100, unique=True)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
+
+
+class DutyPoint(models.Model):
+    """Saved sizing inputs with the parts they selected, re-evaluated when the catalog changes."""
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='duty_points')
+    name = models.CharField(max_length=100, blank=True)
+    inputs = models.JSONField()  # Parsed part_list parameters (sizing.parse_duty)
+    refrigerant = models.CharField(max_length=20)
+    results = models.JSONField(null=True, blank=True)  # Compressor, pipes, velocities, pressure drops, warnings
+    compressor = models.ForeignKey(Compressor, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    suction_pipe = models.ForeignKey(Piping, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    discharge_pipe = models.ForeignKey(Piping, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    # Compressor connections decide which pipe sizes a duty point can use
+    suction_conn = models.FloatField(null=True, blank=True)
+    discharge_conn = models.FloatField(null=True, blank=True)
+    needs_evaluation = models.BooleanField(default=True)
+    evaluated = models.DateTimeField(null=True, blank=True)
+    # Results before the last re-evaluation that selected different parts
+    previous_results = models.JSONField(null=True, blank=True)
+    selection_changed = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['needs_evaluation', 'id']),
+            models.Index(fields=['refrigerant']),
+        ]
+
+    def __str__(self):
+        return f"{self.project}: {self.name or self.pk}"
+
+
+class SizingJob(models.Model):
+    """Long-running sizing work split into chunks, processed by run_sizing_workers."""
+    KIND_CHOICES = [
+        ('batch', 'Batch sizing'),
+        ('sweep', 'Catalog sweep'),
+        ('reevaluate', 'Duty point re-evaluation'),
+    ]
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+        ('cancelled', 'Cancelled'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    owner = models.CharField(max_length=32, blank=True)  # Session token of the submitter, blank for commands
+    client = models.CharField(max_length=45, blank=True)  # Address the job's items are charged to (jobs._charge)
+    params = models.JSONField(default=dict, blank=True)
+    total_chunks = models.IntegerField(default=0)
+    done_chunks = models.IntegerField(default=0)
+    total_items = models.IntegerField(default=0)
+    done_items = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    expires = models.DateTimeField(null=True, blank=True)  # Results are deleted after this
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id']),
+            models.Index(fields=['expires']),
+            models.Index(fields=['client', 'created']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.pk} ({self.status})"
+
+
+class SizingJobChunk(models.Model):
+    """A slice of a job's items; a worker claims it, sizes the items and stores the results."""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+        ('cancelled', 'Cancelled'),
+    ]
+
+    job = models.ForeignKey(SizingJob, on_delete=models.CASCADE, related_name='chunks')
+    index = models.IntegerField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    items = models.JSONField()  # Parsed duties, or duty point ids for re-evaluation
+    results = models.JSONField(null=True, blank=True)
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+    claimed = models.DateTimeField(null=True, blank=True)  # Lease start, stale leases are retried
+
+    class Meta:
+        ordering = ['job', 'index']
+        indexes = [
+            models.Index(fields=['status', 'id']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['job', 'index'], name='unique_chunk_index'),
+        ]
+
+    def __str__(self):
+        return f"{self.job} chunk {self.index}"
+
+
+class FluidResolution(models.Model):
+    """A catalog refrigerant resolved by fluids.resolve, kept until CoolProp or the probe changes."""
+    name = models.CharField(max_length=20)
+    version = models.CharField(max_length=64)  # CoolProp version and probe digest it was resolved with
+    identifier = models.CharField(max_length=50, blank=True)  # Blank when unsupported
+    cost = models.CharField(max_length=10, blank=True)
+    probe_ms = models.FloatField(null=True, blank=True)
+    reason = models.TextField(blank=True)
+    binary_pairs = models.JSONField(default=list, blank=True)  # CAS pairs estimated by the linear mixing rule
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'version'], name='unique_fluid_resolution'),
+        ]
+
+    def __str__(self):
+        return f"{self.name}: {self.identifier or self.reason}"
+
+class CatalogVersion(models.Model):
+    """The single row holding the catalog version, the time (ns) of the last catalog change."""
+    version = models.BigIntegerField()
+
+    def __str__(self):
+        return str(self.version)
+
 # Refrigerant dictionaries
 refrigerants = {
     'HCFCs': {
@@ -508,7 +751,7 @@ refrigerants = {
         'R438A': 'R438A', 'R442A': 'R442A', 'R448A': 'R448A', 'R449A': 'R449A', 'R449B': 'R449B',
         'R450A': 'R450A', 'R452A': 'R452A', 'R452B': 'R452B', 'R452C': 'R452C', 'R454A': 'R454A',
         'R454B': 'R454B', 'R454C': 'R454C', 'R455A': 'R455A', 'R463A': 'R463A', 'R469A': 'R469A',
-        'R471A': 'R471A'
+        'R471A': 'R471A', 'R143a': 'HFC-143a'
     },
     'HFOs': {
         'R1234yf': 'HFO-1234yf', 'R1234ze': 'HFO-1234ze'
@@ -524,7 +767,7 @@ refrigerants = {
     },
     'Blends': {
         'R502': 'R502', 'R503': 'R503', 'R507A': 'R507A', 'R508B': 'R508B', 'R513A': 'R513A',
-        'R513B': 'R513B', 'R515B': 'R515B', 'R516A': 'R516A'
+        'R513B': 'R513B', 'R515B': 'R515B', 'R516A': 'R516A', 'R508A': 'R508A'
     },
     'Other': {
         'R1150': 'Ethylene', 'R1233zd': 'HFO-1233zd', 'R1336mzz': 'HFO-1336mzz'
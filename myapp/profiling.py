@@ -0,0 +1,126 @@
+"""Opt-in cProfile profiling of requests and batch code, stored on disk for the admin.
+
+Staff can profile a single request with ``?profile=1`` or an ``X-Profile: 1`` header.
+Batch code wraps its work in ``profile()`` (or ``maybe_profile()``) directly.
+"""
+import cProfile
+import json
+import pstats
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.conf import settings
+
+PROFILE_KEEP = 200  # Profiles kept on disk, oldest are deleted first
+
+
+def profile_dir():
+    return Path(settings.PROFILE_DIR)
+
+
+@contextmanager
+def profile(label, params=None):
+    """Profile the block and store the result; yields a dict that receives the profile id."""
+    info = {'id': None}
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    profiler.enable()
+    try:
+        yield info
+    finally:
+        profiler.disable()
+        info['id'] = save_profile(profiler, label, params or {}, time.perf_counter() - start)
+
+
+def maybe_profile(enabled, label, params=None):
+    """profile() when enabled, a no-op context otherwise."""
+    return profile(label, params) if enabled else nullcontext({'id': None})
+
+
+def save_profile(profiler, label, params, duration):
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    created = datetime.now(timezone.utc)
+    profile_id = f'{created:%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}'
+
+    profiler.dump_stats(directory / f'{profile_id}.prof')
+    with open(directory / f'{profile_id}.json', 'w') as f:
+        json.dump({
+            'id': profile_id,
+            'label': label,
+            'params': params,
+            'duration': duration,
+            'created': created.isoformat(),
+        }, f)
+
+    for old in sorted(directory.glob('*.json'))[:-PROFILE_KEEP]:
+        old.unlink(missing_ok=True)
+        old.with_suffix('.prof').unlink(missing_ok=True)
+    return profile_id
+
+
+def recent_profiles(limit=20):
+    """Metadata of the most recent stored profiles, newest first."""
+    profiles = []
+    for path in sorted(profile_dir().glob('*.json'), reverse=True)[:limit]:
+        try:
+            with open(path) as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return profiles
+
+
+def profile_path(profile_id):
+    path = profile_dir() / f'{profile_id}.prof'
+    # Ids come from URLs, make sure they can't point outside the profile directory
+    if path.parent != profile_dir() or not path.exists():
+        return None
+    return path
+
+
+def top_functions(profile_id, limit=20):
+    """The functions with the highest cumulative time in a stored profile."""
+    path = profile_path(profile_id)
+    if path is None:
+        return []
+    stats = pstats.Stats(str(path))
+    stats.sort_stats('cumulative')
+    rows = []
+    for func in stats.fcn_list[:limit]:
+        primitive_calls, calls, total_time, cumulative_time, _ = stats.stats[func]
+        rows.append({
+            'function': pstats.func_std_string(func),
+            'calls': calls,
+            'tottime': total_time,
+            'cumtime': cumulative_time,
+        })
+    return rows
+
+
+class ProfilingMiddleware:
+    """Profile requests from staff users that ask for it; the response carries X-Profile-Id."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not self.wants_profile(request):
+            return self.get_response(request)
+
+        params = {key: values if len(values) > 1 else values[0] for key, values in request.GET.lists()}
+        params.pop('profile', None)
+        with profile(f'{request.method} {request.path}', params) as info:
+            response = self.get_response(request)
+        response['X-Profile-Id'] = info['id']
+        return response
+
+    @staticmethod
+    def wants_profile(request):
+        if request.GET.get('profile') != '1' and request.headers.get('X-Profile') != '1':
+            return False
+        user = getattr(request, 'user', None)
+        return bool(user and user.is_staff)
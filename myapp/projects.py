@@ -0,0 +1,188 @@
+"""Saved duty points: evaluation, re-evaluation after catalog changes and selection diff reports.
+
+Catalog signals only flag the duty points a change can affect (one UPDATE query);
+the reevaluate_duty_points command re-sizes flagged points in chunks outside the
+web workers.
+"""
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .coalesce import Overloaded
+from .fluids import check_supported
+from .indexes import compressor_index
+from .lines import standard_pipe_sizes
+from .models import Compressor, CompressorPolynomial, DutyPoint, Piping
+from .sizing import get_sizing
+
+REEVALUATION_CHUNK_SIZE = 500
+SELECTION_FIELDS = ['compressor', 'suction_pipe', 'discharge_pipe']
+RESULT_FIELDS = ['results', 'compressor', 'suction_pipe', 'discharge_pipe', 'suction_conn', 'discharge_conn',
+                 'evaluated', 'previous_results', 'selection_changed']
+
+
+def evaluate(inputs, compressors=None):
+    """Size saved inputs and summarize the selected parts the way a DutyPoint stores them."""
+    results = {field: None for field in SELECTION_FIELDS}
+    try:
+        check_supported(inputs['refrigerant'])
+        sizing = get_sizing(inputs)
+    except Overloaded:
+        raise  # A 503 for the request rather than a failed result
+    except Exception as e:
+        results['warnings'] = [f'Sizing failed: {e}']
+        return results
+
+    compressor = sizing['compressor']
+    warnings = []
+    if compressor is None:
+        warnings.append('No suitable compressor found')
+    else:
+        results['compressor'] = {
+            'id': compressor['id'],
+            'name': compressor['name'],
+            'q_compressor': compressor['q_compressor'],
+            'T_discharge': compressor['T_discharge'],
+            'mass_flow_rate': compressor['mass_flow_rate'],
+            'suction_conn': compressor['suction_conn'],
+            'discharge_conn': compressor['discharge_conn'],
+        }
+        if compressor.get('undersized'):
+            warnings.append(f"Undersized once coupled with the suction line: {compressor['coupled_q_compressor']:.2f} kW")
+        instance = (compressors or {}).get(compressor['id'])
+        if instance is not None:
+            warnings += instance.check_additional_constraints(inputs['T_evap'], inputs['T_cond'])
+
+        for pipe_type in ('suction', 'discharge'):
+            pipe = sizing[f'{pipe_type}_pipe']
+            if pipe is None:
+                warnings.append(f'No {pipe_type} pipe of an allowed size')
+                continue
+            results[f'{pipe_type}_pipe'] = {key: pipe[key] for key in
+                                            ('id', 'name', 'outer_diameter', 'velocity', 'pressure_drop')}
+
+    results['warnings'] = warnings
+    return results
+
+
+def selection(results):
+    """Ids of the selected parts in stored results."""
+    return {field: ((results or {}).get(field) or {}).get('id') for field in SELECTION_FIELDS}
+
+
+def apply_results(duty_point, results, now):
+    """Store results on the duty point; returns True when a re-evaluation selected different parts."""
+    changed = duty_point.evaluated is not None and selection(duty_point.results) != selection(results)
+    if changed:
+        duty_point.previous_results = duty_point.results
+        duty_point.selection_changed = now
+
+    compressor = results['compressor'] or {}
+    duty_point.results = results
+    duty_point.compressor_id = compressor.get('id')
+    duty_point.suction_pipe_id = (results['suction_pipe'] or {}).get('id')
+    duty_point.discharge_pipe_id = (results['discharge_pipe'] or {}).get('id')
+    duty_point.suction_conn = compressor.get('suction_conn')
+    duty_point.discharge_conn = compressor.get('discharge_conn')
+    duty_point.evaluated = now
+    return changed
+
+
+def catalog_compressors():
+    """Compressor instances by id from the in-process index, so evaluation needs no queries for them."""
+    return {compressor.id: compressor for compressor in compressor_index().compressors}
+
+
+def save_duty_point(project, name, inputs):
+    duty_point = DutyPoint(project=project, name=name, inputs=inputs, refrigerant=inputs['refrigerant'],
+                           needs_evaluation=False)
+    apply_results(duty_point, evaluate(inputs, catalog_compressors()), timezone.now())
+    duty_point.save()
+    return duty_point
+
+
+def affected_duty_points(instance):
+    """Saved duty points whose selection a change to this catalog row can alter."""
+    if isinstance(instance, Compressor):
+        # Compressor selection requires the exact refrigerant name
+        refrigerants = instance.refrigerants if isinstance(instance.refrigerants, list) else []
+        return DutyPoint.objects.filter(Q(refrigerant__in=refrigerants) | Q(compressor_id=instance.pk))
+
+    if isinstance(instance, CompressorPolynomial):
+        return DutyPoint.objects.filter(Q(refrigerant=instance.refrigerant) | Q(compressor_id=instance.compressor_id))
+
+    if isinstance(instance, Piping):
+        affected = Q(suction_pipe_id=instance.pk) | Q(discharge_pipe_id=instance.pk)
+        if instance.pipe_type in ('suction', 'discharge'):
+            # Connections for which this pipe is one of the allowed sizes
+            connections = [size for size in standard_pipe_sizes
+                           if instance.outer_diameter in Piping.get_allowed_sizes(size, standard_pipe_sizes)]
+            affected |= Q(**{f'{instance.pipe_type}_conn__in': connections})
+        return DutyPoint.objects.filter(affected)
+
+    return DutyPoint.objects.none()
+
+
+def mark_affected(instance):
+    return affected_duty_points(instance).filter(needs_evaluation=False).update(needs_evaluation=True)
+
+
+def mark_all(model):
+    """Flag every duty point after a bulk change (imports skip the per-row signals)."""
+    if model not in (Compressor, Piping):
+        return 0
+    return DutyPoint.objects.filter(needs_evaluation=False).update(needs_evaluation=True)
+
+
+def reevaluate_chunk(chunk):
+    """Re-evaluate a list of duty points; returns how many now select different parts."""
+    # Clear the flag first so a catalog change made while this chunk runs flags it again
+    DutyPoint.objects.filter(id__in=[duty_point.id for duty_point in chunk]).update(needs_evaluation=False)
+
+    compressors = catalog_compressors()
+    now = timezone.now()
+    changed = 0
+    for duty_point in chunk:
+        changed += apply_results(duty_point, evaluate(duty_point.inputs, compressors), now)
+    with transaction.atomic():
+        DutyPoint.objects.bulk_update(chunk, RESULT_FIELDS)
+    return changed
+
+
+def reevaluate_pending(chunk_size=REEVALUATION_CHUNK_SIZE, max_chunks=None):
+    """Re-evaluate flagged duty points chunk by chunk; returns (evaluated, changed)."""
+    evaluated = changed = chunks = 0
+    last_id = 0
+    while max_chunks is None or chunks < max_chunks:
+        chunk = list(DutyPoint.objects.filter(needs_evaluation=True, id__gt=last_id).order_by('id')[:chunk_size])
+        if not chunk:
+            break
+        changed += reevaluate_chunk(chunk)
+        last_id = chunk[-1].id
+        evaluated += len(chunk)
+        chunks += 1
+    return evaluated, changed
+
+
+def selection_changes(project=None):
+    """One row per part that the last re-evaluation of a duty point selected differently."""
+    duty_points = DutyPoint.objects.filter(selection_changed__isnull=False).select_related('project')
+    if project is not None:
+        duty_points = duty_points.filter(project=project)
+
+    rows = []
+    for duty_point in duty_points.order_by('project__name', 'id').iterator():
+        previous = duty_point.previous_results or {}
+        current = duty_point.results or {}
+        for field in SELECTION_FIELDS:
+            old, new = previous.get(field) or {}, current.get(field) or {}
+            if old.get('id') != new.get('id'):
+                rows.append({
+                    'project': duty_point.project.name,
+                    'duty_point': duty_point.name or duty_point.pk,
+                    'part': field,
+                    'previous': old.get('name'),
+                    'current': new.get('name'),
+                    'changed': duty_point.selection_changed,
+                })
+    return rows
@@ -0,0 +1,23 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .catalog import bump_catalog_version
+from .projects import mark_affected
+from .models import (CheckValve, Compressor, CompressorPolynomial, CompressorPressureLimit, ExpansionValve, OilReceiver, OilSeparator,
+                     OilSeparatorReceiver, Piping, Receiver, SightGlass, SolenoidValve, SuctionAccumulator)
+
+CATALOG_MODELS = [Compressor, CompressorPolynomial, Piping, Receiver, CheckValve, SightGlass, SuctionAccumulator, OilSeparator,
+                  OilSeparatorReceiver, OilReceiver, ExpansionValve, SolenoidValve]
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def catalog_changed(sender, **kwargs):
+    """Any change to a catalog model invalidates cached sizing results."""
+    if sender in CATALOG_MODELS:
+        if sender is Compressor and 'created' in kwargs:
+            # Before the version bump, so nothing sized for the new version sees stale limits
+            CompressorPressureLimit.refresh([kwargs['instance']])
+        bump_catalog_version()
+        # Saved duty points are only flagged here, reevaluate_duty_points re-sizes them
+        mark_affected(kwargs['instance'])
@@ -0,0 +1,215 @@
+"""Annual bin-hour energy simulation of shortlisted compressors.
+
+A profile gives the ambient temperature and cooling load of each hour, or of bins of hours.
+The condensing temperature follows the ambient down to a floating head pressure minimum, and
+each compressor runs at the frequency matching the load: cycling on and off below its minimum
+speed, leaving load unmet above its maximum. All rows are evaluated at once per compressor,
+with refrigerant properties interpolated from a table over the profile's condensing
+temperatures, so a year costs a few dozen PropsSI calls rather than one per hour and compressor.
+"""
+import csv
+import io
+
+import numpy as np
+from django.core.cache import cache
+from shapely import contains_xy
+from shapely.geometry import Polygon
+
+from .fluids import PropsSI
+from .indexes import compressor_index, polynomial_index, rating_correction
+from .lines import FREQUENCY_RANGE
+from .models import CompressorPolynomial
+from .sizing import compressor_capacities, cycle_state, pressure_rated_compressors
+from .timing import span
+from .trace import record
+from .transcritical import high_side_enthalpy, high_side_pressure
+
+CONDENSER_APPROACH = 10  # K, condensing temperature above ambient
+MIN_T_COND = 25  # °C, floating head pressure limit
+ISENTROPIC_EFFICIENCY = 0.65  # Power estimate of compressors without AHRI 540 power coefficients
+SIMULATION_SHORTLIST = 10  # Compressors closest to the design capacity when none are named
+SIMULATION_MAX_ROWS = 8784  # An hourly leap year
+TABLE_STEP = 1  # K between condensing temperatures of the property table
+TABLE_TIMEOUT = 60 * 60  # s
+
+
+def _column(row, name, number, default=None):
+    value = (row.get(name) or '').strip()
+    if not value:
+        if default is None:
+            raise ValueError(f'row {number}: {name} is required')
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f'row {number}: {name} must be a number')
+
+
+def parse_profile(text, q_capacity):
+    """Hours, ambient temperature (°C) and load (kW) per row of a profile CSV.
+
+    Columns are t_ambient and either load (kW) or load_fraction (of the design q_capacity), with
+    an optional hours column for binned profiles (1 per row otherwise).
+    """
+    rows = list(csv.DictReader(io.StringIO(text)))
+    if not rows:
+        raise ValueError('the profile has no rows')
+    if len(rows) > SIMULATION_MAX_ROWS:
+        raise ValueError(f'the profile has {len(rows)} rows, at most {SIMULATION_MAX_ROWS} are allowed')
+    if 'load' not in rows[0] and 'load_fraction' not in rows[0]:
+        raise ValueError('the profile needs a load or load_fraction column')
+
+    hours, t_ambient, load = np.empty((3, len(rows)))
+    for i, row in enumerate(rows):
+        number = i + 1
+        hours[i] = _column(row, 'hours', number, 1)
+        t_ambient[i] = _column(row, 't_ambient', number)
+        if 'load' in row:
+            load[i] = _column(row, 'load', number)
+        else:
+            load[i] = _column(row, 'load_fraction', number) * q_capacity
+        if hours[i] < 0 or load[i] < 0:
+            raise ValueError(f'row {number}: hours and load must not be negative')
+    return {'hours': hours, 't_ambient': t_ambient, 'load': load}
+
+
+def condensing_table(duty, T_min, T_max):
+    """Liquid enthalpy and isentropic discharge enthalpy (kJ/kg) over condensing temperatures (°C).
+
+    The suction state is the one Compressor.calculate_cycle_state uses; transcritical temperatures
+    are gas cooler outlets at their optimal pressure.
+    """
+    refrigerant = duty['refrigerant']
+    temperatures = np.arange(np.floor(T_min), np.ceil(T_max) + TABLE_STEP, TABLE_STEP)
+    key = (f"simulation_table:{refrigerant}:{duty['T_evap']}:{duty['superheat']}:{duty['subcooling']}:"
+           f"{temperatures[0]}:{temperatures[-1]}")
+    table = cache.get(key)
+    if table is None:
+        entropy = PropsSI('S', 'T', duty['T_evap'] + duty['superheat'] + 273.15, 'Q', 1, refrigerant)
+        h_liquid, h_isentropic = np.empty((2, len(temperatures)))
+        for i, T in enumerate(temperatures):
+            pressure = high_side_pressure(refrigerant, T, duty['T_evap'], duty['superheat'])
+            h_liquid[i] = high_side_enthalpy(refrigerant, T, duty['subcooling'], pressure)
+            h_isentropic[i] = PropsSI('H', 'P', pressure, 'S', entropy, refrigerant) / 1000
+        table = {'temperature': temperatures, 'h_liquid': h_liquid, 'h_isentropic': h_isentropic}
+        cache.set(key, table, TABLE_TIMEOUT)
+    return table
+
+
+def shortlist(duty, cycle, ids=None):
+    """Compressors of the catalog index by the given ids, or those closest to the design capacity."""
+    index = compressor_index()
+    if ids:
+        missing = [compressor_id for compressor_id in ids if compressor_id not in index.by_id]
+        if missing:
+            raise ValueError(f"unknown compressors {', '.join(map(str, missing))}")
+        return [index.by_id[compressor_id] for compressor_id in ids]
+
+    required = duty['q_capacity'] / duty['circuits']
+    capacities = compressor_capacities(duty, cycle, pressure_rated_compressors(duty))
+    capacities.sort(key=lambda capacity: abs(capacity['q_compressor'] - required))
+    return [index.by_id[capacity['id']] for capacity in capacities[:SIMULATION_SHORTLIST]]
+
+
+def rated_performance(duty, compressor, T_cond, cycle, table):
+    """Frequency (Hz), capacity (kW) and power (kW) of the compressor at full load per row.
+
+    AHRI 540 coefficients are used at their rated frequency, corrected to the duty's superheat and
+    subcooling; other compressors are rated at the duty frequency from displacement × density × Δh
+    and an isentropic efficiency.
+    """
+    polynomial = polynomial_index().nearest(duty['refrigerant'], compressor.id, duty['frequency'])
+    if polynomial is not None:
+        frequency, coefficients, rating = polynomial
+        terms = CompressorPolynomial.terms(duty['T_evap'], T_cond)
+        # Corrected to the duty's superheat and subcooling over the table, interpolated per row
+        mass_factor, capacity_factor = np.array([
+            rating_correction(duty['refrigerant'], duty['T_evap'], float(T), duty['superheat'], duty['subcooling'],
+                              *rating) for T in table['temperature']]).T
+        capacity = coefficients['capacity'] @ terms / 1000 * np.interp(T_cond, table['temperature'], capacity_factor)
+        power = coefficients['power'] @ terms / 1000 * np.interp(T_cond, table['temperature'], mass_factor)
+        return frequency, capacity, power, 'polynomial'
+
+    frequency = duty['frequency']
+    mass_flow_rate = compressor.calculate_displacement(frequency) / 3600 * cycle['density_suction']
+    h_liquid = np.interp(T_cond, table['temperature'], table['h_liquid'])
+    h_isentropic = np.interp(T_cond, table['temperature'], table['h_isentropic'])
+    capacity = mass_flow_rate * (cycle['h_evap'] - h_liquid)
+    power = mass_flow_rate * (h_isentropic - cycle['h_evap']) / ISENTROPIC_EFFICIENCY
+    return frequency, capacity, power, 'displacement'
+
+
+def simulate_compressor(duty, compressor, profile, T_cond, cycle, table, speeds):
+    """Seasonal totals of one compressor per circuit, scaled to every circuit of the duty."""
+    hours = profile['hours']
+    required = profile['load'] / duty['circuits']  # kW per circuit
+    rated_frequency, capacity, power, model = rated_performance(duty, compressor, T_cond, cycle, table)
+    displacement = compressor.calculate_displacement
+
+    low, high = speeds
+    slope = (compressor.displacement_60Hz - compressor.displacement_50Hz) / (60 - 50)  # m³/h per Hz
+    if slope <= 0:
+        low = high = rated_frequency  # No speed range to modulate over
+    per_displacement = capacity / displacement(rated_frequency)  # kW per m³/h
+    with np.errstate(divide='ignore', invalid='ignore'):
+        frequency = (50 + (required / per_displacement - compressor.displacement_50Hz) / slope if slope > 0
+                     else np.full(len(required), rated_frequency))
+        frequency = np.clip(np.nan_to_num(frequency, nan=high, posinf=high, neginf=low), low, high)
+        capacity_at = per_displacement * displacement(frequency)
+        # Below the minimum speed the compressor cycles for the share of the hour the load needs
+        runtime = np.where(capacity_at > required, required / capacity_at, 1.0)
+        runtime = np.where(capacity_at > 0, runtime, 0.0)
+    delivered = np.minimum(required, capacity_at)
+    electric = power * displacement(frequency) / displacement(rated_frequency) * runtime
+
+    inside = contains_xy(Polygon([(point['T_evap'], point['T_cond']) for point in compressor.working_field_points]),
+                         duty['T_evap'], T_cond)
+    full_speed = per_displacement * displacement(high)
+    running = runtime * hours
+    circuits = duty['circuits']
+    energy = float((electric * hours).sum()) * circuits  # kWh
+    cooling = float((delivered * hours).sum()) * circuits  # kWh
+    unmet = required > delivered + 1e-9
+    return {
+        'id': compressor.id,
+        'name': compressor.name,
+        'model': model,
+        'rated_frequency': rated_frequency,  # Hz
+        'energy': energy,  # kWh
+        'cooling': cooling,  # kWh
+        'seasonal_cop': cooling / energy if energy > 0 else None,
+        'unmet': float(((required - delivered) * hours).sum()) * circuits,  # kWh
+        'unmet_hours': float(hours[unmet].sum()),
+        'cycling_hours': float(hours[(runtime > 0) & (runtime < 1)].sum()),
+        'run_hours': float(running.sum()),
+        'mean_frequency': float((frequency * running).sum() / running.sum()) if running.sum() > 0 else None,  # Hz
+        'max_frequency': float(frequency[runtime > 0].max()) if (runtime > 0).any() else None,  # Hz
+        'capacity': {'min': float(full_speed.min()), 'max': float(full_speed.max())},  # kW at full speed
+        'outside_working_field_hours': float(hours[~inside & (required > 0)].sum()),
+    }
+
+
+def simulate(duty, profile, compressor_ids=None, approach=CONDENSER_APPROACH, min_T_cond=MIN_T_COND,
+             variable_speed=True):
+    """Annual energy and seasonal capacity of each shortlisted compressor, lowest energy first.
+
+    The evaporating conditions are the duty's for every row; compressors that can't meet the
+    load at some hours are ranked after those that always can.
+    """
+    with span('simulation'):
+        T_cond = np.maximum(profile['t_ambient'] + approach, min_T_cond)
+        cycle = cycle_state(duty)
+        table = condensing_table(duty, T_cond.min(), T_cond.max())
+        speeds = FREQUENCY_RANGE if variable_speed else (duty['frequency'], duty['frequency'])
+        results = [simulate_compressor(duty, compressor, profile, T_cond, cycle, table, speeds)
+                   for compressor in shortlist(duty, cycle, compressor_ids)]
+        results.sort(key=lambda result: (result['unmet_hours'] > 0, result['energy']))
+    record('simulation', rows=len(T_cond), hours=float(profile['hours'].sum()), compressors=len(results))
+    return {
+        'rows': len(T_cond),
+        'hours': float(profile['hours'].sum()),
+        'T_cond': {'min': float(T_cond.min()), 'max': float(T_cond.max())},  # °C
+        'load': float((profile['load'] * profile['hours']).sum()),  # kWh
+        'frequencies': list(speeds),  # Hz
+        'compressors': results,
+    }
@@ -0,0 +1,472 @@
+"""Duty point sizing shared by the part_list page and its JSON sections."""
+import hashlib
+import json
+
+from .catalog import catalog_version
+from .coalesce import single_flight
+from .coupling import COUPLING_RESELECTIONS, COUPLING_SHORTFALL, solve as solve_coupling
+from .indexes import check_valve_index, compressor_index, polynomial_index
+from .models import CheckValve, Compressor, CompressorPressureLimit, Piping
+from .fluids import PropsSI, check_supported
+from .lines import (LINE_TYPES, MAX_SATURATION_DROP, OIL_CIRCULATION, condensate, line_table, oil_properties,
+                    saturated_liquid, size_lines, supercritical)
+from .timing import span
+from .trace import enabled as tracing, record
+from .transcritical import TRANSCRITICAL_MAX_DROP, high_side_pressure, is_transcritical
+
+PIPE_LENGTH = 10  # m, equivalent length used for pressure drops
+SIZING_CACHE_TIMEOUT = 60 * 60  # s
+# Bump when sized results change shape, so results cached by older code aren't used
+RESULT_VERSION = 8
+
+CHECK_VALVE_PRESSURE_DROP = 0.15  # bar, design pressure drop over an open check valve
+CHECK_VALVE_LINES = ['discharge', 'liquid']
+
+
+def _get_float(params, name, default):
+    value = params.get(name)
+    return float(value) if value not in (None, '') else default
+
+
+def _get_int(params, name, default):
+    value = params.get(name)
+    return int(value) if value not in (None, '') else default
+
+
+def parse_duty(params):
+    """Read the sizing inputs from part_list query parameters. Raises ValueError on bad input."""
+    duty = {
+        'q_capacity': _get_float(params, 'q_capacity', 0),
+        'circuits': _get_int(params, 'circuits', 1),
+        'compressors': _get_int(params, 'compressors', 1),
+        'T_evap': _get_float(params, 'tevap', 0),  # Evaporator temperature
+        'T_cond': _get_float(params, 'tcond', 0),  # Condenser temperature
+        'subcooling': _get_float(params, 'subcooling', 0),
+        'superheat': _get_float(params, 'superheat', 0),
+        'refrigerant': params.get('refrigerant') or 'R134a',
+        'frequency': _get_float(params, 'frequency', 50),
+        'pipe_length': _get_float(params, 'pipe_length', PIPE_LENGTH),  # m, equivalent length of each line
+        # Couple the suction line pressure drop with the compressor capacity (myapp.coupling)
+        'coupled': params.get('coupled') not in ('0', 'false'),
+    }
+    if duty['circuits'] < 1:
+        raise ValueError('circuits must be at least 1')
+    check_supported(duty['refrigerant'])  # Rather than failing per compressor further down
+    if duty['pipe_length'] <= 0:
+        raise ValueError('pipe_length must be positive')
+    return duty
+
+
+def duty_key(duty):
+    """Stable hash of a parsed duty, used in cache keys."""
+    return hashlib.sha1(json.dumps(duty, sort_keys=True).encode()).hexdigest()
+
+
+def cycle_state(duty, pressure_suction=None, pressure_discharge=None):
+    """Refrigerant states of the duty's cycle, shared by every compressor."""
+    return Compressor.calculate_cycle_state(duty['refrigerant'], duty['T_evap'], duty['T_cond'], duty['subcooling'],
+                                            duty['superheat'], pressure_suction, pressure_discharge)
+
+
+def capacity_per_displacement(cycle):
+    """Cooling capacity in kW per m³/h of displacement: Q = V · ρ · Δh."""
+    return cycle['density_suction'] * (cycle['h_evap'] - cycle['h_cond']) / 3600
+
+
+def pressure_rated_compressors(duty):
+    """Ids of the compressors rated for the refrigerant whose pressure limits the duty stays within."""
+    limits = CompressorPressureLimit.objects.filter(refrigerant=duty['refrigerant'], max_T_evap__gte=duty['T_evap'],
+                                                    max_T_cond__gte=duty['T_cond'])
+    if is_transcritical(duty['refrigerant'], duty['T_cond']):
+        # Limits above the critical pressure pass the temperature check, the gas cooler pressure must not exceed them
+        pressure = high_side_pressure(duty['refrigerant'], duty['T_cond'], duty['T_evap'], duty['superheat'])
+        limits = limits.filter(compressor__max_pressure_hp__gte=pressure / 100000)
+    return set(limits.values_list('compressor_id', flat=True))
+
+
+def polynomial_performance(duty):
+    """AHRI 540 performance by compressor id of the compressors with coefficients for the duty.
+
+    The catalog values are corrected from the coefficients' rating superheat and subcooling to the duty's.
+    """
+    performance = polynomial_index().evaluate(duty['refrigerant'], duty['frequency'], duty['T_evap'], duty['T_cond'],
+                                              duty['superheat'], duty['subcooling'])
+    if performance is None:
+        return {}
+    return {int(compressor_id): {'q_compressor': float(capacity), 'power': float(power),
+                                 'cop': float(cop) if cop == cop else None, 'mass_flow_rate': float(mass_flow_rate)}
+            for compressor_id, capacity, power, cop, mass_flow_rate in
+            zip(performance['ids'], performance['capacity'], performance['power'], performance['cop'],
+                performance['mass_flow_rate'])}
+
+
+def compressor_capacities(duty, cycle, rated=None):
+    """Capacity of every compressor rated for the duty, at the duty's cycle and frequency.
+
+    Compressors with AHRI 540 coefficients for the refrigerant and frequency use them, the others
+    the displacement × density × Δh estimate.
+    """
+    if rated is None:
+        rated = pressure_rated_compressors(duty)
+    capacities = []
+    index = compressor_index()
+    displacements, _, _ = index.displacements(duty['frequency'])
+    polynomials = polynomial_performance(duty)
+    for compressor, displacement in zip(index.compressors, displacements):
+        if compressor.id not in rated:
+            continue
+        performance = polynomials.get(compressor.id)
+        if performance is not None:
+            capacities.append({
+                'id': compressor.id,
+                'name': compressor.name,
+                'q_compressor': performance['q_compressor'],
+                'power': performance['power'],
+                'cop': performance['cop'],
+            })
+        else:
+            capacities.append({
+                'id': compressor.id,
+                'name': compressor.name,
+                'q_compressor': float(displacement * capacity_per_displacement(cycle))
+            })
+    return capacities
+
+
+def _compressor_result(compressor, q_compressor, T_discharge, mass_flow_rate, performance=None):
+    return {
+        'id': compressor.id,
+        'name': compressor.name,
+        'q_compressor': q_compressor,
+        'T_discharge': T_discharge,
+        'mass_flow_rate': mass_flow_rate,
+        'suction_conn': compressor.suction_conn,
+        'discharge_conn': compressor.discharge_conn,
+        'oil_conn': compressor.oil_conn,
+        'power': performance and performance['power'],
+        'cop': performance and performance['cop'],
+    }
+
+
+def best_polynomial_compressor(duty, polynomials, rated, required):
+    """Of the compressors with AHRI 540 performance, the one whose capacity is closest to required (kW)."""
+    index = compressor_index()
+    candidates = sorted((abs(performance['q_compressor'] - required), compressor_id)
+                        for compressor_id, performance in polynomials.items()
+                        if compressor_id in rated and performance['q_compressor'] > 0)
+    for _, compressor_id in candidates:
+        compressor = index.by_id.get(compressor_id)
+        if compressor is None or not compressor.is_within_working_field(duty['T_evap'], duty['T_cond']):
+            continue
+        return compressor, polynomials[compressor_id]
+    return None, None
+
+
+def best_compressor(duty, cycle, rated=None):
+    """The compressor whose capacity is closest to the duty per circuit.
+
+    The required displacement is computed once and the displacement index is bisected to the
+    closest compressors; only those are checked against the working field. Compressors not rated
+    for the refrigerant or the duty's pressures are excluded up front by one indexed query.
+    Compressors with AHRI 540 coefficients are compared by their polynomial capacity instead.
+    """
+    refrigerant = duty['refrigerant']
+    capacity = capacity_per_displacement(cycle)
+    if not capacity > 0:
+        record('no_cooling_effect', cycle=cycle)
+        return None
+
+    if rated is None:
+        rated = pressure_rated_compressors(duty)
+    if not rated:
+        return None
+
+    required = duty['q_capacity'] / duty['circuits']
+    required_displacement = required / capacity
+    record('required_displacement', required_displacement=required_displacement, rated=len(rated))
+
+    best = None
+    polynomials = polynomial_performance(duty)
+    polynomial, performance = best_polynomial_compressor(duty, polynomials, rated, required)
+    if polynomial is not None:
+        best = _compressor_result(polynomial, performance['q_compressor'], cycle['T_discharge'],
+                                  performance['mass_flow_rate'], performance)
+        record('polynomial_compressor', compressor=polynomial.id, **performance)
+
+    for compressor in compressor_index().nearest(required_displacement, duty['frequency']):
+        if compressor.id not in rated or compressor.id in polynomials:
+            continue
+        if not compressor.is_within_working_field(duty['T_evap'], duty['T_cond']):
+            continue
+        result = compressor.calculate_q_compressor(duty['frequency'], refrigerant, duty['T_evap'], duty['T_cond'],
+                                                   duty['subcooling'], duty['superheat'], cycle)
+        if result is None:
+            continue
+
+        q_compressor, T_discharge, mass_flow_rate = result
+        if best is None or abs(q_compressor - required) < abs(best['q_compressor'] - required):
+            best = _compressor_result(compressor, q_compressor, T_discharge, mass_flow_rate)
+        break
+    return best
+
+
+def select_compressor(duty):
+    """The compressor closest to the duty per circuit, every capacity, the cycle and the rated compressor ids."""
+    # The refrigerant states don't depend on the compressor, compute them once per duty
+    with span('cycle'):
+        try:
+            cycle = cycle_state(duty)
+        except Exception as e:
+            record('cycle_state_error', error=str(e))
+            return None, [], None, set()
+
+    with span('compressors'):
+        rated = pressure_rated_compressors(duty)
+        return best_compressor(duty, cycle, rated), compressor_capacities(duty, cycle, rated), cycle, rated
+
+
+def saturation_pressure(refrigerant, temperature, quality):
+    """Saturation pressure (Pa) at a temperature (°C); quality 1 for dew, 0 for bubble point."""
+    return PropsSI('P', 'T', temperature + 273.15, 'Q', quality, refrigerant)
+
+
+def operating_state(duty, compressor, pressure_evap=None, pressure_cond=None):
+    """Mass flows, pressures and fluid properties of every line for the selected compressor.
+
+    Saturation pressures already known for the duty can be passed in. A transcritical high side
+    has supercritical fluid in the gas cooler and liquid lines.
+    """
+    refrigerant = duty['refrigerant']
+    T_discharge = compressor['T_discharge']
+    transcritical = is_transcritical(refrigerant, duty['T_cond'])
+    if pressure_cond is None:
+        pressure_cond = high_side_pressure(refrigerant, duty['T_cond'], duty['T_evap'], duty['superheat'])
+    if pressure_evap is None:
+        pressure_evap = saturation_pressure(refrigerant, duty['T_evap'], 1)
+    pressure_discharge = pressure_cond
+    pressure_suction = pressure_evap * 1.01
+    # Superheated suction gas, the saturated state is inside the glide of zeotropic blends
+    T_suction = duty['T_evap'] + duty['superheat'] + 0.5
+    density_suction = Piping.get_density(T_suction, refrigerant, pressure_suction)
+    density_discharge = Piping.get_density(T_discharge, refrigerant, pressure_discharge)
+    viscosity_suction = PropsSI('viscosity', 'T', T_suction + 273.15, 'P', pressure_suction, refrigerant)
+    viscosity_discharge = PropsSI('viscosity', 'T', T_discharge + 273.15, 'P', pressure_discharge, refrigerant)
+    if transcritical:
+        T_liquid = duty['T_cond']  # Gas cooler outlet
+        T_condensing = (T_discharge + duty['T_cond']) / 2  # Mean gas cooler temperature
+        density_liquid, viscosity_liquid = supercritical(refrigerant, T_liquid, pressure_cond)
+        density_condensate, viscosity_condensate = supercritical(refrigerant, T_condensing, pressure_cond)
+    else:
+        T_liquid = duty['T_cond'] - duty['subcooling']
+        T_condensing = duty['T_cond']
+        density_liquid, viscosity_liquid = saturated_liquid(refrigerant, T_liquid)
+        density_condensate, viscosity_condensate = condensate(refrigerant, duty['T_cond'])
+    density_oil, viscosity_oil = oil_properties(T_discharge)
+    # Pressure drops (bar) costing MAX_SATURATION_DROP of saturation temperature, the part-load limits
+    max_pressure_drop_suction = (pressure_evap - saturation_pressure(
+        refrigerant, duty['T_evap'] - MAX_SATURATION_DROP, 1)) / 100000
+    if transcritical:
+        max_pressure_drop_discharge = pressure_cond * TRANSCRITICAL_MAX_DROP / 100000
+    else:
+        max_pressure_drop_discharge = (saturation_pressure(
+            refrigerant, duty['T_cond'] + MAX_SATURATION_DROP, 0) - pressure_cond) / 100000
+
+    return {
+        'refrigerant': refrigerant,
+        'mass_flow_rate': compressor['mass_flow_rate'],  # kg/s
+        'T_discharge': T_discharge,
+        'transcritical': transcritical,
+        'compressor': compressor['id'],
+        'frequency': duty['frequency'],  # Hz
+        'suction': {
+            'temperature': duty['T_evap'],
+            'pressure': pressure_suction,
+            'density': density_suction,
+            'viscosity': viscosity_suction,
+            'max_pressure_drop': max_pressure_drop_suction,
+            'connection': compressor['suction_conn'],
+        },
+        'discharge': {
+            'temperature': T_discharge,
+            'pressure': pressure_discharge,
+            'density': density_discharge,
+            'viscosity': viscosity_discharge,
+            'max_pressure_drop': max_pressure_drop_discharge,
+            'connection': compressor['discharge_conn'],
+        },
+        'liquid': {
+            'temperature': T_liquid,
+            'pressure': pressure_discharge,
+            'density': density_liquid,
+            'viscosity': viscosity_liquid,
+            'connection': None,
+        },
+        'condensing': {
+            'temperature': T_condensing,
+            'pressure': pressure_discharge,
+            'density': density_condensate,
+            'viscosity': viscosity_condensate,
+            'connection': None,
+        },
+        'oil': {
+            'temperature': T_discharge,
+            'pressure': pressure_discharge,
+            'density': density_oil,
+            'viscosity': viscosity_oil,
+            'connection': compressor.get('oil_conn'),
+            'mass_flow_rate': compressor['mass_flow_rate'] * OIL_CIRCULATION,  # kg/s
+        },
+    }
+
+
+def size_check_valves(state, parallel_counts=None):
+    """Smallest adequate check valve for the discharge and liquid lines.
+
+    With n valves in parallel each one only has to pass 1/n of the required Kv.
+    """
+    parallel_counts = parallel_counts or {}
+    index = check_valve_index()
+    result = {}
+    for line_type in CHECK_VALVE_LINES:
+        line = state[line_type]
+        parallel_count = parallel_counts.get(line_type, 1)
+        required_kv = CheckValve.calculate_required_kv(state['mass_flow_rate'], line['density'],
+                                                       CHECK_VALVE_PRESSURE_DROP) / parallel_count
+        valve = index.smallest_adequate(required_kv, line['pressure'] / 100000, line['temperature'])
+        result[line_type] = {
+            'required_kv': required_kv,
+            'parallel_count': parallel_count,
+            'valve': valve and {
+                'id': valve.id,
+                'name': valve.checkvalve_name,
+                'model': valve.checkvalve_model,
+                'manufacturer': valve.manufacturer,
+                'kv': valve.checkvalve_kv,
+                'pressure': valve.checkvalve_pressure,
+            },
+        }
+    return result
+
+
+def couple_suction(duty, compressor, state):
+    """Suction pipes coupled with the compressor (coupling.solve), None when the duty isn't coupled."""
+    if not duty.get('coupled', True) or compressor is None or state is None:
+        return None
+    try:
+        return solve_coupling(duty, compressor, state, duty.get('pipe_length', PIPE_LENGTH))
+    except Exception as e:
+        record('coupling_error', error=str(e))
+        return None  # Sized with the nominal mass flow
+
+
+def size_selection(duty, compressor, state, coupling):
+    """The pipes of a compressor's lines; the compressor gains its coupled capacity and whether it's undersized.
+
+    The coupled capacity is the one through the suction pipe size_lines picks, None when the duty
+    isn't coupled.
+    """
+    pipes = size_lines(state, duty.get('pipe_length', PIPE_LENGTH), coupling)
+    coupled = pipes['suction'] and pipes['suction']['coupled']
+    q_coupled = coupled['q_compressor'] if coupled else None
+    required = duty['q_capacity'] / duty['circuits']
+    compressor = {**compressor, 'coupled_q_compressor': q_coupled,
+                  'undersized': q_coupled is not None and q_coupled < required * (1 - COUPLING_SHORTFALL)}
+    return {'compressor': compressor, 'operating_state': state, 'coupling': coupling, 'pipes': pipes,
+            'passed_over': []}
+
+
+def _passed_over(compressor):
+    return {key: compressor[key] for key in ('id', 'name', 'q_compressor', 'coupled_q_compressor')}
+
+
+def select_coupled(duty, cycle, rated, compressor, state, coupling):
+    """The selection of the nominal best compressor, or of a next closest one when it's undersized once coupled.
+
+    While the tried compressors fall short, up to COUPLING_RESELECTIONS further ones are sized, and
+    the one whose coupled capacity is closest to the duty is kept, as best_compressor compares
+    nominal capacities. It stays flagged undersized when no tried compressor meets the duty.
+    """
+    selection = size_selection(duty, compressor, state, coupling)
+    tried = [selection]
+    rated = set(rated) - {compressor['id']}
+    while selection['compressor']['undersized'] and len(tried) <= COUPLING_RESELECTIONS:
+        record('coupled_undersized', **_passed_over(selection['compressor']))
+        compressor = best_compressor(duty, cycle, rated)
+        if compressor is None:
+            break
+        rated.discard(compressor['id'])
+        state = operating_state(duty, compressor, cycle['pressure_suction'], cycle['pressure_discharge'])
+        selection = size_selection(duty, compressor, state, couple_suction(duty, compressor, state))
+        tried.append(selection)
+
+    if len(tried) > 1:
+        required = duty['q_capacity'] / duty['circuits']
+        selection = min(tried, key=lambda tried_selection:
+                        abs(tried_selection['compressor']['coupled_q_compressor'] - required))
+    # The nominally closer compressors that were passed over
+    selection['passed_over'] = [_passed_over(tried_selection['compressor'])
+                                for tried_selection in tried[:tried.index(selection)]]
+    return selection
+
+
+def size_duty(duty):
+    """Select the compressor and the pipe of every line type for a duty point."""
+    compressor, compressors_with_q, cycle, rated = select_compressor(duty)
+    result = {
+        'compressors': compressors_with_q,
+        'compressor': compressor,
+        'operating_state': None,
+        'coupling': None,
+        'passed_over': [],
+        **{f'{line_type}_pipe': None for line_type in LINE_TYPES},
+    }
+    if compressor is None:
+        return result
+
+    with span('state'):
+        # The cycle's saturation pressures are the lines' too
+        state = operating_state(duty, compressor, cycle['pressure_suction'], cycle['pressure_discharge'])
+    coupling = couple_suction(duty, compressor, state)
+    with span('pipes'):
+        selection = select_coupled(duty, cycle, rated, compressor, state, coupling)
+    result.update({
+        'compressor': selection['compressor'],
+        'operating_state': selection['operating_state'],
+        'coupling': selection['coupling'] and selection['coupling']['diagnostics'],
+        'passed_over': selection['passed_over'],
+        **{f'{line_type}_pipe': pipe for line_type, pipe in selection['pipes'].items()},
+    })
+    return result
+
+
+def get_sizing(duty, graph=None):
+    """Cached size_duty; the key includes the catalog version so catalog edits invalidate it.
+
+    On a miss a user's SizingGraph (myapp.graph) recomputes only what changed since their last duty.
+    Concurrent misses of the same duty share one computation (myapp.coalesce).
+    A traced request recomputes everything, so the trace has every calculation step.
+    """
+    if tracing():
+        return size_duty(duty)
+    key = f'sizing:{RESULT_VERSION}:{catalog_version()}:{duty_key(duty)}'
+    return single_flight(key, lambda: graph.sizing(duty) if graph is not None else size_duty(duty),
+                         SIZING_CACHE_TIMEOUT)
+
+
+def pipe_table(duty, pipe_type):
+    """Velocity and pressure drop of every pipe of one line type for the duty."""
+    sizing = get_sizing(duty)
+    state = sizing['operating_state']
+    if state is None:
+        return []
+    coupling = couple_suction(duty, sizing['compressor'], state) if pipe_type == 'suction' else None
+    return line_table(state, pipe_type, duty.get('pipe_length', PIPE_LENGTH), coupling)
+
+
+def get_pipe_table(duty, pipe_type, graph=None):
+    """Cached pipe_table, so paging through a section computes it once."""
+    if tracing():
+        return pipe_table(duty, pipe_type)
+    key = f'pipe_table:{RESULT_VERSION}:{catalog_version()}:{duty_key(duty)}:{pipe_type}'
+    return single_flight(key, lambda: graph.pipe_table(duty, pipe_type) if graph is not None
+                         else pipe_table(duty, pipe_type), SIZING_CACHE_TIMEOUT)
@@ -1,3 +1,1174 @@
-from django.test import TestCase
+import contextvars
+import csv
+import io
+import json
+import math
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db.models import QuerySet
+from django.test import Client, TestCase, override_settings
+from django.utils import timezone
+
+from . import coupling, fluids
+from .catalog import bump_catalog_version, catalog_version
+from .coalesce import Overloaded, _admission, _lease_slot, _Lock, _stripe, admitted, single_flight
+from .compatibility import Rule, compatible_components, refrigerant_names
+from .fluids import PropsSI, resolve, supported_by_family
+from .graph import SizingGraph
+from .jobs import (CHUNK_LEASE, JOB_KINDS, MAX_ATTEMPTS, RateLimited, claim_chunk, enqueue, job_results, retry_job,
+                   run_chunk)
+from .lines import LAMINAR_REYNOLDS, MIN_RISER_VELOCITY, flow, part_load, pipe_index
+from .models import (CheckValve, Compressor, CompressorPolynomial, CompressorPressureLimit, DutyPoint, FluidResolution,
+                     Piping, Project, Receiver, SightGlass, SizingJob, SizingJobChunk)
+from .projects import reevaluate_pending, save_duty_point, selection_changes
+from .simulation import condensing_table, rated_performance
+from .sizing import (best_compressor, capacity_per_displacement, compressor_capacities, cycle_state, get_sizing,
+                     operating_state, parse_duty, polynomial_performance, pressure_rated_compressors, select_compressor,
+                     size_check_valves, size_duty)
+from .transcritical import cop, critical_point, high_side_pressure, is_transcritical, optimal_pressure
+
+# Every test starts from an empty cache, so catalog versions and cached results don't leak between tests
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+WORKING_FIELD = [{'T_evap': -30, 'T_cond': 20}, {'T_evap': 10, 'T_cond': 20}, {'T_evap': 10, 'T_cond': 60},
+                 {'T_evap': -30, 'T_cond': 60}]
+
+
+def make_duty(**params):
+    return parse_duty({'refrigerant': 'R134a', 'tevap': -5, 'tcond': 40, 'superheat': 5, 'subcooling': 2, **params})
+
+
+def create_compressor(name, displacement, **fields):
+    return Compressor.objects.create(**{
+        'name': name,
+        'displacement_50Hz': displacement,
+        'displacement_60Hz': displacement * 1.2,
+        'max_pressure_lp': 20,
+        'max_pressure_hp': 30,
+        'discharge_conn': 22,
+        'suction_conn': 28,
+        'oil_conn': 12,
+        'refrigerants': ['R134a'],
+        'working_field_points': WORKING_FIELD,
+        'additional_constraints': [],
+        **fields,
+    })
+
+
+def create_pipes(pipe_type, outer_diameters=(12, 16, 18, 22, 28, 35)):
+    for outer_diameter in outer_diameters:
+        Piping.objects.create(name=f'Cu {outer_diameter}', inner_diameter=outer_diameter - 1.6,
+                              outer_diameter=outer_diameter, material='Copper', pipe_type=pipe_type)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CatalogTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        lock_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(lock_dir.cleanup)
+        self.enterContext(override_settings(SIZING_LOCK_DIR=lock_dir.name))
+
+
+class CompressorSelectionTests(CatalogTestCase):
+    """best_compressor bisects the displacement index and must pick what a scan of every compressor picks."""
+
+    def setUp(self):
+        super().setUp()
+        for number, displacement in enumerate([3, 7.5, 12, 20, 33, 48, 75, 110, 160]):
+            create_compressor(f'C{number}', displacement)
+        create_compressor('Unrated', 15, refrigerants=['R290'])
+        create_compressor('Outside field', 14, working_field_points=[
+            {'T_evap': 0, 'T_cond': 20}, {'T_evap': 10, 'T_cond': 20}, {'T_evap': 10, 'T_cond': 30}])
+        create_compressor('Low pressure', 16, max_pressure_hp=8)
+
+    def linear_scan(self, duty, cycle):
+        rated = pressure_rated_compressors(duty)
+        required = duty['q_capacity'] / duty['circuits']
+        best = None
+        for compressor in Compressor.objects.order_by('pk'):
+            if compressor.id not in rated or not compressor.is_within_working_field(duty['T_evap'], duty['T_cond']):
+                continue
+            q_compressor = compressor.calculate_q_compressor(duty['frequency'], duty['refrigerant'], duty['T_evap'],
+                                                             duty['T_cond'], duty['subcooling'], duty['superheat'],
+                                                             cycle)[0]
+            if best is None or abs(q_compressor - required) < abs(best[1] - required):
+                best = (compressor.id, q_compressor)
+        return best
+
+    def test_index_matches_linear_scan(self):
+        for params in [{'q_capacity': q_capacity} for q_capacity in [1, 5, 9, 14, 18, 25, 40, 60, 100, 150, 400]] + [
+                {'q_capacity': 30, 'frequency': 60}, {'q_capacity': 30, 'frequency': 35},
+                {'q_capacity': 60, 'circuits': 3}, {'q_capacity': 20, 'tevap': -20, 'tcond': 30}]:
+            with self.subTest(**params):
+                duty = make_duty(**params)
+                cycle = cycle_state(duty)
+                expected_id, expected_q = self.linear_scan(duty, cycle)
+                best = best_compressor(duty, cycle)
+                self.assertEqual(best['id'], expected_id)
+                self.assertAlmostEqual(best['q_compressor'], expected_q)
+
+    def test_unrated_and_out_of_field_compressors_are_skipped(self):
+        cycle = cycle_state(make_duty())
+        for name in ['Unrated', 'Outside field', 'Low pressure']:
+            with self.subTest(name=name):
+                # A duty the compressor's displacement matches exactly
+                displacement = Compressor.objects.get(name=name).displacement_50Hz
+                best = best_compressor(make_duty(q_capacity=displacement * capacity_per_displacement(cycle)), cycle)
+                self.assertNotEqual(best['name'], name)
+
+
+class PressureLimitTests(CatalogTestCase):
+    """CompressorPressureLimit holds the saturation temperatures selection filters compressors on."""
+
+    def limits(self, compressor):
+        return {limit.refrigerant: (limit.max_T_evap, limit.max_T_cond) for limit in compressor.pressure_limits.all()}
+
+    def test_limits_are_saturation_temperatures_at_the_rated_pressures(self):
+        compressor = create_compressor('C', 20, refrigerants=['R134a', 'R404A'])
+        limits = self.limits(compressor)
+        self.assertEqual(set(limits), {'R134a', 'R404A'})
+        for refrigerant, (max_T_evap, max_T_cond) in limits.items():
+            with self.subTest(refrigerant=refrigerant):
+                self.assertAlmostEqual(max_T_evap, PropsSI('T', 'P', 20e5, 'Q', 1, refrigerant) - 273.15)
+                self.assertAlmostEqual(max_T_cond, PropsSI('T', 'P', 30e5, 'Q', 0, refrigerant) - 273.15)
+
+    def test_limits_above_the_critical_pressure_or_unknown_are_infinite(self):
+        self.assertLess(PropsSI('Pcrit', 'R134a'), 50e5)
+        compressor = create_compressor('C', 20, max_pressure_hp=50, refrigerants=['R134a', 'Unobtainium'])
+        limits = self.limits(compressor)
+        self.assertTrue(math.isfinite(limits['R134a'][0]))
+        self.assertEqual(limits['R134a'][1], math.inf)
+        self.assertEqual(limits['Unobtainium'], (math.inf, math.inf))
+
+    def test_saving_a_compressor_refreshes_its_limits(self):
+        compressor = create_compressor('C', 20)
+        other = create_compressor('Other', 20)
+        before = self.limits(other)
+        compressor.max_pressure_hp = 8
+        compressor.refrigerants = ['R134a', 'R290']
+        compressor.save()
+        limits = self.limits(compressor)
+        self.assertEqual(set(limits), {'R134a', 'R290'})
+        self.assertAlmostEqual(limits['R134a'][1], PropsSI('T', 'P', 8e5, 'Q', 0, 'R134a') - 273.15)
+        self.assertEqual(self.limits(other), before)
+        compressor.delete()
+        self.assertFalse(CompressorPressureLimit.objects.filter(compressor_id=compressor.pk).exists())
+
+    def test_range_query_rejects_compressors_over_their_high_pressure(self):
+        rated = create_compressor('Rated', 20)
+        low = create_compressor('Low pressure', 20, max_pressure_hp=8)  # R134a condenses at about 31 °C at 8 bar
+        self.assertEqual(pressure_rated_compressors(make_duty(tcond=40)), {rated.pk})
+        self.assertEqual(pressure_rated_compressors(make_duty(tcond=30)), {rated.pk, low.pk})
+        self.assertEqual(pressure_rated_compressors(make_duty(refrigerant='R290')), set())
+
+
+class CheckValveTests(CatalogTestCase):
+    """size_check_valves picks the smallest valve passing the line's Kv within its pressure and temperature ratings."""
+
+    # 0.1 kg/s at 20 bar: 9 m³/h of discharge gas at 40 kg/m³ and 80 °C, 0.36 m³/h of liquid at 1000 kg/m³ and 35 °C
+    STATE = {'mass_flow_rate': 0.1,
+             'discharge': {'density': 40, 'pressure': 20e5, 'temperature': 80},
+             'liquid': {'density': 1000, 'pressure': 20e5, 'temperature': 35}}
+
+    def setUp(self):
+        super().setUp()
+        for name, kv, pressure, max_temperature in [('Small', 1, 25, 120), ('Medium', 3, 25, 120),
+                                                    ('Low pressure', 5, 16, 150), ('Cold', 5, 45, 50),
+                                                    ('Hot', 6, 45, 150), ('Large', 10, 45, 150)]:
+            CheckValve.objects.create(checkvalve_name=name, checkvalve_model=name, manufacturer='Test',
+                                      checkvalve_conn='22', checkvalve_pressure=pressure, checkvalve_kv=kv,
+                                      checkvalve_mintemperature=-40, checkvalve_maxtemperature=max_temperature)
+
+    def names(self, valves):
+        return {line_type: sized['valve'] and sized['valve']['name'] for line_type, sized in valves.items()}
+
+    def test_required_kv_at_the_design_pressure_drop(self):
+        valves = size_check_valves(self.STATE)
+        # Kv = V · √(ρ / 1000 / Δp) with Δp = 0.15 bar
+        self.assertAlmostEqual(valves['discharge']['required_kv'], 4.647580, places=5)
+        self.assertAlmostEqual(valves['liquid']['required_kv'], 0.929516, places=5)
+        self.assertEqual(CheckValve.calculate_required_kv(0.1, 1000, 1), 0.36)
+
+    def test_smallest_valve_within_its_ratings(self):
+        # Low pressure is rated below 20 bar and Cold below 80 °C, though both pass the discharge Kv
+        self.assertEqual(self.names(size_check_valves(self.STATE)), {'discharge': 'Hot', 'liquid': 'Small'})
+
+    def test_parallel_valves_each_pass_their_share(self):
+        valves = size_check_valves(self.STATE, {'discharge': 2, 'liquid': 3})
+        self.assertAlmostEqual(valves['discharge']['required_kv'], 4.647580 / 2, places=5)
+        self.assertAlmostEqual(valves['liquid']['required_kv'], 0.929516 / 3, places=5)
+        self.assertEqual((valves['discharge']['parallel_count'], valves['liquid']['parallel_count']), (2, 3))
+        self.assertEqual(self.names(valves), {'discharge': 'Medium', 'liquid': 'Small'})
+
+    def test_no_valve_when_none_is_adequate(self):
+        state = {**self.STATE, 'mass_flow_rate': 1}
+        self.assertEqual(self.names(size_check_valves(state)), {'discharge': None, 'liquid': 'Large'})
+        state['liquid'] = {**self.STATE['liquid'], 'pressure': 50e5}
+        self.assertIsNone(size_check_valves(state)['liquid']['valve'])
+
+
+class CompatibilityTests(CatalogTestCase):
+    """Compatibility rules filter in SQL where the backend can, in one NumPy pass otherwise, to the same components."""
+
+    def setUp(self):
+        super().setUp()
+        for name, pressure, refrigerant in [('R134a 25', 25, 'R134a'), ('HFC 30', 30, 'HFC'), ('HFC 10', 10, 'HFC'),
+                                            ('Blend 30', 30, 'Blend'), ('R507A 30', 30, 'R507A')]:
+            Receiver.objects.create(receiver_name=name, manufacturer='Test', receiver_maxpressure=pressure,
+                                    receiver_volume=pressure, receiver_conn_in=16, receiver_conn_out=16,
+                                    receiver_refrigerant=refrigerant, receiver_orientation='vertical')
+            SightGlass.objects.create(sightglass_model=name, manufacturer='Test', sightglass_conn=pressure,
+                                      sightglass_pressure=pressure, sightglass_refrigerants=[refrigerant, 'R22'])
+
+    def compatible(self, component_type, refrigerant):
+        queryset = {'receiver': Receiver, 'sight_glass': SightGlass}[component_type].objects.all()
+        inputs = {'refrigerant_names': refrigerant_names(refrigerant), 'discharge_pressure': 15}
+        return compatible_components(queryset, component_type, inputs)
+
+    def names(self, components):
+        return [getattr(component, 'receiver_name', None) or component.sightglass_model for component in components]
+
+    def test_refrigerants_match_their_family_but_generic_families_only_by_name(self):
+        self.assertEqual(refrigerant_names('R134a'), ['R134a', 'HFC'])
+        self.assertEqual(refrigerant_names('R744'), ['R744', 'CO2'])
+        for refrigerant in ['R507A', 'R1150', 'R717', 'R999']:  # Blends, Other, Inorganics, unknown
+            with self.subTest(refrigerant=refrigerant):
+                self.assertEqual(refrigerant_names(refrigerant), [refrigerant])
+        self.assertEqual(self.names(self.compatible('sight_glass', 'R507A')), ['R507A 30'])
+
+    def test_rules_run_in_sql_when_the_backend_supports_them(self):
+        receivers = self.compatible('receiver', 'R134a')
+        self.assertIsInstance(receivers, QuerySet)  # No rule left for NumPy
+        where = str(receivers.query).split('WHERE', 1)[1]
+        self.assertIn('receiver_maxpressure', where)
+        self.assertIn('receiver_refrigerant', where)
+        self.assertEqual(self.names(receivers), ['R134a 25', 'HFC 30'])
+
+    def test_numpy_fallback_selects_what_sql_does(self):
+        expected = {'receiver': ['R134a 25', 'HFC 30'], 'sight_glass': ['R134a 25', 'HFC 30']}
+        for component_type, names in expected.items():
+            with self.subTest(component_type=component_type):
+                # SQLite can't query JSON list containment, so sight glasses already mix SQL and NumPy
+                self.assertEqual(self.names(self.compatible(component_type, 'R134a')), names)
+                with mock.patch.object(Rule, 'can_push_down', return_value=False):
+                    fallback = self.compatible(component_type, 'R134a')
+                self.assertIsInstance(fallback, list)
+                self.assertEqual(self.names(fallback), names)
+
+
+class ImportCatalogTests(CatalogTestCase):
+    """import_catalog rejects rows with invalid envelopes or refrigerants and upserts the rest by their key."""
+
+    def compressor(self, name, **fields):
+        return {'name': name, 'displacement_50Hz': 20, 'displacement_60Hz': 24, 'max_pressure_lp': 20,
+                'max_pressure_hp': 30, 'discharge_conn': 22, 'suction_conn': 28, 'oil_conn': 12,
+                'refrigerants': ['R134a', 'HFC'], 'working_field_points': WORKING_FIELD, 'additional_constraints': [],
+                **fields}
+
+    def import_rows(self, rows, *args):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'compressors.jsonl')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.writelines(json.dumps(row) + '\n' for row in rows)
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command('import_catalog', path, '--model', 'compressor', *args, stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue().splitlines()
+
+    def test_invalid_rows_are_rejected_with_their_errors(self):
+        bowtie = [{'T_evap': -30, 'T_cond': 20}, {'T_evap': 10, 'T_cond': 60}, {'T_evap': 10, 'T_cond': 20},
+                  {'T_evap': -30, 'T_cond': 60}]
+        line = [{'T_evap': -30, 'T_cond': 20}, {'T_evap': 0, 'T_cond': 40}, {'T_evap': 15, 'T_cond': 50}]
+        output, errors = self.import_rows([
+            self.compressor('Valid'),
+            self.compressor('Bowtie', working_field_points=bowtie),
+            self.compressor('Flat', working_field_points=line),
+            self.compressor('Unknown refrigerant', refrigerants=['R134a', 'R999']),
+            self.compressor('Bad constraint', additional_constraints=[{'field_points': WORKING_FIELD}]),
+            self.compressor('Missing displacement', displacement_50Hz=''),
+        ])
+        self.assertIn('1 created, 0 updated, 5 rejected', output)
+        self.assertEqual(errors, [
+            'Row 2: working_field_points is self-intersecting',
+            'Row 3: working_field_points is self-intersecting',  # A degenerate ring isn't simple either
+            'Row 4: refrigerants has unknown refrigerants: R999',
+            'Row 5: additional_constraints[0] needs field_points and a message',
+            'Row 6: displacement_50Hz is required',
+        ])
+        self.assertEqual(list(Compressor.objects.values_list('name', flat=True)), ['Valid'])
+        # Bulk writes skip signals, the import refreshes what they would have
+        self.assertEqual(set(Compressor.objects.get().pressure_limits.values_list('refrigerant', flat=True)),
+                         {'R134a', 'HFC'})
+
+    def test_rows_are_upserted_by_name(self):
+        self.import_rows([self.compressor('A'), self.compressor('B')])
+        version = catalog_version()
+        a = Compressor.objects.get(name='A')
+        output, errors = self.import_rows([self.compressor('A', displacement_50Hz=30),
+                                           self.compressor('A', displacement_50Hz=40),  # The last duplicate wins
+                                           self.compressor('C')], '--batch-size', '2')
+        self.assertEqual(errors, [])
+        self.assertIn('1 created, 1 updated, 0 rejected', output)
+        self.assertEqual(Compressor.objects.get(name='A').pk, a.pk)
+        self.assertEqual(dict(Compressor.objects.values_list('name', 'displacement_50Hz')),
+                         {'A': 40, 'B': 20, 'C': 20})
+        self.assertGreater(catalog_version(), version)
+
+    def test_dry_run_writes_nothing(self):
+        output, _ = self.import_rows([self.compressor('A')], '--dry-run')
+        self.assertIn('Validated 1 rows into Compressor: 1 to create', output)
+        self.assertFalse(Compressor.objects.exists())
+
+
+class ReevaluationTests(CatalogTestCase):
+    """Catalog changes flag the saved duty points they can affect; re-evaluating them reports changed parts."""
+
+    def setUp(self):
+        super().setUp()
+        create_compressor('Small', 5)
+        create_pipes('suction')
+        create_pipes('discharge')
+        self.project = Project.objects.create(name='Plant')
+        self.duty = make_duty(q_capacity=20, coupled='0')
+        self.freezer = save_duty_point(self.project, 'Freezer', self.duty)
+        self.other = save_duty_point(self.project, 'Other', make_duty(q_capacity=20, refrigerant='R404A'))
+
+    def test_changed_selections_are_reported(self):
+        self.assertEqual(self.freezer.results['compressor']['name'], 'Small')
+        # A compressor whose displacement meets the duty exactly
+        create_compressor('Exact', 20 / capacity_per_displacement(cycle_state(self.duty)))
+        self.assertEqual(dict(DutyPoint.objects.values_list('name', 'needs_evaluation')),
+                         {'Freezer': True, 'Other': False})  # No compressor change can affect R404A duties
+
+        stdout = io.StringIO()
+        call_command('reevaluate_duty_points', '--report', stdout=stdout)
+        self.freezer.refresh_from_db()
+        self.assertFalse(self.freezer.needs_evaluation)
+        self.assertEqual(self.freezer.compressor.name, 'Exact')
+        self.assertEqual(self.freezer.previous_results['compressor']['name'], 'Small')
+        self.assertIsNotNone(self.freezer.selection_changed)
+
+        rows = [row for row in selection_changes(self.project) if row['part'] == 'compressor']
+        self.assertEqual([(row['duty_point'], row['previous'], row['current']) for row in rows],
+                         [('Freezer', 'Small', 'Exact')])
+        output = stdout.getvalue().splitlines()
+        self.assertIn('Re-evaluated 1 duty points', output[0])
+        self.assertIn(f"Plant / Freezer: compressor Small -> Exact ({self.freezer.selection_changed:%Y-%m-%d %H:%M})",
+                      output)
+
+    def test_unchanged_selections_are_not_reported(self):
+        DutyPoint.objects.update(needs_evaluation=True)
+        self.assertEqual(reevaluate_pending(chunk_size=1), (2, 0))
+        self.assertFalse(DutyPoint.objects.filter(selection_changed__isnull=False).exists())
+        self.assertEqual(selection_changes(), [])
+
+
+def double_items(items):
+    return [{'double': item * 2} for item in items]
+
+
+@mock.patch.dict(JOB_KINDS, {'batch': double_items})
+class JobQueueTests(CatalogTestCase):
+    """Workers lease chunks with conditional UPDATEs; expired leases and failures are retried."""
+
+    def test_chunks_are_claimed_once_and_finish_the_job(self):
+        job = enqueue('batch', list(range(5)), chunk_size=2)
+        self.assertEqual(job.total_chunks, 3)
+
+        chunks = [claim_chunk('worker-1'), claim_chunk('worker-2'), claim_chunk('worker-1')]
+        self.assertEqual([chunk.index for chunk in chunks], [0, 1, 2])
+        self.assertIsNone(claim_chunk('worker-3'))  # Every chunk is leased
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'running')
+
+        for chunk in chunks:
+            self.assertEqual(run_chunk(chunk), 'done')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.done_chunks, job.done_items), ('done', 3, 5))
+        self.assertIsNotNone(job.expires)
+        self.assertEqual([result['double'] for result in job_results(job)], [0, 2, 4, 6, 8])
+
+    def test_expired_lease_is_claimed_again_and_the_old_worker_loses_it(self):
+        enqueue('batch', [1, 2])
+        stale = claim_chunk('dead-worker')
+        SizingJobChunk.objects.filter(id=stale.id).update(
+            claimed=timezone.now() - timedelta(seconds=CHUNK_LEASE + 1))
+
+        retried = claim_chunk('worker-2')
+        self.assertEqual((retried.id, retried.worker, retried.attempts), (stale.id, 'worker-2', 2))
+        self.assertEqual(run_chunk(stale), 'lost')  # Its claim was taken over
+        self.assertEqual(run_chunk(retried), 'done')
+
+    def test_failing_chunk_is_retried_until_it_fails_the_job(self):
+        job = enqueue('batch', [1, 2, 3], chunk_size=1)
+        with mock.patch.dict(JOB_KINDS, {'batch': mock.Mock(side_effect=RuntimeError('CoolProp failed'))}):
+            for attempt in range(1, MAX_ATTEMPTS):
+                chunk = claim_chunk('worker')
+                self.assertEqual((chunk.index, chunk.attempts), (0, attempt))
+                self.assertEqual(run_chunk(chunk), 'queued')
+            self.assertEqual(run_chunk(claim_chunk('worker')), 'failed')
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('CoolProp failed', job.error)
+        self.assertEqual(sorted(job.chunks.values_list('status', flat=True)), ['cancelled', 'cancelled', 'failed'])
+        self.assertIsNone(claim_chunk('worker'))  # Chunks of a failed job aren't claimed
+
+        self.assertTrue(retry_job(job))
+        self.assertEqual([run_chunk(claim_chunk('worker')) for _ in range(3)], ['done'] * 3)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+        self.assertEqual([result['double'] for result in job_results(job)], [2, 4, 6])
+
+    def test_jobs_belong_to_the_submitting_session(self):
+        owner, other = Client(), Client()
+        response = owner.post('/jobs/', json.dumps({'kind': 'batch', 'duties': [{'q_capacity': 10}]}),
+                              content_type='application/json')
+        job_id = response.json()['job']['id']
+        self.assertEqual(owner.get(f'/jobs/{job_id}/').status_code, 200)
+        self.assertEqual(other.get(f'/jobs/{job_id}/').status_code, 404)
+        self.assertEqual(other.post(f'/jobs/{job_id}/cancel/').status_code, 404)
+        self.assertTrue(owner.post(f'/jobs/{job_id}/cancel/').json()['success'])
+        self.assertEqual(SizingJob.objects.get(id=job_id).status, 'cancelled')
+
+    @override_settings(JOB_RATE_ITEMS=250)
+    def test_submissions_are_rate_limited(self):
+        client = Client()
+        body = json.dumps({'kind': 'batch', 'duties': [{'q_capacity': 10}]})
+        statuses = [client.post('/jobs/', body, content_type='application/json').status_code for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])  # Each submission costs at least a chunk of 100 items
+        self.assertEqual(SizingJob.objects.count(), 2)
+
+    @override_settings(JOB_RATE_ITEMS=250, JOB_RATE_WINDOW=3600)
+    def test_budget_is_counted_from_the_clients_jobs(self):
+        self.assertTrue(enqueue('batch', [1] * 151, client='10.0.0.1'))
+        cache.clear()  # Nothing about the budget lives in the cache
+        with self.assertRaises(RateLimited) as raised:
+            enqueue('batch', [1], client='10.0.0.1')  # Costs a chunk, 251 items in all
+        self.assertEqual(raised.exception.retry_after, 3600)
+        self.assertEqual(SizingJob.objects.count(), 1)  # Rejected jobs aren't created, nor charged
+        self.assertEqual(SizingJobChunk.objects.count(), 2)
+        enqueue('batch', [1], client='10.0.0.2')  # Other clients have their own budget
+        enqueue('batch', [1] * 1000)  # Jobs of commands aren't charged
+
+        # The budget is renewed as the client's jobs leave the window
+        SizingJob.objects.filter(client='10.0.0.1').update(created=timezone.now() - timedelta(seconds=3000))
+        with self.assertRaises(RateLimited) as raised:
+            enqueue('batch', [1], client='10.0.0.1')
+        self.assertAlmostEqual(raised.exception.retry_after, 600, delta=2)
+        SizingJob.objects.filter(client='10.0.0.1').update(created=timezone.now() - timedelta(seconds=3601))
+        self.assertTrue(enqueue('batch', [1], client='10.0.0.1'))
+
+
+PART_LIST_PARAMS = {'refrigerant': 'R134a', 'q_capacity': 20, 'tevap': -5, 'tcond': 40, 'superheat': 5}
+
+
+@override_settings(SIZING_MAX_CONCURRENT=2, SIZING_QUEUE_LENGTH=0, SIZING_QUEUE_TIMEOUT=0.2)
+class AdmissionTests(CatalogTestCase):
+    """Identical computations run once; web requests hold one of SIZING_MAX_CONCURRENT slots or get a 503."""
+
+    def setUp(self):
+        super().setUp()
+        token = _admission.set(True)  # As in a request through AdmissionMiddleware
+        self.addCleanup(_admission.reset, token)
+
+    def hold(self, name):
+        """Take a lock as another process would."""
+        lock = _Lock(name)
+        self.assertTrue(lock.acquire())
+        self.addCleanup(lock.release)
+        return lock
+
+    def slots(self):
+        held = []
+        for index in range(2):
+            lock = _Lock(f'admission-running-{index}.lock')
+            held.append(not lock.acquire())
+            lock.release()
+        return held
+
+    def test_concurrent_identical_computations_run_once(self):
+        calls = []
+
+        def compute():
+            calls.append(True)
+            time.sleep(0.1)
+            return {'value': 42}
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(single_flight('sizing:test', compute, 60)))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'value': 42}] * 4)
+        self.assertEqual(self.slots(), [False, False])
+
+    def test_waits_for_another_process_holding_the_flight_lock(self):
+        self.hold(f'flight-{_stripe("sizing:test")}.lock')  # Another process is computing it
+        threading.Timer(0.1, cache.set, ['sizing:test', {'value': 7}, 60]).start()
+        self.assertEqual(single_flight('sizing:test', self.fail, 60), {'value': 7})
+
+    def test_slots_are_held_shared_by_nested_blocks_and_released(self):
+        outside = contextvars.copy_context()  # Admission on, no slot held
+        with admitted():
+            self.assertEqual(self.slots(), [True, False])
+            with admitted():
+                self.assertEqual(self.slots(), [True, False])  # Shares its caller's slot
+            other = self.hold('admission-running-1.lock')  # Another process takes the last slot
+            with self.assertRaises(Overloaded) as raised:
+                outside.run(lambda: admitted().__enter__())
+            self.assertEqual(raised.exception.retry_after, 1)
+        self.assertEqual(self.slots(), [False, True])
+        other.release()
+        self.assertEqual(self.slots(), [False, False])
+
+    @skipUnless(hasattr(os, 'fork'), 'needs fork')
+    def test_slots_are_exclusive_across_processes(self):
+        def lease():
+            slot = _lease_slot('admission-running', 2)
+            os._exit(int(slot.name[-6]) if slot else 9)  # The index of the slot it got
+
+        with admitted():
+            process = multiprocessing.get_context('fork').Process(target=lease)
+            process.start()
+            process.join()
+        self.assertEqual(process.exitcode, 1)
+
+    @override_settings(SIZING_QUEUE_LENGTH=1, SIZING_QUEUE_TIMEOUT=2)
+    def test_queued_request_gets_the_next_free_slot(self):
+        self.hold('admission-running-0.lock')
+        threading.Timer(0.1, self.hold('admission-running-1.lock').release).start()
+        with admitted():
+            self.assertEqual(self.slots(), [True, True])
+            self.hold('admission-queued-0.lock')  # Its queue place was given back
+        self.assertEqual(self.slots(), [True, False])
+
+    def test_overloaded_requests_get_503(self):
+        others = [self.hold(f'admission-running-{index}.lock') for index in range(2)]
+        client = Client()
+        responses = {
+            'part_list': client.get('/part_list/', PART_LIST_PARAMS),
+            'compare': client.get('/compare/', PART_LIST_PARAMS),
+            'csv export': client.get('/part_list/export.csv', PART_LIST_PARAMS),
+        }
+        for name, response in responses.items():
+            with self.subTest(name):
+                self.assertEqual(response.status_code, 503)
+                self.assertEqual(response['Retry-After'], '1')
+
+        for other in others:
+            other.release()
+        response = client.get('/part_list/export.csv', PART_LIST_PARAMS)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.slots(), [True, False])  # Held while the export streams
+        b''.join(response.streaming_content)
+        self.assertEqual(self.slots(), [False, False])
+
+
+class CouplingTests(CatalogTestCase):
+    """coupling.solve iterates each suction pipe's saturation drop to the fixed point of the compressor and line."""
+
+    def setUp(self):
+        super().setUp()
+        self.compressor = create_compressor('C', 20)
+        create_pipes('suction')
+
+    def solve(self, pipe_length=10, **params):
+        duty = make_duty(q_capacity=20, **params)
+        compressor, _, cycle, _ = select_compressor(duty)
+        state = operating_state(duty, compressor, cycle['pressure_suction'], cycle['pressure_discharge'])
+        return duty, compressor, state, coupling.solve(duty, compressor, state, pipe_length)
+
+    def test_converged_drop_is_a_fixed_point(self):
+        duty, compressor, state, result = self.solve()
+        table = coupling.property_table(duty)
+        converged = np.array(result['converged'])
+        self.assertTrue(converged.any())
+        # The mass flow at the converged saturation temperature loses exactly that drop in the line
+        pressure_drop = flow(np.array(result['mass_flow_rate']), state['suction']['density'],
+                             state['suction']['viscosity'], pipe_index().inner_diameter[pipe_index().slices['suction']],
+                             10)['pressure_drop']
+        inlet = np.interp(table['pressure'][-1] - pressure_drop * 100000, table['pressure'], table['temperature'])
+        np.testing.assert_allclose(inlet[converged], np.array(result['T_evap'])[converged],
+                                   atol=coupling.COUPLING_TOLERANCE * 10)
+        self.assertLess(result['diagnostics']['max_residual'], coupling.COUPLING_TOLERANCE)
+
+        # Narrower pipes lose more capacity, none gains any
+        q_compressor = np.array(result['q_compressor'])
+        self.assertTrue((q_compressor <= compressor['q_compressor'] + 1e-9).all())
+        self.assertTrue((np.diff(q_compressor) >= 0).all())
+        # The narrowest pipe can't feed the compressor
+        self.assertFalse(result['converged'][0])
+        self.assertEqual(result['diagnostics']['choked'], 1)
+
+    def test_longer_lines_lose_more_capacity(self):
+        short = self.solve(pipe_length=10)[-1]
+        long = self.solve(pipe_length=40)[-1]
+        for short_q, long_q, converged in zip(short['q_compressor'], long['q_compressor'], long['converged']):
+            if converged:
+                self.assertLess(long_q, short_q)
+
+    def test_warm_start_converges_to_the_same_fixed_point(self):
+        cold = self.solve(tevap=-5)[-1]
+        warm = self.solve(tevap=-4.5)[-1]  # A neighbouring duty starts from the drops cached above
+        self.assertFalse(cold['diagnostics']['warm_start'])
+        self.assertTrue(warm['diagnostics']['warm_start'])
+        self.assertLess(warm['diagnostics']['iterations'], cold['diagnostics']['iterations'])
+        cache.clear()
+        expected = self.solve(tevap=-4.5)[-1]
+        self.assertEqual(warm['converged'], expected['converged'])
+        np.testing.assert_allclose(np.array(warm['T_evap'])[warm['converged']],
+                                   np.array(expected['T_evap'])[warm['converged']],
+                                   atol=coupling.COUPLING_TOLERANCE * 10)
+
+    def test_undersized_compressor_gives_way_to_the_next_closest(self):
+        # The nominal pick only fits the narrowest suction pipes, which starve it
+        self.compressor.suction_conn = 16
+        self.compressor.save()
+        create_compressor('Larger', 24)
+        cycle = cycle_state(make_duty())
+        result = size_duty(make_duty(q_capacity=20 * capacity_per_displacement(cycle)))
+        self.assertEqual(result['compressor']['name'], 'Larger')
+        self.assertFalse(result['compressor']['undersized'])
+        self.assertEqual([compressor['name'] for compressor in result['passed_over']], ['C'])
+        self.assertLess(result['passed_over'][0]['coupled_q_compressor'],
+                        result['passed_over'][0]['q_compressor'] * (1 - coupling.COUPLING_SHORTFALL))
+
+        # Uncoupled, the nominal pick stands
+        result = size_duty(make_duty(q_capacity=20 * capacity_per_displacement(cycle), coupled='0'))
+        self.assertEqual(result['compressor']['name'], 'C')
+        self.assertEqual(result['passed_over'], [])
+
+
+class SelectionTests(CatalogTestCase):
+    """Selections are validated as a batch and kept in the signed session cookie."""
+
+    def setUp(self):
+        super().setUp()
+        self.compressor = create_compressor('C', 20)
+        create_pipes('suction', [22, 28])
+        self.pipes = list(Piping.objects.order_by('pk'))
+
+    def select(self, client, selections):
+        return client.post('/select_components/', json.dumps({'selections': selections}),
+                           content_type='application/json').json()
+
+    def selected(self, client):
+        selected = client.get('/selections/').json()['selected']
+        return {component_type: pk for component_type, pk in selected.items() if pk is not None}
+
+    def test_batch_is_stored_in_the_signed_cookie(self):
+        client = Client()
+        response = self.select(client, [{'type': 'compressor', 'id': self.compressor.pk},
+                                        {'type': 'suction_pipe', 'id': self.pipes[0].pk},
+                                        {'type': 'suction_pipe', 'id': str(self.pipes[1].pk)}])  # The last one wins
+        self.assertTrue(response['success'])
+        expected = {'compressor': self.compressor.pk, 'suction_pipe': self.pipes[1].pk}
+        self.assertEqual({key: pk for key, pk in response['selected'].items() if pk is not None}, expected)
+        self.assertEqual(self.selected(client), expected)
+        self.assertFalse(Session.objects.exists())  # Nothing stored server side
+
+        self.select(client, [{'type': 'compressor', 'id': None}])
+        self.assertEqual(self.selected(client), {'suction_pipe': self.pipes[1].pk})
+
+    def test_invalid_batch_changes_nothing(self):
+        client = Client()
+        self.select(client, [{'type': 'compressor', 'id': self.compressor.pk}])
+        response = self.select(client, [{'type': 'suction_pipe', 'id': self.pipes[0].pk},
+                                        {'type': 'discharge_pipe', 'id': self.pipes[0].pk},  # A suction pipe
+                                        {'type': 'flux_capacitor', 'id': 1}, {'type': 'compressor', 'id': 'C'}])
+        self.assertFalse(response['success'])
+        self.assertEqual(response['errors'], ['Invalid component type: flux_capacitor',
+                                              "Invalid id for compressor: 'C'",
+                                              f'Unknown discharge_pipe: {self.pipes[0].pk}'])
+        self.assertEqual(self.selected(client), {'compressor': self.compressor.pk})
+
+    def test_tampered_cookie_is_an_empty_session(self):
+        client = Client()
+        self.select(client, [{'type': 'compressor', 'id': self.compressor.pk}])
+        session_cookie = client.cookies[settings.SESSION_COOKIE_NAME].value
+        client.cookies[settings.SESSION_COOKIE_NAME] = session_cookie[:-1] + ('A' if session_cookie[-1] != 'A' else 'B')
+        self.assertEqual(self.selected(client), {})
+
+
+class BillOfMaterialsTests(CatalogTestCase):
+    """The CSV export has a row per part of every duty, sized as the rows stream."""
+
+    def setUp(self):
+        super().setUp()
+        self.compressor = create_compressor('C', 20)
+        create_pipes('suction')
+        create_pipes('discharge')
+        self.valve = CheckValve.objects.create(checkvalve_name='CV', checkvalve_model='CV 22', manufacturer='Test',
+                                               checkvalve_conn='22', checkvalve_pressure=45, checkvalve_kv=50,
+                                               checkvalve_mintemperature=-40, checkvalve_maxtemperature=150)
+
+    def export(self, client, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="bill_of_materials.csv"')
+        return list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+
+    def test_batch_rows(self):
+        duties = [{**PART_LIST_PARAMS, 'circuits': 2, 'compressors': 3, 'pipe_length': 15},
+                  {**PART_LIST_PARAMS, 'refrigerant': 'R290'}]  # No compressor is rated for R290
+        client = Client()
+        rows = self.export(client, client.post('/part_list/export.csv', json.dumps({'duties': duties}),
+                                               content_type='application/json'))
+        sizing = get_sizing(parse_duty(duties[0]))
+        self.assertEqual([(row['duty'], row['component_type'], row['quantity'], row['unit']) for row in rows], [
+            ('1', 'compressor', '6', 'pcs'),
+            ('1', 'suction_pipe', '30.0', 'm'),
+            ('1', 'discharge_pipe', '30.0', 'm'),
+            ('1', 'check_valve', '2', 'pcs'),
+            ('1', 'check_valve', '2', 'pcs'),
+            ('2', 'error', '', ''),
+        ])
+        compressor, suction, discharge, check_valve, _, error = rows
+        self.assertEqual((compressor['id'], compressor['description'], compressor['refrigerant'], compressor['tevap']),
+                         (str(self.compressor.pk), 'C', 'R134a', '-5.0'))
+        self.assertAlmostEqual(float(compressor['capacity_kw']), sizing['compressor']['q_compressor'])
+        self.assertEqual(suction['id'], str(sizing['suction_pipe']['id']))
+        self.assertAlmostEqual(float(suction['velocity_m_s']), sizing['suction_pipe']['velocity'])
+        self.assertAlmostEqual(float(discharge['pressure_drop_bar']), sizing['discharge_pipe']['pressure_drop'])
+        self.assertEqual((check_valve['id'], check_valve['kv']), (str(self.valve.pk), '50.0'))
+        self.assertEqual(check_valve['description'], 'CV (CV 22) - Test - discharge line')
+        self.assertEqual((error['refrigerant'], error['description']), ('R290', 'No suitable compressor found'))
+
+    def test_selected_parts_replace_the_computed_ones(self):
+        client = Client()
+        suction = Piping.objects.get(pipe_type='suction', outer_diameter=35)
+        client.post('/select_components/', json.dumps({'selections': [{'type': 'suction_pipe', 'id': suction.pk},
+                                                                      {'type': 'check_valve', 'id': self.valve.pk}]}),
+                    content_type='application/json')
+        rows = self.export(client, client.get('/part_list/export.csv', PART_LIST_PARAMS))
+        self.assertEqual([row['description'] for row in rows if row['component_type'] == 'suction_pipe'], ['Cu 35'])
+        self.assertEqual(rows[-1]['duty'], 'selected')  # Parts not sized per duty are listed once
+        self.assertEqual((rows[-1]['component_type'], rows[-1]['id']), ('check_valve', str(self.valve.pk)))
+
+
+class InlineExecutor:
+    """A ThreadPoolExecutor running each task as it is submitted.
+
+    Pool threads have their own database connections, which don't see a TestCase's uncommitted rows.
+    """
+
+    def __init__(self, max_workers):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+@mock.patch('myapp.comparison.ThreadPoolExecutor', InlineExecutor)
+class ComparisonTests(CatalogTestCase):
+    """Every refrigerant gets a comparison row in the requested order, failed sizings included."""
+
+    def test_failed_refrigerants_are_reported_in_their_rows(self):
+        compressor = create_compressor('C', 20)
+        create_pipes('suction')
+        create_pipes('discharge')
+        get_sizing_of = get_sizing
+
+        def sizing(duty, *args):
+            if duty['refrigerant'] == 'R1234yf':
+                raise RuntimeError('no convergence')
+            return get_sizing_of(duty, *args)
+
+        with mock.patch('myapp.comparison.get_sizing', side_effect=sizing):
+            response = Client().get('/compare/', {**PART_LIST_PARAMS, 'format': 'json',
+                                                  'refrigerants': 'R134a,R290, R1234yf,Unobtainium,R134a'})
+        rows = response.json()['rows']
+        self.assertEqual([row['refrigerant'] for row in rows], ['R134a', 'R290', 'R1234yf', 'Unobtainium'])
+        r134a, r290, r1234yf, unknown = rows
+        self.assertEqual((r134a['compressor']['id'], r134a['message']), (compressor.pk, ''))
+        self.assertEqual(r134a['suction_pipe']['id'], get_sizing(parse_duty(PART_LIST_PARAMS))['suction_pipe']['id'])
+        self.assertEqual((r290['compressor'], r290['message']), (None, 'No suitable compressor found'))
+        self.assertEqual((r1234yf['compressor'], r1234yf['message']), (None, 'Sizing failed: no convergence'))
+        self.assertIsNotNone(r1234yf['label'])
+        self.assertIsNone(unknown['label'])
+        self.assertTrue(unknown['message'].startswith('Sizing failed: '))
+
+
+class ConditionalTests(CatalogTestCase):
+    """Sizing pages revalidate by an ETag of the duty and the catalog version kept in the database."""
+
+    def setUp(self):
+        super().setUp()
+        create_compressor('C', 20)
+        create_pipes('suction')
+        create_pipes('discharge')
+
+    def test_matching_etag_answers_304_without_sizing(self):
+        client = Client()
+        etag = client.get('/part_list/', PART_LIST_PARAMS)['ETag']
+        cache.clear()  # The file cache culls, the catalog version must not go with it
+        with mock.patch('myapp.views.get_sizing', side_effect=AssertionError('sized')):
+            response = client.get('/part_list/', PART_LIST_PARAMS, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_catalog_changes_change_the_etag(self):
+        client = Client()
+        etag = client.get('/part_list/', PART_LIST_PARAMS)['ETag']
+        version = catalog_version()
+        Piping.objects.filter(pipe_type='suction').first().save()
+        self.assertGreater(catalog_version(), version)
+        response = client.get('/part_list/', PART_LIST_PARAMS, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_catalog_version_only_moves_forward(self):
+        version = catalog_version()
+        with mock.patch('myapp.catalog.time.time_ns', return_value=version - 10 ** 9):  # A clock behind
+            bump_catalog_version()
+        self.assertEqual(catalog_version(), version + 1)
+
+
+class SizingGraphTests(CatalogTestCase):
+    """An edit only recomputes the graph nodes downstream of the inputs it changed."""
+
+    def setUp(self):
+        super().setUp()
+        create_compressor('C', 20)
+        create_pipes('suction')
+        create_pipes('discharge')
+
+    def recomputed(self, client, **params):
+        response = client.get('/part_list/', {**PART_LIST_PARAMS, **params})
+        self.assertEqual(response.status_code, 200)
+        return response['X-Sizing-Recomputed'].split(',')
+
+    def test_pipe_length_edit_recomputes_only_downstream_nodes(self):
+        client = Client()
+        self.assertEqual(set(self.recomputed(client)),
+                         {'evaporating', 'condensing', 'cycle', 'rated', 'capacities', 'compressor', 'lines',
+                          'coupling', 'selection'})
+        self.assertEqual(self.recomputed(client, pipe_length=25), ['coupling', 'selection'])
+        self.assertEqual(self.recomputed(client, pipe_length=25), ['-'])
+
+    def test_frequency_edit_recomputes_the_lines(self):
+        duty = make_duty(q_capacity=20)
+        compressor = best_compressor(duty, cycle_state(duty))
+        graph = SizingGraph()
+        # The same compressor at both frequencies, so only the frequency input can invalidate the lines
+        with mock.patch('myapp.graph.best_compressor', return_value=compressor):
+            for frequency in [50, 60]:
+                with self.subTest(frequency=frequency):
+                    lines = graph.evaluate(make_duty(q_capacity=20, frequency=frequency), ['lines'])['lines']
+                    self.assertIn('lines', graph.recomputed)
+                    self.assertEqual(lines['frequency'], frequency)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')  # No collectstatic
+class AdminPageTests(CatalogTestCase):
+    """Staff pages answer 400 to invalid query parameters."""
+
+    def setUp(self):
+        super().setUp()
+        profile_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(profile_dir.cleanup)
+        self.enterContext(override_settings(PROFILE_DIR=profile_dir.name))
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+
+    def test_profiles_reject_an_invalid_top(self):
+        for top, status in [('', 200), ('5', 200), ('500', 200), ('abc', 400), ('0', 400)]:
+            with self.subTest(top=top):
+                self.assertEqual(self.client.get('/admin/profiles/', {'top': top}).status_code, status)
+
+
+class PressureDropTests(CatalogTestCase):
+    """lines.flow() sizes every pipe at once and agrees with the scalar Piping.calculate_pressure_drop."""
+
+    def suction(self, mass_flow_rate, inner_diameter=26.4):
+        """flow() and the scalar pressure drop (bar) of R134a at 0 °C just above its -5 °C saturation pressure."""
+        pressure = PropsSI('P', 'T', 268.15, 'Q', 1, 'R134a') * 1.01
+        density = PropsSI('D', 'T', 273.15, 'P', pressure, 'R134a')
+        viscosity = PropsSI('viscosity', 'T', 273.15, 'P', pressure, 'R134a')
+        result = flow(mass_flow_rate, density, viscosity, inner_diameter / 1000, 10)
+        velocity = Piping.calculate_velocity(mass_flow_rate, inner_diameter, density)
+        scalar = Piping.calculate_pressure_drop(10, 0, inner_diameter, velocity, pressure, density, 'R134a')
+        return result, scalar / 100000
+
+    def test_flow_matches_the_scalar_reference(self):
+        for mass_flow_rate, laminar in [(0.1, False), (0.0002, True)]:
+            with self.subTest(mass_flow_rate=mass_flow_rate):
+                result, scalar = self.suction(mass_flow_rate)
+                self.assertEqual(result['reynolds'] < LAMINAR_REYNOLDS, laminar)
+                if laminar:
+                    self.assertAlmostEqual(result['friction'], 64 / result['reynolds'])
+                self.assertAlmostEqual(float(result['pressure_drop']), scalar, delta=scalar * 1e-9)
+
+    def test_friction_switches_to_swamee_jain_at_the_laminar_limit(self):
+        viscosity = 1e-5
+        reynolds = np.array([LAMINAR_REYNOLDS - 1, LAMINAR_REYNOLDS])
+        # Reynolds number = 4 ṁ / (π D μ) for a 10 mm pipe
+        result = flow(reynolds * np.pi * 0.01 * viscosity / 4, 10, viscosity, 0.01, 1)
+        np.testing.assert_allclose(result['reynolds'], reynolds)
+        swamee_jain = 0.25 / np.log10(0.0015 / 1000 / (3.7 * 0.01) + 5.74 / reynolds[1] ** 0.9) ** 2
+        np.testing.assert_allclose(result['friction'], [64 / reynolds[0], swamee_jain])
+
+    def test_server_timing_accounts_every_pipe(self):
+        create_compressor('C', 20)
+        create_pipes('suction')
+        create_pipes('discharge')
+        response = Client().get('/part_list/', {'refrigerant': 'R134a', 'q_capacity': 20, 'tevap': -5, 'tcond': 40,
+                                                'superheat': 5})
+        self.assertEqual(response.status_code, 200)
+        metrics = dict(metric.split(';', 1) for metric in response['Server-Timing'].split(', '))
+        self.assertTrue(metrics['pressure_drop'].startswith('dur='))
+        self.assertGreaterEqual(int(metrics['pressure_drop_calls'].split('"')[1]), 12)
+
+
+class PartLoadTests(CatalogTestCase):
+    """part_load checks every riser pipe for oil return at the lowest speed and pressure drop at the highest."""
+
+    def test_verdicts_match_each_frequency_evaluated_alone(self):
+        create_compressor('C', 20)
+        create_pipes('suction', (16, 22, 28, 35, 76))
+        duty = make_duty(q_capacity=20)
+        compressor = select_compressor(duty)[0]
+        state = operating_state(duty, compressor)
+        suction = state['suction']
+        displacement = Compressor.objects.get().calculate_displacement
+        verdicts = part_load(state, 10)
+        index = pipe_index()
+        self.assertEqual(sorted(verdicts), list(range(5)))  # No discharge pipes in the catalog
+
+        frequencies = range(25, 75, 5)
+        warnings = []
+        for i, verdict in verdicts.items():
+            with self.subTest(pipe=index.pipes[i].name):
+                results = [flow(state['mass_flow_rate'] * displacement(frequency) / displacement(50),
+                                suction['density'], suction['viscosity'], index.inner_diameter[i], 10)
+                           for frequency in frequencies]
+                carries_oil = [frequency for frequency, result in zip(frequencies, results)
+                               if result['velocity'] >= MIN_RISER_VELOCITY['suction']]
+                within_limit = [frequency for frequency, result in zip(frequencies, results)
+                                if result['pressure_drop'] <= suction['max_pressure_drop']]
+                self.assertAlmostEqual(verdict['min_velocity'], results[0]['velocity'])
+                self.assertAlmostEqual(verdict['max_pressure_drop'], results[-1]['pressure_drop'])
+                self.assertEqual(verdict['oil_return'], len(carries_oil) == len(frequencies))
+                self.assertEqual(verdict['pressure_drop_ok'], len(within_limit) == len(frequencies))
+                warnings += verdict['warnings']
+        self.assertEqual(warnings, [
+            f"Pressure drop above {suction['max_pressure_drop']:.2f} bar at every speed",  # 16 mm
+            f"Pressure drop above {suction['max_pressure_drop']:.2f} bar over 40 Hz",  # 22 mm
+            'Below 5.1 m/s riser velocity for oil return under 30 Hz',  # 28 mm
+            'Below 5.1 m/s riser velocity for oil return under 45 Hz',  # 35 mm
+            'Below 5.1 m/s riser velocity for oil return at every speed',  # 76 mm
+        ])
+
+
+class SimulationTests(CatalogTestCase):
+    """Seasonal totals of a compressor modulating between 25 and 70 Hz over a binned profile."""
+
+    def test_two_row_profile_totals(self):
+        compressor = create_compressor('C', 20)  # 0.4 m³/h per Hz
+        # 100 h at 25 °C condensing (floating head) needing 3 kW, 50 h at 40 °C needing 30 kW
+        profile = 'hours,t_ambient,load\n100,10,3\n50,30,30\n'
+        response = Client().post('/simulate/?refrigerant=R134a&q_capacity=20&tevap=-5&tcond=40&superheat=5'
+                                 f'&subcooling=2&shortlist={compressor.pk}', profile, content_type='text/csv')
+        result = response.json()
+        self.assertTrue(result['success'], result.get('message'))
+        self.assertEqual((result['rows'], result['hours'], result['load']), (2, 150, 1800))
+        self.assertEqual(result['T_cond'], {'min': 25, 'max': 40})
+        simulated, = result['compressors']
+
+        # Displacement estimate: ṁ · Δh of capacity, ṁ · isentropic Δh / 0.65 of power
+        cycle = cycle_state(make_duty())
+        entropy = PropsSI('S', 'T', 273.15, 'Q', 1, 'R134a')
+
+        def rating(T_cond, frequency):
+            mass_flow_rate = 0.4 * frequency / 3600 * cycle['density_suction']
+            h_liquid = PropsSI('H', 'T', T_cond - 2 + 273.15, 'Q', 0, 'R134a') / 1000
+            h_isentropic = PropsSI('H', 'P', PropsSI('P', 'T', T_cond + 273.15, 'Q', 0, 'R134a'), 'S', entropy,
+                                   'R134a') / 1000
+            return (mass_flow_rate * (cycle['h_evap'] - h_liquid),
+                    mass_flow_rate * (h_isentropic - cycle['h_evap']) / 0.65)
+
+        # The light load cycles the compressor at its minimum speed, the heavy one exceeds its maximum
+        capacity_low, power_low = rating(25, 25)
+        capacity_high, power_high = rating(40, 70)
+        runtime = 3 / capacity_low
+        self.assertLess(runtime, 1)
+        self.assertLess(capacity_high, 30)
+        self.assertAlmostEqual(simulated['cooling'], 3 * 100 + capacity_high * 50)
+        self.assertAlmostEqual(simulated['energy'], power_low * runtime * 100 + power_high * 50)
+        self.assertAlmostEqual(simulated['seasonal_cop'], simulated['cooling'] / simulated['energy'])
+        self.assertAlmostEqual(simulated['unmet'], (30 - capacity_high) * 50)
+        self.assertEqual((simulated['unmet_hours'], simulated['cycling_hours']), (50, 100))
+        self.assertAlmostEqual(simulated['run_hours'], runtime * 100 + 50)
+        self.assertAlmostEqual(simulated['mean_frequency'], (25 * runtime * 100 + 70 * 50) / (runtime * 100 + 50))
+        self.assertEqual((simulated['max_frequency'], simulated['model']), (70, 'displacement'))
+        self.assertEqual(simulated['outside_working_field_hours'], 0)
+
+
+class TranscriticalTests(CatalogTestCase):
+    """R744 rejecting heat above its critical point runs at the gas cooler pressure with the best COP."""
+
+    def test_optimal_pressure_has_the_best_cop(self):
+        pressure = optimal_pressure('R744', 35, -5, 5)
+        self.assertGreater(pressure, critical_point('R744')[1])
+        self.assertTrue(80e5 < pressure < 110e5)  # Pa, the usual optimum at a 35 °C gas cooler outlet
+        # The optimum of each refinement is within the last grid step, so close pressures don't do better
+        T_suction = -5 + 5 + 273.15
+        h_suction = PropsSI('H', 'T', T_suction, 'Q', 1, 'R744')
+        s_suction = PropsSI('S', 'T', T_suction, 'Q', 1, 'R744')
+        neighbours = np.array([pressure - 1e5, pressure, pressure + 1e5])
+        values = cop('R744', neighbours, 35, h_suction, s_suction)
+        self.assertEqual(int(np.argmax(values)), 1)
+        self.assertGreater(optimal_pressure('R744', 40, -5, 5), pressure)
+
+    def test_optimal_pressure_is_cached(self):
+        pressure = optimal_pressure('R744', 35, -5, 5)
+        with mock.patch('myapp.transcritical.cop') as evaluate:
+            self.assertEqual(optimal_pressure('R744', 35, -5, 5), pressure)
+        evaluate.assert_not_called()
+
+    def test_high_side_is_transcritical_near_the_critical_point(self):
+        self.assertTrue(is_transcritical('R744', 35))
+        self.assertFalse(is_transcritical('R744', 20))
+        self.assertFalse(is_transcritical('R134a', 60))
+        self.assertEqual(high_side_pressure('R744', 35, -5, 5), optimal_pressure('R744', 35, -5, 5))
+        self.assertAlmostEqual(high_side_pressure('R744', 20, -5, 5), PropsSI('P', 'T', 293.15, 'Q', 0, 'R744'))
+
+    def test_gas_cooler_pressure_limits_the_rated_compressors(self):
+        low = create_compressor('80 bar', 3, refrigerants=['R744'], max_pressure_lp=50, max_pressure_hp=80)
+        high = create_compressor('130 bar', 4, refrigerants=['R744'], max_pressure_lp=50, max_pressure_hp=130)
+        self.assertEqual(pressure_rated_compressors(make_duty(refrigerant='R744', tcond=35)), {high.id})
+        self.assertEqual(pressure_rated_compressors(make_duty(refrigerant='R744', tcond=20)), {low.id, high.id})
+
+        # The 80 bar compressor would match the duty best, but can't take the gas cooler pressure
+        duty = make_duty(refrigerant='R744', tcond=35)
+        duty['q_capacity'] = 3 * capacity_per_displacement(cycle_state(duty))
+        self.assertEqual(size_duty(duty)['compressor']['name'], '130 bar')
+
+
+class FluidRegistryTests(CatalogTestCase):
+    """Catalog refrigerants resolve to the fastest CoolProp fluid that evaluates every state sizing needs."""
+
+    def test_zeotropic_blends_resolve_to_pseudo_pure_fluids(self):
+        for name in ['R404A', 'R407C']:
+            with self.subTest(name):
+                fluid = resolve(name, 'HFC', name)
+                self.assertEqual((fluid.identifier, fluid.cost), (f'HEOS::{name}', 'pure'))
+
+    def test_missing_binary_pairs_are_estimated(self):
+        fluid = resolve('R450A', 'HFC', 'R450A')
+        self.assertEqual(fluid.identifier, 'HEOS::R450A.mix')
+        self.assertIn(['29118-24-9', '811-97-2'], fluid.binary_pairs)  # R1234ze(E) and R134a
+
+    def test_blend_suction_line_is_sized_superheated(self):
+        create_compressor('Blend', 20, refrigerants=['R404A'])
+        create_pipes('suction')
+        duty = make_duty(refrigerant='R404A', q_capacity=20)
+        result = size_duty(duty)
+        self.assertIsNotNone(result['suction_pipe'])
+        suction = result['operating_state']['suction']
+        self.assertAlmostEqual(suction['viscosity'], PropsSI('viscosity', 'T', -5 + 5 + 0.5 + 273.15, 'P',
+                                                             suction['pressure'], 'R404A'))
+
+    def test_form_offers_only_fluids_that_pass_the_probe(self):
+        catalog = {'R134a': ('HFC', 'R134a'), 'R404A': ('HFC', 'R404A'), 'R718': ('Inorganic', 'Water')}
+        with mock.patch.object(fluids, 'catalog', return_value=catalog), \
+                mock.patch.dict(fluids._registry, clear=True):
+            self.assertEqual([(family, [fluid.name for fluid in members])
+                              for family, members in supported_by_family()], [('HFC', ['R134a', 'R404A'])])
+            response = Client().get('/')
+            self.assertContains(response, 'value="R404A"')
+            self.assertNotContains(response, 'value="R718"')
+            self.assertEqual(FluidResolution.objects.count(), 3)
+
+            # Other processes read the stored resolutions instead of probing again
+            fluids._registry.clear()
+            cache.clear()
+            with mock.patch.object(fluids, 'resolve') as probe:
+                self.assertEqual(len(supported_by_family()[0][1]), 2)
+            probe.assert_not_called()
+
+
+class PolynomialTests(CatalogTestCase):
+    """AHRI 540 coefficients rate compressors at their rating conditions, corrected to the duty's."""
+
+    def setUp(self):
+        super().setUp()
+        self.rated = create_compressor('Rated', 20)
+        self.polynomial = CompressorPolynomial.objects.create(
+            compressor=self.rated, refrigerant='R134a', frequency=50, superheat=10, subcooling=0,
+            capacity=[30000, 900, -300, 10, -5, 2, 0.1, -0.05, 0.02, -0.01],
+            power=[5000, -50, 100, 0, 0, 0, 0, 0, 0, 0],
+            mass_flow=[400, 12, -3, 0, 0, 0, 0, 0, 0, 0])
+        self.plain = create_compressor('Plain', 12)
+
+    def test_rating_conditions_give_the_catalog_values(self):
+        performance = polynomial_performance(make_duty(superheat=10, subcooling=0))[self.rated.id]
+        # At S = -5 °C, D = 40 °C: 30000 - 900·5 - 300·40 + 10·25 + 5·200 + 2·1600 - 0.1·125 - 0.05·1000
+        # - 0.02·8000 - 0.01·64000 W
+        self.assertAlmostEqual(performance['q_compressor'], 17.0875)
+        self.assertAlmostEqual(performance['power'], 9.25)  # 5000 + 50·5 + 100·40 W
+        self.assertAlmostEqual(performance['cop'], 17.0875 / 9.25)
+        self.assertAlmostEqual(performance['mass_flow_rate'], 220 / 3600)  # 400 - 12·5 - 3·40 kg/h
+
+    def test_other_conditions_are_corrected_like_the_displacement_estimate(self):
+        rating = make_duty(superheat=10, subcooling=0)
+        duty = make_duty(superheat=5, subcooling=2)
+        performance = polynomial_performance(duty)[self.rated.id]
+        rated_cycle, cycle = cycle_state(rating), cycle_state(duty)
+        density = cycle['density_suction'] / rated_cycle['density_suction']
+        self.assertAlmostEqual(performance['mass_flow_rate'], 220 / 3600 * density)
+        self.assertAlmostEqual(performance['q_compressor'], 17.0875 * density * (cycle['h_evap'] - cycle['h_cond'])
+                               / (rated_cycle['h_evap'] - rated_cycle['h_cond']))
+        self.assertNotAlmostEqual(performance['q_compressor'], 17.0875, places=2)
+        # The two models keep their ratio, so neither wins a selection for another superheat or subcooling
+        self.assertAlmostEqual(performance['q_compressor'] / capacity_per_displacement(cycle),
+                               17.0875 / capacity_per_displacement(rated_cycle))
+
+    def test_compressors_without_coefficients_use_the_displacement_estimate(self):
+        for frequency in [50, 60]:  # No coefficients at 60 Hz
+            with self.subTest(frequency=frequency):
+                duty = make_duty(frequency=frequency)
+                cycle = cycle_state(duty)
+                capacities = {capacity['name']: capacity for capacity in compressor_capacities(duty, cycle)}
+                displacement = Compressor.objects.get(name='Plain').calculate_displacement(frequency)
+                self.assertAlmostEqual(capacities['Plain']['q_compressor'],
+                                       displacement * capacity_per_displacement(cycle))
+                self.assertNotIn('power', capacities['Plain'])
+                self.assertEqual('power' in capacities['Rated'], frequency == 50)
+
+    def test_simulation_rates_with_the_same_correction(self):
+        duty = make_duty(superheat=5, subcooling=2)
+        cycle = cycle_state(duty)
+        frequency, capacity, power, model = rated_performance(duty, self.rated, np.array([35.0, 40.0]), cycle,
+                                                              condensing_table(duty, 30, 45))
+        self.assertEqual((frequency, model), (50, 'polynomial'))
+        performance = polynomial_performance(duty)[self.rated.id]
+        self.assertAlmostEqual(capacity[1], performance['q_compressor'])
+        self.assertAlmostEqual(power[1], performance['power'])
@@ -0,0 +1,93 @@
+"""Context-local timing spans and counters, reported in the Server-Timing header.
+
+Nothing is recorded unless a ``collect()`` block is active in the current context,
+so span() and count() cost one ContextVar lookup when timing is off.
+"""
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from CoolProp import CoolProp
+from django.conf import settings
+from django.db import connection
+
+_current = ContextVar('server_timing', default=None)
+
+
+class ServerTiming:
+    """Durations (s) per span name and event counters for one request."""
+
+    def __init__(self):
+        self.durations = defaultdict(float)
+        self.counters = Counter()
+
+    def time_query(self, execute, sql, params, many, context):
+        """connection.execute_wrapper hook accounting every query to the db span."""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.durations['db'] += time.perf_counter() - start
+            self.counters['db_queries'] += 1
+
+    def header(self):
+        metrics = [f'{name};dur={duration * 1000:.1f}' for name, duration in self.durations.items()]
+        metrics += [f'{name};desc="{value}"' for name, value in self.counters.items()]
+        return ', '.join(metrics)
+
+
+@contextmanager
+def collect():
+    """Collect spans and counters for the duration of the block."""
+    timing = ServerTiming()
+    token = _current.set(timing)
+    try:
+        yield timing
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def span(name):
+    """Add the time spent in the block to the named span."""
+    timing = _current.get()
+    if timing is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.durations[name] += time.perf_counter() - start
+
+
+def count(name, n=1):
+    timing = _current.get()
+    if timing is not None:
+        timing.counters[name] += n
+
+
+def PropsSI(*args):
+    """CoolProp's PropsSI, counting calls while timing is collected."""
+    timing = _current.get()
+    if timing is not None:
+        timing.counters['propssi'] += 1
+    return CoolProp.PropsSI(*args)
+
+
+def server_timing(view):
+    """Add a Server-Timing header with the spans and counters collected by the view."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not getattr(settings, 'SERVER_TIMING', True):
+            return view(request, *args, **kwargs)
+
+        with collect() as timing, connection.execute_wrapper(timing.time_query):
+            start = time.perf_counter()
+            response = view(request, *args, **kwargs)
+            timing.durations['total'] = time.perf_counter() - start
+        response['Server-Timing'] = timing.header()
+        return response
+    return wrapper
@@ -0,0 +1,109 @@
+"""Context-local calculation traces, replacing the debug prints of the sizing code.
+
+Staff can trace a single request with ``?trace=1`` (or an ``X-Trace: 1`` header): the
+calculation steps are attached to the page, or added under "trace" to a JSON response.
+``?trace=json`` answers with the trace alone. Nothing is recorded unless a ``collect()``
+block is active in the current context, so record() costs one ContextVar lookup when
+tracing is off; values that are expensive to compute are guarded with enabled().
+"""
+import json
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.http import JsonResponse
+from django.utils.cache import add_never_cache_headers
+from django.utils.html import json_script
+
+TRACE_MAX_RECORDS = 20000  # Records kept per request, later steps are only counted
+
+_current = ContextVar('calculation_trace', default=None)
+
+
+class Trace:
+    """Calculation steps recorded during one request, in order."""
+
+    def __init__(self):
+        self.records = []
+        self.dropped = 0
+        self.start = time.perf_counter()
+
+    def add(self, step, values):
+        if len(self.records) >= TRACE_MAX_RECORDS:
+            self.dropped += 1
+            return
+        self.records.append({'step': step, 't': round((time.perf_counter() - self.start) * 1000, 3), **values})
+
+    def as_dict(self):
+        return {'records': self.records, 'dropped': self.dropped}
+
+
+@contextmanager
+def collect():
+    """Record the calculation steps of the block."""
+    trace = Trace()
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+
+
+def enabled():
+    return _current.get() is not None
+
+
+def record(step, **values):
+    """Record a calculation step with its values (t is ms since the trace started)."""
+    trace = _current.get()
+    if trace is not None:
+        trace.add(step, values)
+
+
+def _json_default(value):
+    return str(value)
+
+
+class TraceMiddleware:
+    """Trace requests from staff users that ask for it; traced responses are never cached."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = self.wants_trace(request)
+        if mode is None:
+            return self.get_response(request)
+
+        with collect() as trace:
+            response = self.get_response(request)
+        data = trace.as_dict()
+
+        if mode == 'json':
+            response = JsonResponse({'status': response.status_code, 'trace': data},
+                                    json_dumps_params={'default': _json_default})
+        elif not response.streaming and response.get('Content-Type', '').startswith('application/json'):
+            content = json.loads(response.content)
+            if isinstance(content, dict):
+                content['trace'] = data
+                response.content = json.dumps(content, default=_json_default)
+        elif not response.streaming and response.get('Content-Type', '').startswith('text/html'):
+            script = json_script(json.loads(json.dumps(data, default=_json_default)), 'calculation-trace')
+            response.content = response.content.replace(b'</body>', script.encode() + b'\n</body>', 1)
+        if response.has_header('Content-Length') and not response.streaming:
+            response['Content-Length'] = len(response.content)
+
+        response['X-Trace-Records'] = len(data['records'])
+        add_never_cache_headers(response)
+        return response
+
+    @staticmethod
+    def wants_trace(request):
+        """'page' or 'json' when the request asks for a trace and may have one, None otherwise."""
+        mode = request.GET.get('trace') or request.headers.get('X-Trace')
+        if mode not in ('1', 'json'):
+            return None
+        user = getattr(request, 'user', None)
+        if not (user and user.is_staff):
+            return None
+        return 'json' if mode == 'json' else 'page'
@@ -0,0 +1,96 @@
+"""Transcritical high side of refrigerants rejecting heat above their critical point (R744).
+
+Above the critical temperature nothing condenses: the high side is a gas cooler, and the
+duty's T_cond is its outlet temperature, which doesn't fix the pressure. The pressure is the
+one with the best COP. optimal_pressure() evaluates the cycle over a grid of gas cooler
+pressures with one array PropsSI call per property, refines the grid around the best point and
+caches the result per gas cooler outlet and suction state. Transcritical duties then cost
+what subcritical ones do.
+"""
+import math
+
+import numpy as np
+from django.core.cache import cache
+
+from .fluids import TRANSCRITICAL_APPROACH, PropsSI
+from .trace import record
+
+GAS_COOLER_PRESSURE_RANGE = (1.0, 2.0)  # × critical pressure searched for the optimum
+PRESSURE_GRID = 25  # Pressures per search pass
+REFINEMENTS = 2  # Passes after the first, each over the two grid steps around the best pressure
+TRANSCRITICAL_MAX_DROP = 0.01  # Share of the gas cooler pressure the discharge line may lose
+OPTIMUM_TIMEOUT = 24 * 60 * 60  # s
+
+_critical = {}  # refrigerant -> (T_crit °C, P_crit Pa)
+
+
+def critical_point(refrigerant):
+    """Critical temperature (°C) and pressure (Pa) of a refrigerant.
+
+    Predefined mixtures can have several critical points; they're only sized subcritical.
+    """
+    if refrigerant not in _critical:
+        try:
+            _critical[refrigerant] = (PropsSI('Tcrit', refrigerant) - 273.15, PropsSI('Pcrit', refrigerant))
+        except ValueError as e:
+            record('critical_point_error', refrigerant=refrigerant, error=str(e))
+            _critical[refrigerant] = (math.inf, math.nan)
+    return _critical[refrigerant]
+
+
+def is_transcritical(refrigerant, T_cond):
+    """Whether heat is rejected too close to or above the critical point to condense."""
+    return T_cond >= critical_point(refrigerant)[0] - TRANSCRITICAL_APPROACH
+
+
+def cop(refrigerant, pressures, T_gc_out, h_suction, s_suction):
+    """Isentropic COP at each gas cooler pressure (Pa); NaN where CoolProp has no state."""
+    h_gc_out = PropsSI('H', 'P', pressures, 'T', T_gc_out + 273.15, refrigerant)
+    h_discharge = PropsSI('H', 'P', pressures, 'S', s_suction, refrigerant)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = (h_suction - h_gc_out) / (h_discharge - h_suction)
+    return np.where(np.isfinite(result), result, np.nan)
+
+
+def optimal_pressure(refrigerant, T_gc_out, T_evap, superheat):
+    """The gas cooler pressure (Pa) with the best COP for the gas cooler outlet temperature (°C).
+
+    The suction state is the one Compressor.calculate_cycle_state uses.
+    """
+    key = f'gas_cooler_pressure:{refrigerant}:{T_gc_out}:{T_evap}:{superheat}'
+    pressure = cache.get(key)
+    if pressure is not None:
+        return pressure
+
+    T_suction = T_evap + superheat + 273.15
+    h_suction = PropsSI('H', 'T', T_suction, 'Q', 1, refrigerant)
+    s_suction = PropsSI('S', 'T', T_suction, 'Q', 1, refrigerant)
+    P_crit = critical_point(refrigerant)[1]
+    low, high = GAS_COOLER_PRESSURE_RANGE[0] * P_crit, GAS_COOLER_PRESSURE_RANGE[1] * P_crit
+    for _ in range(REFINEMENTS + 1):
+        pressures = np.linspace(low, high, PRESSURE_GRID)
+        values = cop(refrigerant, pressures, T_gc_out, h_suction, s_suction)
+        if np.isnan(values).all():
+            raise ValueError(f'no gas cooler pressure of {refrigerant} works at {T_gc_out} °C')
+        best = int(np.nanargmax(values))
+        step = pressures[1] - pressures[0]
+        low, high = max(pressures[best] - step, pressures[0]), min(pressures[best] + step, pressures[-1])
+    pressure = float(pressures[best])
+    record('optimal_gas_cooler_pressure', refrigerant=refrigerant, T_gc_out=T_gc_out, T_evap=T_evap,
+           pressure=pressure, cop=float(values[best]))
+    cache.set(key, pressure, OPTIMUM_TIMEOUT)
+    return pressure
+
+
+def high_side_pressure(refrigerant, T_cond, T_evap, superheat):
+    """Condensing pressure (Pa, bubble point), or the optimal gas cooler pressure when transcritical."""
+    if is_transcritical(refrigerant, T_cond):
+        return optimal_pressure(refrigerant, T_cond, T_evap, superheat)
+    return PropsSI('P', 'T', T_cond + 273.15, 'Q', 0, refrigerant)
+
+
+def high_side_enthalpy(refrigerant, T_cond, subcooling, pressure):
+    """Enthalpy (kJ/kg) leaving the condenser, subcooled, or leaving the gas cooler at its pressure (Pa)."""
+    if is_transcritical(refrigerant, T_cond):
+        return PropsSI('H', 'P', pressure, 'T', T_cond + 273.15, refrigerant) / 1000
+    return PropsSI('H', 'T', T_cond - subcooling + 273.15, 'Q', 0, refrigerant) / 1000
@@ -1,9 +1,23 @@
 
 from django.urls import path
-from .views import input, part_list, select_component
+from .views import (compare_refrigerants, export_bom, input, job_cancel, job_detail, job_result, job_retry, part_list,
+                    part_list_section, save_to_project, select_component, select_components, selections,
+                    simulate_profile, submit_job)
 
 urlpatterns = [
     path('', input, name='input'),  # Set the root URL to the input view
     path('part_list/', part_list, name='part_list'),
+    path('part_list/sections/<str:section>/', part_list_section, name='part_list_section'),
+    path('part_list/export.<str:file_format>', export_bom, name='export_bom'),
     path('select_component/', select_component, name='select_component'),
+    path('select_components/', select_components, name='select_components'),
+    path('selections/', selections, name='selections'),
+    path('projects/save/', save_to_project, name='save_to_project'),
+    path('compare/', compare_refrigerants, name='compare_refrigerants'),
+    path('simulate/', simulate_profile, name='simulate_profile'),
+    path('jobs/', submit_job, name='submit_job'),
+    path('jobs/<int:job_id>/', job_detail, name='job_detail'),
+    path('jobs/<int:job_id>/results/', job_result, name='job_result'),
+    path('jobs/<int:job_id>/cancel/', job_cancel, name='job_cancel'),
+    path('jobs/<int:job_id>/retry/', job_retry, name='job_retry'),
 ]
\ No newline at end of file
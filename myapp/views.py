@@ -1,28 +1,106 @@
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.http import FileResponse, Http404, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.cache import never_cache
+from django.views.decorators.csrf import ensure_csrf_cookie
+from django.views.decorators.http import condition
+from datetime import datetime, timezone
+from functools import wraps
+import csv
+import hashlib
+import io
+import itertools
 import json
-from .models import CheckValve, Compressor, ExpansionValve, SolenoidValve, Piping, Receiver, OilSeparator, OilSeparatorReceiver, OilReceiver, SuctionAccumulator, SightGlass
-
-
-standard_pipe_sizes = [12, 16, 18, 22, 28, 35, 42, 54, 64, 76]  # etc.
-
+import tempfile
+from .bom import bom_rows, component_row, stream_csv, write_xlsx
+from .coalesce import admitted, admitted_stream
+from .catalog import catalog_version
+from .compatibility import compatibility_inputs, compatible_components
+from .comparison import compare
+from .fluids import supported_by_family
+from .graph import request_graph, save_request_graph
+from .jobs import (JOB_MAX_ITEMS, RateLimited, cancel_job, enqueue, job_results, job_status, retry_job, session_owner,
+                   sweep_duties)
+from .lines import LINE_TYPES
+from .profiling import profile_path, recent_profiles, top_functions
+from .models import CheckValve, Compressor, ExpansionValve, SolenoidValve, Piping, Project, Receiver, SizingJob, OilSeparator, OilSeparatorReceiver, OilReceiver, SuctionAccumulator, SightGlass
+from .projects import save_duty_point, selection_changes
+from .simulation import CONDENSER_APPROACH, MIN_T_COND, parse_profile, simulate
+from .sizing import duty_key, get_pipe_table, get_sizing, parse_duty, size_check_valves
+from .timing import server_timing, span
+from .trace import enabled as tracing
+
+
+# Bump when the part_list page or the section JSON change, so clients drop what they cached
+RESPONSE_VERSION = 4
+
+
+def _sizing_etag(request, *parts):
+    """Strong ETag of a response that only depends on the duty, the given parts and the catalog."""
+    try:
+        duty = parse_duty(request.GET)
+    except ValueError:
+        return None  # The view answers 400
+    return hashlib.sha1(json.dumps([RESPONSE_VERSION, catalog_version(), duty_key(duty), *parts]).encode()).hexdigest()
+
+
+def catalog_modified(request, *args, **kwargs):
+    """The catalog version is the time of the last catalog change."""
+    return datetime.fromtimestamp(catalog_version() / 1e9, timezone.utc)
+
+
+def conditional(etag_func, **cache_control):
+    """condition() on the catalog; 304 Not Modified answers carry the Cache-Control of the full response.
+
+    Traced requests (myapp.trace) always get the full response.
+    """
+    def decorator(view):
+        conditional_view = condition(etag_func=etag_func, last_modified_func=catalog_modified)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if tracing():
+                return view(request, *args, **kwargs)
+            response = conditional_view(request, *args, **kwargs)
+            if response.status_code == 304:
+                patch_cache_control(response, **cache_control)
+            return response
+        return wrapper
+    return decorator
+
+
+def part_list_etag(request):
+    return _sizing_etag(request, 'part_list', request.GET.get('parallel_count') or '1',
+                        request.GET.get('line_type') or '', request.GET.get('component_type') or '')
+
+
+def section_etag(request, section):
+    return _sizing_etag(request, 'section', section, request.GET.get('page') or '1',
+                        request.GET.get('page_size') or str(SECTION_PAGE_SIZE))
+
+
+@server_timing
+@conditional(part_list_etag, public=True, max_age=0, must_revalidate=True)
 def part_list(request):
+    """The sizing page; it doesn't read the session, so browsers and proxies can revalidate it by ETag."""
     # Retrieve parameters from GET request
-    compressors = int(request.GET.get('compressors', 1))
-    circuits = int(request.GET.get('circuits', 1))
-    q_capacity = float(request.GET.get('q_capacity', 0))/circuits
-    T_evap = float(request.GET.get('tevap', 0))  # Evaporator temperature
-    T_cond = float(request.GET.get('tcond', 0))  # Condenser temperature
-    subcooling = float(request.GET.get('subcooling', 0))
-    superheat = float(request.GET.get('superheat', 0))
-    refrigerant = request.GET.get('refrigerant', 'R134a')
-    frequency = float(request.GET.get('frequency', 50))
+    try:
+        duty = parse_duty(request.GET)
+        parallel_count = int(request.GET.get('parallel_count') or 1)
+        if parallel_count < 1:
+            raise ValueError('parallel_count must be at least 1')
+    except ValueError as e:
+        return HttpResponseBadRequest(f'Invalid sizing parameters: {e}')
 
     # Handle added components
     added_components = []
     line_type = request.GET.get('line_type')
     component_type = request.GET.get('component_type')
-    parallel_count = int(request.GET.get('parallel_count', 1))
 
     if line_type and component_type:
         added_components.append({
@@ -31,200 +109,384 @@ def part_list(request):
             'parallel_count': parallel_count
         })
 
-    # Retrieve all compressors
-    compressors = Compressor.objects.all()
-    oil_separators_receivers = OilSeparatorReceiver.objects.all()
-    oil_separators = OilSeparator.objects.all()
-    oil_receivers = OilReceiver.objects.all()
-    suction_accumulators = SuctionAccumulator.objects.all()
-    sight_glass = SightGlass.objects.all()
-    check_valve = CheckValve.objects.all()
-    receiver = Receiver.objects.all()
-
-
-
-    # Calculate best compressor
-    # Initialize variables
-    min_difference = float('inf')
-    closest_q_compressor = None
-    best_compressor = None
-    compressors_with_q = []
-
-    # Iterate over compressors to find the best one
-    for compressor in compressors:
-         if refrigerant in compressor.refrigerants:
-            try:
-                q_compressor = compressor.calculate_q_compressor(frequency, refrigerant, T_evap, T_cond, subcooling, superheat)[0]
-
-                if q_compressor is None:
-                    continue
-
-                difference = abs(q_capacity - q_compressor)
-                if difference < min_difference:
-                    min_difference = difference
-                    closest_q_compressor = q_compressor
-                    best_compressor = compressor
-
-                compressors_with_q.append({
-                    'id': compressor.id,
-                    'name': compressor.name,
-                    'q_compressor': q_compressor
-                })
-            except Exception as e:
-                print(f"Error calculating q_compressor for compressor {compressor.id}: {e}")
+    # Only the compressor and the chosen pipes are computed here; the catalog
+    # sections and full pipe tables are loaded on demand by part_list_section.
+    # The user's sizing graph recomputes only what the edit since their last duty changed.
+    graph_id, graph = request_graph(request)
+    sizing = get_sizing(duty, graph)
+    best_compressor = sizing['compressor']
+
+    # Check valves are sized per request since parallel_count isn't part of the cached duty
+    check_valves = None
+    if sizing['operating_state'] is not None:
+        parallel_counts = {line_type: parallel_count} if component_type == 'check_valve' else {}
+        check_valves = size_check_valves(sizing['operating_state'], parallel_counts)
+
+    # The page highlights the computed best parts until the user picks something else;
+    # the user's selections are fetched by the page, so the body is the same for everyone.
+    best_components = {component_type: best['id'] if best else None for component_type, best in
+                       [('compressor', best_compressor)] +
+                       [(f'{line_type}_pipe', sizing[f'{line_type}_pipe']) for line_type in LINE_TYPES]}
+    best_pipes = [(f'{line_type}_pipe', dict(Piping.PIPE_TYPE_CHOICES)[line_type], sizing[f'{line_type}_pipe'])
+                  for line_type in LINE_TYPES]
 
+    # Prepare context
+    context = {
+        'compressors': sizing['compressors'],
+        'selected_compressor': best_compressor,
+        'closest_q_compressor': best_compressor['q_compressor'] if best_compressor else None,
+        'passed_over': sizing.get('passed_over'),
+        'best_pipes': best_pipes,
+        'coupling': sizing.get('coupling'),
+        'check_valves': check_valves,
+        'sections': PART_LIST_SECTIONS,
+        'best_components': best_components,
+        'csrf_cookie_name': settings.CSRF_COOKIE_NAME,
+    }
 
-    # Retrieve available pipes
-    available_pipes = Piping.objects.all()
-    suction_pipes_list = []
-    discharge_pipes_list = []
-    suction_pipes = Piping.objects.filter(pipe_type='suction')
-    discharge_pipes = Piping.objects.filter(pipe_type='discharge')
+    with span('render'):
+        response = render(request, 'part_list.html', context)
+    patch_cache_control(response, public=True, max_age=0, must_revalidate=True)  # Revalidate by ETag
+    response['X-Sizing-Recomputed'] = ','.join(graph.recomputed) or '-'
+    save_request_graph(request, response, graph_id, graph)
+    return response
+
+
+def _catalog_section(title, select_type, queryset, label):
+    return {'title': title, 'select_type': select_type, 'queryset': queryset, 'label': label}
+
+
+def _pipe_section(title, pipe_type):
+    return {'title': title, 'select_type': f'{pipe_type}_pipe', 'pipe_type': pipe_type}
+
+
+# Ancillary sections of the part_list page, each served by part_list_section
+PART_LIST_SECTIONS = {
+    'check_valves': _catalog_section(
+        'Check Valves', 'check_valve', lambda: CheckValve.objects.order_by('pk'),
+        lambda valve: f'{valve.checkvalve_model} ({valve.manufacturer})'),
+    'expansion_valves': _catalog_section(
+        'Expansion Valves', 'expansion_valve', lambda: ExpansionValve.objects.order_by('pk'),
+        lambda valve: valve.name),
+    'solenoid_valves': _catalog_section(
+        'Solenoid Valves', 'solenoid_valve', lambda: SolenoidValve.objects.order_by('pk'),
+        lambda valve: valve.name),
+    'oil_receivers': _catalog_section(
+        'Oil Receivers', 'oil_receiver', lambda: OilReceiver.objects.order_by('pk'),
+        lambda item: f'{item.oil_receiver_model} ({item.manufacturer})'),
+    'oil_separators': _catalog_section(
+        'Oil Separators', 'oil_separator', lambda: OilSeparator.objects.order_by('pk'),
+        lambda item: f'{item.oil_separator_model} ({item.manufacturer})'),
+    'oil_separators_receivers': _catalog_section(
+        'Oil Separators and Receivers', 'oil_separator_receiver', lambda: OilSeparatorReceiver.objects.order_by('pk'),
+        lambda item: f'{item.oil_separator_receiver_model} ({item.manufacturer})'),
+    'receivers': _catalog_section(
+        'Receivers', 'receiver', lambda: Receiver.objects.order_by('pk'),
+        lambda item: f'{item.receiver_name} ({item.manufacturer})'),
+    'suction_accumulators': _catalog_section(
+        'Suction Accumulators', 'suction_accumulator', lambda: SuctionAccumulator.objects.order_by('pk'),
+        lambda item: f'{item.accumulator_model} ({item.manufacturer})'),
+    'sight_glasses': _catalog_section(
+        'Sight Glasses', 'sight_glass', lambda: SightGlass.objects.order_by('pk'),
+        lambda item: f'{item.sightglass_model} ({item.manufacturer})'),
+    'suction_pipes': _pipe_section('Suction Pipes', 'suction'),
+    'discharge_pipes': _pipe_section('Discharge Pipes', 'discharge'),
+    'liquid_pipes': _pipe_section('Liquid Pipes', 'liquid'),
+    'condensing_pipes': _pipe_section('Condensing Pipes', 'condensing'),
+    'oil_pipes': _pipe_section('Oil Pipes', 'oil'),
+}
+
+SECTION_PAGE_SIZE = 50
+SECTION_MAX_PAGE_SIZE = 200
+SECTION_CACHE_TIMEOUT = 60 * 5  # s
+
+
+def _pipe_item(row):
+    return {
+        'id': row['id'],
+        'label': (f"Name: {row['name']} - Inner Diameter: {row['inner_diameter']} mm - "
+                  f"Outer Diameter: {row['outer_diameter']} mm - Material: {row['material']}"),
+        'details': [f"Velocity: {row['velocity']:.2f} m/s", f"Pressure Drop: {row['pressure_drop']:.2f} bar"]
+        + _coupled_details(row.get('coupled')) + _part_load_details(row.get('part_load')),
+    }
 
 
-    if best_compressor:
+def _coupled_details(coupled):
+    if coupled is None:
+        return []
+    return [f"Coupled: evaporating at {coupled['T_evap']:.2f} °C, capacity {coupled['q_compressor']:.2f} kW"
+            + ('' if coupled['converged'] else ' (not converged)')]
+
+
+def _part_load_details(verdict):
+    if verdict is None:
+        return []
+    low, high = verdict['frequencies']
+    return [f"Part load {low:g}-{high:g} Hz: velocity from {verdict['min_velocity']:.2f} m/s, "
+            f"pressure drop up to {verdict['max_pressure_drop']:.2f} bar"] + verdict['warnings']
+
+
+@server_timing
+@conditional(section_etag, public=True, max_age=SECTION_CACHE_TIMEOUT)
+def part_list_section(request, section):
+    """One page of an ancillary part_list section as JSON."""
+    spec = PART_LIST_SECTIONS.get(section)
+    if spec is None:
+        raise Http404('Unknown section')
+
+    try:
+        page_number = int(request.GET.get('page') or 1)
+        page_size = min(int(request.GET.get('page_size') or SECTION_PAGE_SIZE), SECTION_MAX_PAGE_SIZE)
+        duty = parse_duty(request.GET)
+    except ValueError as e:
+        return HttpResponseBadRequest(f'Invalid parameters: {e}')
+
+    key = f"section:{catalog_version()}:{section}:{duty_key(duty)}:{page_number}:{page_size}"
+    data = None if tracing() else cache.get(key)
+    graph = None
+    if data is None:
+        if 'pipe_type' in spec:
+            graph_id, graph = request_graph(request)
+            page = Paginator(get_pipe_table(duty, spec['pipe_type'], graph), page_size).get_page(page_number)
+            page_items = [_pipe_item(row) for row in page]
+        else:
+            # Only parts compatible with the computed operating state, best ranked first
+            inputs = compatibility_inputs(duty, get_sizing(duty)['operating_state'])
+            components = compatible_components(spec['queryset'](), spec['select_type'], inputs)
+            page = Paginator(components, page_size).get_page(page_number)
+            page_items = [{'id': item.pk, 'label': spec['label'](item), 'details': []} for item in page]
+        data = {
+            'section': section,
+            'select_type': spec['select_type'],
+            'items': page_items,
+            'page': page.number,
+            'num_pages': page.paginator.num_pages,
+            'count': page.paginator.count,
+            'has_next': page.has_next(),
+        }
+        cache.set(key, data, SECTION_CACHE_TIMEOUT)
+
+    response = JsonResponse(data)
+    patch_cache_control(response, public=True, max_age=SECTION_CACHE_TIMEOUT)
+    if graph is not None:
+        save_request_graph(request, response, graph_id, graph)
+    return response
+
+
+# Component types that can be selected on the part_list page, with the
+# catalog queryset each selected id is validated against.
+SELECTABLE_COMPONENTS = {
+    'compressor': lambda: Compressor.objects.all(),
+    'check_valve': lambda: CheckValve.objects.all(),
+    'expansion_valve': lambda: ExpansionValve.objects.all(),
+    'solenoid_valve': lambda: SolenoidValve.objects.all(),
+    'receiver': lambda: Receiver.objects.all(),
+    'oil_receiver': lambda: OilReceiver.objects.all(),
+    'oil_separator': lambda: OilSeparator.objects.all(),
+    'oil_separator_receiver': lambda: OilSeparatorReceiver.objects.all(),
+    'suction_accumulator': lambda: SuctionAccumulator.objects.all(),
+    'sight_glass': lambda: SightGlass.objects.all(),
+    'suction_pipe': lambda: Piping.objects.filter(pipe_type='suction'),
+    'discharge_pipe': lambda: Piping.objects.filter(pipe_type='discharge'),
+    'liquid_pipe': lambda: Piping.objects.filter(pipe_type='liquid'),
+    'condensing_pipe': lambda: Piping.objects.filter(pipe_type='condensing'),
+    'oil_pipe': lambda: Piping.objects.filter(pipe_type='oil'),
+}
+
+
+def get_selected_components(session):
+    """Return the selected component id for every selectable type."""
+    return {component_type: session.get(f'selected_{component_type}')
+            for component_type in SELECTABLE_COMPONENTS}
+
+
+def validate_selections(selections):
+    """Validate a list of {'type', 'id'} selections against the catalog.
+
+    Later selections of the same type replace earlier ones and an id of None
+    clears the selection. Returns the coalesced selections and a list of errors.
+    """
+    if not isinstance(selections, list):
+        return {}, ['selections must be a list']
+
+    coalesced = {}
+    errors = []
+    for selection in selections:
+        if not isinstance(selection, dict):
+            errors.append(f'Invalid selection: {selection!r}')
+            continue
+        component_type = selection.get('type')
+        component_id = selection.get('id')
+        if component_type not in SELECTABLE_COMPONENTS:
+            errors.append(f'Invalid component type: {component_type}')
+            continue
+        if component_id is None:
+            coalesced[component_type] = None
+            continue
+        try:
+            coalesced[component_type] = int(component_id)
+        except (TypeError, ValueError):
+            errors.append(f'Invalid id for {component_type}: {component_id!r}')
 
-        # Determine allowed sizes for discharge and suction connections
-        allowed_discharge_sizes = Piping.get_allowed_sizes(best_compressor.discharge_conn, standard_pipe_sizes)
-        allowed_suction_sizes = Piping.get_allowed_sizes(best_compressor.suction_conn, standard_pipe_sizes)
-        print(f"allowed discharge {allowed_discharge_sizes}")
-        print(f"allowed suction {allowed_suction_sizes}")
+    # One query per component type, however many clicks were batched
+    for component_type, component_id in coalesced.items():
+        if component_id is None:
+            continue
+        if not SELECTABLE_COMPONENTS[component_type]().filter(pk=component_id).exists():
+            errors.append(f'Unknown {component_type}: {component_id}')
 
-        # Filter available pipes for discharge based on allowed discharge sizes
-        filtered_discharge_pipes = [pipe for pipe in available_pipes if pipe.outer_diameter in allowed_discharge_sizes]
+    return coalesced, errors
 
-        # Filter available pipes for suction based on allowed suction sizes
-        filtered_suction_pipes = [pipe for pipe in available_pipes if pipe.outer_diameter in allowed_suction_sizes]
 
-        mass_flow_rate = best_compressor.calculate_q_compressor(frequency, refrigerant, T_evap, T_cond, subcooling, superheat)[2]
+def store_selections(session, selections):
+    """Store validated selections in the session."""
+    for component_type, component_id in selections.items():
+        key = f'selected_{component_type}'
+        if component_id is None:
+            session.pop(key, None)
+        else:
+            session[key] = component_id
 
-        T_discharge = best_compressor.calculate_q_compressor(frequency, refrigerant, T_evap, T_cond, subcooling, superheat
-            )[1]
 
+@never_cache
+@ensure_csrf_cookie
+def selections(request):
+    """The user's selected components; also sets the CSRF cookie the part_list page posts with."""
+    return JsonResponse({'success': True, 'selected': get_selected_components(request.session)})
 
-        # Get best pipe for discharge
-        _, _, _, discharge_pipe, velocity_discharge, pressure_drop_discharge = Piping.get_best_pipes(
-            refrigerant, T_evap, T_discharge,mass_flow_rate, 10, filtered_discharge_pipes, T_cond, superheat, subcooling)
 
-        # Get best pipe for suction
-        velocity_suction, pressure_drop_suction, suction_pipe, _, _, _ = Piping.get_best_pipes(
-             refrigerant, T_evap, T_discharge, mass_flow_rate, 10, filtered_suction_pipes, T_cond, superheat, subcooling)
+def select_component(request):
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+            selections, errors = validate_selections([{'type': data.get('type'), 'id': data.get('id')}])
+            if errors:
+                return JsonResponse({'success': False, 'message': errors[0]})
 
+            # Store selected component in session
+            store_selections(request.session, selections)
+            return JsonResponse({'success': True})
 
-        print(f"Discharge Pipe: {discharge_pipe}")
-        # print(f"Suction Pipe: {suction_pipe}")
-        print(f"discharge velocity, pressure{velocity_discharge, pressure_drop_discharge}")
-        # print(f"suction velocity, pressure{velocity_suction, pressure_drop_suction}")
+        except json.JSONDecodeError:
+            return JsonResponse({'success': False, 'message': 'Invalid JSON'})
+        except Exception as e:
+            return JsonResponse({'success': False, 'message': str(e)})
     else:
-        suction_pipe = None
-        discharge_pipe = None
+        return JsonResponse({'success': False, 'message': 'Invalid request method'})
 
-    for pipe in suction_pipes:
+def select_components(request):
+    """Store a batch of selections, e.g. {"selections": [{"type": "receiver", "id": 3}, ...]}."""
+    if request.method == 'POST':
         try:
-            velocity_suction, pressure_drop_suction, _, _ = pipe.pipe_parameters(refrigerant, T_evap, T_discharge, mass_flow_rate, 10, T_cond, superheat,subcooling, pipe.inner_diameter)
-            if pipe is None:
-                continue
-
-            suction_pipes_list.append({
-                'id': pipe.id,
-                'name': pipe.name,
-                'velocity_suction': velocity_suction,
-                'pressure_drop_suction': pressure_drop_suction,
-                'inner_diameter': pipe.inner_diameter,
-                'outer_diameter': pipe.outer_diameter,
-                'material': pipe.material
-            })
-
-        except Exception as e:
-            print(f"Error calculating pipe {pipe.id}: {e}")
+            data = json.loads(request.body)
+            selections, errors = validate_selections(data.get('selections'))
+            if errors:
+                # Reject the whole batch so the session never holds half of it
+                return JsonResponse({'success': False, 'message': 'Invalid selections', 'errors': errors})
 
-    for pipe in discharge_pipes:
-        try:
-            _, _, velocity_discharge, pressure_drop_discharge = pipe.pipe_parameters(refrigerant, T_evap, T_discharge, mass_flow_rate, 10, T_cond, superheat,subcooling, pipe.inner_diameter)
-            if pipe is None:
-                continue
-
-            discharge_pipes_list.append({
-                'id': pipe.id,
-                'name': pipe.name,
-                'velocity_discharge': velocity_discharge,
-                'pressure_drop_discharge': pressure_drop_discharge,
-                'inner_diameter': pipe.inner_diameter,
-                'outer_diameter': pipe.outer_diameter,
-                'material': pipe.material
-            })
+            store_selections(request.session, selections)
+            return JsonResponse({'success': True, 'selected': get_selected_components(request.session)})
 
+        except json.JSONDecodeError:
+            return JsonResponse({'success': False, 'message': 'Invalid JSON'})
         except Exception as e:
-            print(f"Error calculating pipe {pipe.id}: {e}")
+            return JsonResponse({'success': False, 'message': str(e)})
+    else:
+        return JsonResponse({'success': False, 'message': 'Invalid request method'})
 
+# Components sized per duty; the other selections are listed once per export
+PER_DUTY_COMPONENTS = {'compressor'} | {f'{line_type}_pipe' for line_type in LINE_TYPES}
 
-    # Retrieve all components for selection
-    check_valves = CheckValve.objects.all()
-    expansion_valves = ExpansionValve.objects.all()
-    solenoid_valves = SolenoidValve.objects.all()
-    receivers = Receiver.objects.all()
+BOM_MAX_DUTIES = 10000
 
-    # Prepare context
-    context = {
-        'discharge_pipes_list': discharge_pipes_list,
-        'suction_pipes_list': suction_pipes_list,
-        'discharge_pipes': discharge_pipes,
-        'velocity_discharge': velocity_discharge,
-        'pressure_drop_discharge': pressure_drop_discharge/100000,
-        'velocity_suction': velocity_suction,
-        'pressure_drop_suction': pressure_drop_suction/100000,
-        'check_valves': check_valves,
-        'expansion_valves': expansion_valves,
-        'solenoid_valves': solenoid_valves,
-        'receivers': receivers,
-        'compressors': compressors_with_q,
-        'selected_compressor': best_compressor,
-        'closest_q_compressor': closest_q_compressor,
-        'suction_pipe': suction_pipe,
-        'discharge_pipe': discharge_pipe,
-        'oil_separators_receivers': oil_separators_receivers,
-        'oil_separators' : oil_separators,
-        'oil_receivers': oil_receivers,
-        'suction_accumulators': suction_accumulators,
-        'sight_glass': sight_glass,
-        'check_valve': check_valve,
-        'receiver': receiver,
-        'selected_check_valve': request.session.get('selected_check_valve', None),
-        'selected_expansion_valve': request.session.get('selected_expansion_valve', None),
-        'selected_solenoid_valve': request.session.get('selected_solenoid_valve', None),
-        'selected_receiver': request.session.get('selected_receiver', None),
-        'selected_suction_pipe': request.session.get('selected_suction_pipe', None),
-        'selected_discharge_pipe': request.session.get('selected_discharge_pipe', None),
-    }
 
-    return render(request, 'part_list.html', context)
-
-def select_component(request):
+def parse_batch(request, max_duties=BOM_MAX_DUTIES):
+    """Duties of a batch export: JSON {"duties": [{...}, ...]} or CSV with part_list parameter columns."""
+    if request.content_type == 'application/json':
+        data = json.loads(request.body)
+        params_list = data.get('duties') if isinstance(data, dict) else data
+        if not isinstance(params_list, list):
+            raise ValueError('duties must be a list')
+    else:
+        params_list = list(csv.DictReader(io.StringIO(request.body.decode('utf-8-sig'))))
+    if not params_list:
+        raise ValueError('no duties given')
+    if len(params_list) > max_duties:
+        raise ValueError(f'at most {max_duties} duties can be sized at once')
+
+    duties = []
+    for number, params in enumerate(params_list, start=1):
+        if not isinstance(params, dict):
+            raise ValueError(f'duty {number} must be an object of part_list parameters')
+        try:
+            duties.append(parse_duty(params))
+        except ValueError as e:
+            raise ValueError(f'duty {number}: {e}')
+    return duties
+
+
+def export_bom(request, file_format):
+    """Bill of materials of the part_list duty (GET) or of a batch of duties (POST) as CSV or XLSX."""
+    if file_format not in ('csv', 'xlsx'):
+        raise Http404('Unknown export format')
+
+    selected_components = get_selected_components(request.session)
+    try:
+        if request.method == 'POST':
+            duties = parse_batch(request)
+            selected = {}
+        else:
+            duties = [parse_duty(request.GET)]
+            selected = selected_components
+    except ValueError as e:
+        return HttpResponseBadRequest(f'Invalid export parameters: {e}')
+
+    selected_rows = []
+    for component_type, component_id in selected_components.items():
+        if component_id is None or component_type in PER_DUTY_COMPONENTS:
+            continue
+        component = SELECTABLE_COMPONENTS[component_type]().filter(pk=component_id).first()
+        if component is not None:
+            selected_rows.append(component_row(component_type, component))
+
+    rows = itertools.chain(bom_rows(duties, selected), selected_rows)
+    filename = f'bill_of_materials.{file_format}'
+    if file_format == 'csv':
+        # The duties are sized while streaming, under a slot taken before the response starts
+        response = StreamingHttpResponse(admitted_stream(stream_csv(rows)), content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    try:
+        import openpyxl  # noqa: F401
+    except ImportError:
+        return HttpResponseBadRequest('XLSX export requires openpyxl (pip install openpyxl)')
+    # openpyxl has to finish the zip container before sending, so spool it to disk
+    file = tempfile.TemporaryFile()
+    rows = admitted_stream(rows)
+    try:
+        write_xlsx(rows, file)
+    finally:
+        rows.close()
+    file.seek(0)
+    return FileResponse(file, as_attachment=True, filename=filename)
+
+def save_to_project(request):
+    """Save a part_list duty to a project, e.g. {"project": "Plant 2", "name": "Freezer", "params": {...}}."""
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
-            component_type = data.get('type')
-            component_id = data.get('id')
-
-            # Store selected component in session
-            if component_type == 'check_valve':
-                request.session['selected_check_valve'] = component_id
-            elif component_type == 'compressor':
-                request.session['selected_compressor'] = component_id
-            elif component_type == 'expansion_valve':
-                request.session['selected_expansion_valve'] = component_id
-            elif component_type == 'solenoid_valve':
-                request.session['selected_solenoid_valve'] = component_id
-            elif component_type == 'receiver':
-                request.session['selected_receiver'] = component_id
-            elif component_type == 'suction_pipe':
-                request.session['selected_suction_pipe'] = component_id
-            elif component_type == 'discharge_pipe':
-                request.session['selected_discharge_pipe'] = component_id
-            else:
-                return JsonResponse({'success': False, 'message': 'Invalid component type'})
+            project_name = (data.get('project') or '').strip()
+            if not project_name:
+                return JsonResponse({'success': False, 'message': 'Project name is required'})
+            try:
+                duty = parse_duty(data.get('params') or {})
+            except ValueError as e:
+                return JsonResponse({'success': False, 'message': f'Invalid sizing parameters: {e}'})
 
-            return JsonResponse({'success': True})
+            project, _ = Project.objects.get_or_create(name=project_name[:100])
+            duty_point = save_duty_point(project, (data.get('name') or '')[:100], duty)
+            return JsonResponse({'success': True, 'id': duty_point.id, 'results': duty_point.results})
 
         except json.JSONDecodeError:
             return JsonResponse({'success': False, 'message': 'Invalid JSON'})
@@ -233,9 +495,178 @@ def select_component(request):
     else:
         return JsonResponse({'success': False, 'message': 'Invalid request method'})
 
+def submit_job(request):
+    """Queue a background sizing job.
+
+    POST {"kind": "batch", "duties": [{...}, ...]} (or a CSV of duties) or
+    {"kind": "sweep", "grid": {"base": {...}, "axes": {"tevap": [...], ...}}}.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Invalid request method'})
+    try:
+        kind = 'batch'
+        if request.content_type == 'application/json':
+            data = json.loads(request.body)
+            kind = data.get('kind', 'batch') if isinstance(data, dict) else 'batch'
+        if kind == 'batch':
+            items = parse_batch(request, JOB_MAX_ITEMS)
+            params = {}
+        elif kind == 'sweep':
+            grid = data.get('grid') or {}
+            items = sweep_duties(grid)
+            params = {'grid': grid}
+        else:
+            return JsonResponse({'success': False, 'message': f'Unknown job kind {kind}'})
+        job = enqueue(kind, items, params, owner=session_owner(request.session),
+                      client=request.META.get('REMOTE_ADDR', ''))
+    except RateLimited as e:
+        response = JsonResponse({'success': False, 'message': 'Too many jobs submitted, please retry later'},
+                                status=429)
+        response['Retry-After'] = e.retry_after
+        return response
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'message': 'Invalid JSON'})
+    except (ValueError, UnicodeDecodeError) as e:
+        return JsonResponse({'success': False, 'message': f'Invalid job: {e}'})
+    return JsonResponse({'success': True, 'job': job_status(job)})
+
+
+def _get_job(request, job_id):
+    """The job if the request's session submitted it; staff can reach every job."""
+    jobs = SizingJob.objects.filter(pk=job_id)
+    if not request.user.is_staff:
+        owner = request.session.get('job_owner')
+        jobs = jobs.filter(owner=owner) if owner else jobs.none()
+    job = jobs.first()
+    if job is None:
+        raise Http404('Unknown job')
+    return job
+
+
+def job_detail(request, job_id):
+    """Status and progress of a job, polled by clients."""
+    return JsonResponse({'success': True, 'job': job_status(_get_job(request, job_id))})
+
+
+def job_result(request, job_id):
+    job = _get_job(request, job_id)
+    if job.status != 'done':
+        return JsonResponse({'success': False, 'message': f'Job is {job.status}', 'job': job_status(job)})
+    return JsonResponse({'success': True, 'job': job_status(job), 'results': job_results(job)})
+
+
+def job_cancel(request, job_id):
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Invalid request method'})
+    job = _get_job(request, job_id)
+    if not cancel_job(job):
+        return JsonResponse({'success': False, 'message': f'Job is already {job.status}'})
+    job.refresh_from_db()
+    return JsonResponse({'success': True, 'job': job_status(job)})
+
+
+def job_retry(request, job_id):
+    """Queue the failed or cancelled chunks of a job again."""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Invalid request method'})
+    job = _get_job(request, job_id)
+    if not retry_job(job):
+        return JsonResponse({'success': False, 'message': f'Job is {job.status}'})
+    job.refresh_from_db()
+    return JsonResponse({'success': True, 'job': job_status(job)})
+
+@server_timing
+def compare_refrigerants(request):
+    """The part_list duty sized for several refrigerants side by side; JSON with format=json.
+
+    refrigerants is repeated or comma-separated, the comparison.COMPARISON_REFRIGERANTS by default.
+    """
+    try:
+        duty = parse_duty(request.GET)
+        refrigerants = [name.strip() for value in request.GET.getlist('refrigerants') for name in value.split(',')
+                        if name.strip()]
+        rows = compare(duty, refrigerants)
+    except ValueError as e:
+        if request.GET.get('format') == 'json':
+            return JsonResponse({'success': False, 'message': f'Invalid comparison: {e}'})
+        return HttpResponseBadRequest(f'Invalid comparison parameters: {e}')
+
+    if request.GET.get('format') == 'json':
+        return JsonResponse({'success': True, 'duty': duty, 'rows': rows})
+    with span('render'):
+        return render(request, 'compare.html', {'duty': duty, 'rows': rows})
+
+
+@server_timing
+def simulate_profile(request):
+    """Annual energy of shortlisted compressors for an ambient and load profile.
+
+    POST the profile CSV as the body or as a "profile" file upload, with the part_list parameters
+    of the design duty and optionally shortlist (comma-separated compressor ids), approach (K),
+    min_tcond (°C) and variable_speed=0.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Invalid request method'})
+    params = request.GET.copy()
+    params.update(request.POST)
+    try:
+        duty = parse_duty(params)
+        upload = request.FILES.get('profile')
+        text = (upload.read() if upload is not None else request.body).decode('utf-8-sig')
+        profile = parse_profile(text, duty['q_capacity'])
+        shortlist = [int(compressor_id) for compressor_id in (params.get('shortlist') or '').split(',')
+                     if compressor_id.strip()]
+        options = {
+            'approach': float(params.get('approach') or CONDENSER_APPROACH),
+            'min_T_cond': float(params.get('min_tcond') or MIN_T_COND),
+            'variable_speed': params.get('variable_speed') not in ('0', 'false'),
+        }
+        with admitted():
+            result = simulate(duty, profile, shortlist, **options)
+    except (ValueError, UnicodeDecodeError) as e:
+        return JsonResponse({'success': False, 'message': f'Invalid simulation: {e}'})
+    return JsonResponse({'success': True, 'duty': duty, **result})
+
+
 def input(request):
-    return render(request, 'input.html')
+    return render(request, 'input.html', {'refrigerant_groups': supported_by_family()})
+
+
+@staff_member_required
+def profiles(request):
+    """Admin page listing recent stored profiles with their most expensive functions."""
+    try:
+        top = min(int(request.GET.get('top') or 20), 200)
+        if top < 1:
+            raise ValueError('top must be at least 1')
+    except ValueError as e:
+        return HttpResponseBadRequest(f'Invalid parameters: {e}')
+    stored = recent_profiles()
+    for profile in stored:
+        profile['functions'] = top_functions(profile['id'], top)
+    context = {
+        **admin.site.each_context(request),
+        'title': 'Request profiles',
+        'profiles': stored,
+        'top': top,
+    }
+    return render(request, 'admin/profiles.html', context)
 
 
+@staff_member_required
+def project_changes(request):
+    """Admin page listing saved duty points whose last re-evaluation selected different parts."""
+    context = {
+        **admin.site.each_context(request),
+        'title': 'Changed project selections',
+        'changes': selection_changes(),
+    }
+    return render(request, 'admin/project_changes.html', context)
 
 
+@staff_member_required
+def profile_download(request, profile_id):
+    path = profile_path(profile_id)
+    if path is None:
+        raise Http404('Unknown profile')
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=path.name)
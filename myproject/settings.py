@@ -48,6 +48,9 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'myapp.profiling.ProfilingMiddleware',
+    'myapp.trace.TraceMiddleware',
+    'myapp.coalesce.AdmissionMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -73,14 +76,36 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'myproject.wsgi.application'
 
+# Keep component selections in a signed cookie so selection clicks never
+# write to the django_session table (SQLite locks the whole database on writes)
+SESSION_ENGINE = 'django.contrib.sessions.backends.signed_cookies'
+
 
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
+# DJANGO_SQLITE_PATH points a server at another copy of the catalog (used by loadtest)
 
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('DJANGO_SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+        # Sizing workers write job progress next to the web workers; wait for locks instead of failing
+        'OPTIONS': {'timeout': 20},
+    }
+}
+
+
+# Cache
+# A file based cache is read by all gunicorn workers on the box, so cached sizing results are
+# computed once for all of them. Its add() and incr() aren't atomic across processes and it culls
+# entries past MAX_ENTRIES, so nothing that must be exact across workers lives in it: admission
+# slots and single-flight locks are file locks (SIZING_LOCK_DIR), the catalog version and job
+# rate limits are kept in the database.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('DJANGO_CACHE_DIR', os.path.join(BASE_DIR, 'cache')),
     }
 }
 
@@ -123,6 +148,27 @@ STATIC_URL = '/static/'
 
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
+# Profiles recorded by myapp.profiling (?profile=1 for staff)
+
+PROFILE_DIR = os.path.join(BASE_DIR, 'profiles')
+
+# Server-Timing response headers with sizing spans and CoolProp call counts (myapp.timing)
+
+SERVER_TIMING = True
+
+# Admission control of sizing computations started by web requests (myapp.coalesce).
+# Keep SIZING_MAX_CONCURRENT below the number of gunicorn workers so cheap requests always find one.
+
+SIZING_MAX_CONCURRENT = 4  # Computations at once, across worker processes
+SIZING_QUEUE_LENGTH = 4  # Requests waiting for a slot before others get 503
+SIZING_QUEUE_TIMEOUT = 5  # s a request waits for a slot, also its Retry-After
+SIZING_LOCK_DIR = os.environ.get('DJANGO_LOCK_DIR', os.path.join(BASE_DIR, 'locks'))  # Slot and lock files
+
+# Sizing job items a client address may submit per window (myapp.jobs), further submissions get 429
+
+JOB_RATE_ITEMS = 200000
+JOB_RATE_WINDOW = 60 * 60  # s
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
@@ -20,7 +20,13 @@ from django.urls import path
 from django.contrib import admin
 from django.urls import path, include
 
+from myapp.views import profile_download, profiles, project_changes
+
 urlpatterns = [
+    # Must come before admin.site.urls, whose catch-all view would swallow them
+    path('admin/profiles/', profiles, name='admin_profiles'),
+    path('admin/profiles/<str:profile_id>.prof', profile_download, name='admin_profile_download'),
+    path('admin/projects/changes/', project_changes, name='admin_project_changes'),
     path('admin/', admin.site.urls),
     path('', include('myapp.urls')),  # Include the URLs from your app
 ]